@@ -0,0 +1,5 @@
+# Модули бота импортируются как в tg_bot/bot.py - по имени, из каталога tg_bot
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tg_bot'))
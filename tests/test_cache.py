@@ -0,0 +1,125 @@
+# ForecastCache: одно вычисление на одновременные одинаковые запросы, сброс при смене суток
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from cache import ForecastCache
+
+
+class Today:
+    def __init__(self):
+        self.day = date(2024, 1, 1)
+
+    def __call__(self):
+        return self.day
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Условие не выполнилось"
+        time.sleep(0.005)
+
+
+def test_single_flight():
+    cache = ForecastCache()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(2.0)
+        return 'value'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('key', compute)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    # Первый поток считает, остальные семь ждут его результата
+    wait_until(lambda: cache.misses + cache.hits == 8)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert calls == [1]
+    assert results == ['value'] * 8
+    assert (cache.misses, cache.hits) == (1, 7)
+
+
+def test_single_flight_error_reaches_waiters():
+    cache = ForecastCache()
+    release = threading.Event()
+    errors = []
+
+    def compute():
+        release.wait(2.0)
+        raise RuntimeError('boom')
+
+    def request():
+        try:
+            cache.get_or_compute('key', compute)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=request) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: cache.misses + cache.hits == 3)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert errors == ['boom'] * 3
+    # Ошибка не кэшируется
+    assert cache.get_or_compute('key', lambda: 'ok') == 'ok'
+
+
+def test_many_computes_only_missing():
+    cache = ForecastCache()
+    cache.get_or_compute('a', lambda: 'A')
+    requested = []
+
+    def compute_missing(keys):
+        requested.append(list(keys))
+        return [key.upper() for key in keys]
+
+    assert cache.get_or_compute_many(['a', 'b', 'c', 'b'], compute_missing) == ['A', 'B', 'C', 'B']
+    assert requested == [['b', 'c']]
+    with pytest.raises(ValueError):
+        cache.get_or_compute_many(['d', 'e'], lambda keys: ['D'])
+    # Ключи после ошибки не остаются "в работе"
+    assert cache.get_or_compute('d', lambda: 'D') == 'D'
+
+
+def test_day_rollover():
+    today = Today()
+    cache = ForecastCache(today=today)
+    cache.get_or_compute('tomorrow', lambda: 1)
+    assert cache.get_or_compute('tomorrow', lambda: 2) == 1
+    today.day += timedelta(days=1)
+    assert cache.get_or_compute('tomorrow', lambda: 2) == 2
+    assert len(cache) == 1
+
+
+def test_rollover_during_compute_keeps_new_value():
+    today = Today()
+    cache = ForecastCache(today=today)
+    cache.get_or_compute('old', lambda: 0)
+
+    def compute():
+        today.day += timedelta(days=1)
+        return 1
+
+    assert cache.get_or_compute('key', compute) == 1
+    # Записи прошлых суток сброшены, посчитанное после полуночи осталось
+    assert len(cache) == 1
+    assert cache.get_or_compute('key', lambda: 2) == 1
+
+
+def test_lru_eviction():
+    cache = ForecastCache(maxsize=2)
+    for key in 'abc':
+        cache.get_or_compute(key, lambda key=key: key)
+    assert len(cache) == 2
+    assert cache.get_or_compute('a', lambda: 'new') == 'new'
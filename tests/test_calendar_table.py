@@ -0,0 +1,14 @@
+# Таблица календаря не загружается с чужими параметрами сценариев
+import numpy as np
+
+from calendar_table import TABLE_SHAPE, CalendarTable
+
+
+def test_open_rejects_other_scenarios(tmp_path):
+    CalendarTable(np.zeros(TABLE_SHAPE, dtype=np.float32),
+                  {'scenarios': 200, 'seed': 42}).save('v1', tmp_path)
+    assert CalendarTable.open('v1', tmp_path, scenarios=200, seed=42) is not None
+    assert CalendarTable.open('v1', tmp_path) is not None
+    assert CalendarTable.open('v1', tmp_path, scenarios=500, seed=42) is None
+    assert CalendarTable.open('v1', tmp_path, scenarios=200, seed=0) is None
+    assert CalendarTable.open('v2', tmp_path, scenarios=200, seed=42) is None
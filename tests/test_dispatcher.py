@@ -0,0 +1,69 @@
+# ChatDispatcher: ограничения очередей и порядок задач внутри чата
+import threading
+import time
+
+import pytest
+
+from dispatcher import ChatDispatcher
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = ChatDispatcher(max_workers=4, max_pending=5, max_per_chat=2)
+    yield dispatcher
+    dispatcher.shutdown()
+
+
+def test_max_per_chat(dispatcher):
+    release = threading.Event()
+    assert dispatcher.submit(1, release.wait, 2.0)
+    assert dispatcher.submit(1, release.wait, 2.0)
+    # Третья задача того же чата не принимается, другой чат - принимается
+    assert not dispatcher.submit(1, release.wait, 2.0)
+    assert dispatcher.submit(2, release.wait, 2.0)
+    assert dispatcher.rejected == 1
+    release.set()
+    assert dispatcher.join(2.0)
+    assert (dispatcher.completed, dispatcher.pending) == (3, 0)
+    # Очередь чата освободилась
+    assert dispatcher.submit(1, lambda: None)
+
+
+def test_max_pending(dispatcher):
+    release = threading.Event()
+    accepted = [dispatcher.submit(chat_id, release.wait, 2.0) for chat_id in range(7)]
+    assert accepted == [True] * 5 + [False] * 2
+    assert dispatcher.rejected == 2
+    release.set()
+    assert dispatcher.join(2.0)
+    assert dispatcher.completed == 5
+
+
+def test_order_within_chat():
+    dispatcher = ChatDispatcher(max_workers=4, max_pending=100, max_per_chat=100)
+    results = {chat_id: [] for chat_id in range(3)}
+
+    def task(chat_id, index):
+        # Неравная длительность: без очереди чата задачи обгоняли бы друг друга
+        time.sleep(0.002 * ((index * 7) % 5))
+        results[chat_id].append(index)
+
+    for index in range(20):
+        for chat_id in results:
+            assert dispatcher.submit(chat_id, task, chat_id, index)
+    assert dispatcher.join(10.0)
+    dispatcher.shutdown()
+    assert all(order == list(range(20)) for order in results.values())
+
+
+def test_failing_task_does_not_block_chat(dispatcher, capsys):
+    done = threading.Event()
+
+    def fail():
+        raise RuntimeError('boom')
+
+    assert dispatcher.submit(1, fail)
+    assert dispatcher.submit(1, done.set)
+    assert done.wait(2.0)
+    assert dispatcher.join(2.0)
+    assert 'RuntimeError: boom' in capsys.readouterr().err
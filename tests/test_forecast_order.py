@@ -0,0 +1,63 @@
+# Прогноз на дату не зависит от того, какие даты и в каком порядке спрашивали раньше
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def fresh_bot(monkeypatch):
+    """Модель без таблицы календаря и генератор с фиксированным seed и пустым хранилищем прогнозов"""
+    if bot.live is None:
+        bot.reload_model()
+    monkeypatch.setattr(bot, 'live', bot.live._replace(table=None))
+
+    def reset():
+        monkeypatch.setattr(bot, 'data_gen', bot.RealisticDataGenerator(7))
+
+    reset()
+    return reset
+
+
+def dates():
+    tomorrow = datetime.now() + timedelta(days=1)
+    return tomorrow, tomorrow + timedelta(days=1)
+
+
+def forecast(*target_dates):
+    return [np.array(result[1]) for result in bot.predict_for_dates(list(target_dates))]
+
+
+def test_same_forecast_regardless_of_order(fresh_bot):
+    tomorrow, day_after = dates()
+    first_tomorrow, after_tomorrow = forecast(tomorrow)[0], forecast(day_after)[0]
+    fresh_bot()
+    alone = forecast(day_after)[0]
+    fresh_bot()
+    both = forecast(tomorrow, day_after)
+    fresh_bot()
+    reversed_order = forecast(day_after)[0], forecast(tomorrow)[0]
+
+    np.testing.assert_allclose(after_tomorrow, alone)
+    np.testing.assert_allclose(both[1], alone)
+    np.testing.assert_allclose(reversed_order[0], alone)
+    np.testing.assert_allclose(both[0], first_tomorrow)
+    np.testing.assert_allclose(reversed_order[1], first_tomorrow)
+
+
+def test_only_past_forecasts_change_lags_and_cache_key(fresh_bot):
+    tomorrow, day_after = dates()
+    before = forecast(tomorrow)[0]
+    key = bot.cache_key('forecast', tomorrow)
+
+    # Прогноз на будущую дату в лаги не идет - ключ кэша тот же
+    bot.data_gen.historical_predictions.put(day_after, np.full(24, 5.0))
+    assert bot.cache_key('forecast', tomorrow) == key
+    np.testing.assert_allclose(forecast(tomorrow)[0], before)
+
+    # Прогноз на сегодня (уже наступивший день) - лаг завтрашнего прогноза
+    bot.data_gen.historical_predictions.put(datetime.now(), np.full(24, 5.0))
+    assert bot.cache_key('forecast', tomorrow) != key
+    assert not np.allclose(forecast(tomorrow)[0], before)
@@ -0,0 +1,46 @@
+# /reload и watch_models не загружают одну и ту же смену версии дважды
+import threading
+import time
+
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def registry_state(monkeypatch):
+    """Состояние реестра подменено словарем, загрузка модели считается"""
+    if bot.live is None:
+        bot.reload_model()
+    state = {'stamp': ('v1', 1.0), 'loads': 0}
+
+    def load_model(version=None):
+        state['loads'] += 1
+        return bot.live
+
+    monkeypatch.setattr(bot, 'model_stamp', lambda: state['stamp'])
+    monkeypatch.setattr(bot, 'load_model', load_model)
+    monkeypatch.setattr(bot, 'loaded_stamp', None)
+    return state
+
+
+def wait_loads(state, expected, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while state['loads'] < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    return state['loads']
+
+
+def test_reload_then_watch_loads_once(registry_state):
+    stop = bot.watch_models(0.01, threading.Event())
+    try:
+        # /reload <версия>: activate меняет CURRENT, затем reload_model()
+        registry_state['stamp'] = ('v2', 2.0)
+        bot.reload_model()
+        assert wait_loads(registry_state, 2) == 1
+        # Смена в реестре без /reload подхватывается наблюдателем один раз
+        registry_state['stamp'] = ('v3', 3.0)
+        assert wait_loads(registry_state, 2) == 2
+    finally:
+        stop.set()
@@ -0,0 +1,76 @@
+# Корзины жетонов RateLimiter на ручных часах
+import pytest
+
+from ratelimit import RateLimiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def test_burst_then_wait(clock):
+    limiter = RateLimiter(rate=0.5, burst=3, clock=clock)
+    assert [limiter.acquire(1) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire(1) == pytest.approx(2.0)
+    assert (limiter.allowed, limiter.limited) == (3, 1)
+    # Другой чат не затронут
+    assert limiter.acquire(2) == 0.0
+
+
+def test_refill(clock):
+    limiter = RateLimiter(rate=0.5, burst=3, clock=clock)
+    for _ in range(3):
+        limiter.acquire(1)
+    clock.now = 1.0
+    assert limiter.acquire(1) == pytest.approx(1.0)
+    clock.now = 2.0
+    assert limiter.acquire(1) == 0.0
+    # Пополнение не выше burst
+    clock.now = 100.0
+    assert [limiter.acquire(1) for _ in range(4)][-1] > 0
+
+
+def test_cost_above_burst_is_capped(clock):
+    limiter = RateLimiter(rate=1.0, burst=2, clock=clock)
+    assert limiter.acquire(1, cost=5) == 0.0
+    assert limiter.acquire(1, cost=5) == pytest.approx(2.0)
+
+
+def test_should_warn_once_per_series(clock):
+    limiter = RateLimiter(rate=1.0, burst=1, clock=clock)
+    assert not limiter.should_warn(1)
+    limiter.acquire(1)
+    limiter.acquire(1)
+    assert limiter.should_warn(1)
+    assert not limiter.should_warn(1)
+    # Успешный запрос начинает новую серию
+    clock.now = 5.0
+    assert limiter.acquire(1) == 0.0
+    limiter.acquire(1)
+    assert limiter.should_warn(1)
+
+
+def test_prune_drops_only_full_buckets(clock):
+    limiter = RateLimiter(rate=1.0, burst=2, max_chats=2, clock=clock)
+    limiter.acquire('idle')
+    limiter.acquire('busy', cost=2)
+    clock.now = 1.0
+    # idle уже пополнилась, busy - еще нет
+    limiter.acquire('new')
+    assert len(limiter) == 2
+    assert limiter.acquire('busy', cost=2) > 0
+
+
+def test_unlimited(clock):
+    limiter = RateLimiter(rate=0, burst=1, clock=clock)
+    assert all(limiter.acquire(1) == 0.0 for _ in range(100))
+    assert len(limiter) == 0
@@ -0,0 +1,102 @@
+# Скользящие окна StreamingFeatureState против прямого расчета по всем часам,
+# в том числе после пропусков длиннее буфера
+import math
+
+import numpy as np
+import pytest
+
+from stream import BUFFER_HOURS, StreamingFeatureState, epoch_hour, ingest_lines
+
+START = epoch_hour('2007-01-01T00')
+
+
+def expected_window(values, last_hour, size):
+    """Значения окна для прогноза часа last_hour + 1: часы [last_hour - size, last_hour - 1]"""
+    known = [values[h] for h in range(last_hour - size, last_hour) if h in values and not math.isnan(values[h])]
+    return known
+
+
+def check_windows(state, values):
+    for window in (*state.windows.values(), state.std_window):
+        known = expected_window(values, state.last_hour, window.size)
+        assert window.count == len(known)
+        if known:
+            assert window.mean() == pytest.approx(np.mean(known), rel=1e-9, abs=1e-9)
+        else:
+            assert math.isnan(window.mean())
+        if len(known) >= 2:
+            assert window.std() == pytest.approx(np.std(known, ddof=1), rel=1e-6, abs=1e-6)
+
+
+def random_hours(rng, n):
+    """Возрастающие часы с короткими и длинными (больше буфера) пропусками"""
+    steps = rng.choice([1, 1, 1, 1, 2, 5, 30, BUFFER_HOURS, BUFFER_HOURS + 1, 400], size=n)
+    return START + np.cumsum(steps)
+
+
+def test_long_gap_push_hourly():
+    state = StreamingFeatureState([])
+    values = {}
+    hours = list(range(START, START + 200)) + list(range(START + 600, START + 620))
+    for hour in hours:
+        values[hour] = 1.0 + (hour % 24) / 10
+        state.push_hourly(np.datetime64(hour, 'h'), values[hour])
+        check_windows(state, values)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_random_gaps_push_hourly(seed):
+    rng = np.random.default_rng(seed)
+    state = StreamingFeatureState([])
+    values = {}
+    for hour in random_hours(rng, 600):
+        value = math.nan if rng.random() < 0.05 else float(rng.uniform(0.1, 4.0))
+        values[int(hour)] = value
+        state.push_hourly(np.datetime64(int(hour), 'h'), value)
+        check_windows(state, values)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_random_gaps_add_reading(seed):
+    """Поминутные показания: час закрывается, когда приходит показание следующего"""
+    rng = np.random.default_rng(seed)
+    state = StreamingFeatureState([])
+    values = {}
+    for hour in random_hours(rng, 300):
+        hour = int(hour)
+        readings = rng.uniform(0.1, 4.0, size=3)
+        values[hour] = float(readings.mean())
+        for minute, value in enumerate(readings):
+            closed = state.add_reading(np.datetime64(hour * 60 + minute * 20, 'm'), float(value))
+        if state.last_hour is not None:
+            # Открытый час в окна еще не вошел
+            check_windows(state, {h: v for h, v in values.items() if h <= state.last_hour})
+    assert closed is False
+
+
+def test_lags_ignore_stale_slots():
+    state = StreamingFeatureState([])
+    state.push_hourly(np.datetime64(START, 'h'), 2.0)
+    # Через ровно BUFFER_HOURS часов слот того же номера занят новым часом, старый не читается
+    state.push_hourly(np.datetime64(START + BUFFER_HOURS + 30, 'h'), 1.0)
+    assert math.isnan(state.value_at(START))
+    assert math.isnan(state.features['lag_week_ago_168h'])
+
+
+def test_missing_submetering_is_unknown():
+    """Пропущенные суб-счетчики - NaN в add_reading, как в push_hourly, а не нули"""
+    state = StreamingFeatureState([])
+    state.add_reading(np.datetime64(START * 60, 'm'), 1.0, 2.0)
+    state.add_reading(np.datetime64(START * 60 + 30, 'm'), 3.0)
+    state.add_reading(np.datetime64(START * 60 + 60, 'm'), 1.0)
+    assert state.value_at(START) == pytest.approx(2.0)
+    assert state.submetering[START % BUFFER_HOURS, 0] == pytest.approx(2.0)
+    assert np.isnan(state.submetering[START % BUFFER_HOURS, 1:]).all()
+
+
+def test_ingest_lines_counts_bad_rows():
+    state = StreamingFeatureState([])
+    ingest_lines(['datetime,Global_active_power', '2007-01-01 00:00:00,1.5', 'broken', '2007-01-01 00:01:00,x'],
+                 state)
+    assert state.dropped == 2
+    assert state.open_counts == [1, 0, 0, 0]
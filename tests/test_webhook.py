@@ -0,0 +1,74 @@
+# Коды ответа WebhookServer и закрытие соединения при отказе
+import json
+import socket
+
+import pytest
+
+from webhook import MAX_BODY_BYTES, SECRET_HEADER, WebhookServer
+
+SECRET = 'secret'
+
+
+class FakeBot:
+    def __init__(self):
+        self.updates = []
+
+    def process_new_updates(self, updates):
+        self.updates.extend(updates)
+
+
+@pytest.fixture
+def server():
+    server = WebhookServer(FakeBot(), port=0, path='/telegram', secret=SECRET).start()
+    yield server
+    server.stop()
+
+
+def post(server, body=b'', path='/telegram', secret=SECRET, length=None):
+    """Сырой HTTP-запрос: (код ответа, закрыл ли сервер соединение)"""
+    host, port = server._server.server_address[:2]
+    headers = [f'POST {path} HTTP/1.1', f'Host: {host}',
+               f'Content-Length: {len(body) if length is None else length}']
+    if secret is not None:
+        headers.append(f'{SECRET_HEADER}: {secret}')
+    with socket.create_connection((host, port), timeout=5) as conn:
+        conn.sendall(('\r\n'.join(headers) + '\r\n\r\n').encode() + body)
+        response = b''
+        conn.settimeout(0.5)
+        try:
+            while True:
+                chunk = conn.recv(4096)
+                if not chunk:
+                    return int(response.split()[1]), True
+                response += chunk
+        except socket.timeout:
+            return int(response.split()[1]), False
+
+
+def test_valid_update(server):
+    update = {'update_id': 1, 'message': {'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'},
+                                          'text': '/start'}}
+    assert post(server, json.dumps(update).encode()) == (200, False)
+    assert [u.update_id for u in server.bot.updates] == [1]
+    assert (server.received, server.rejected) == (1, 0)
+
+
+@pytest.mark.parametrize('kwargs, status', [
+    ({'path': '/other'}, 404),
+    ({'secret': 'wrong'}, 403),
+    ({'secret': None}, 403),
+    ({'length': MAX_BODY_BYTES + 1}, 413),
+    ({'length': -1}, 400),
+    ({'length': 'abc'}, 400),
+])
+def test_rejected_without_reading_body(server, kwargs, status):
+    # Тело не отправляется: ответ должен прийти сразу, без ожидания Content-Length байт
+    kwargs.setdefault('length', 1000)
+    assert post(server, **kwargs) == (status, True)
+    assert server.rejected == 1
+
+
+@pytest.mark.parametrize('body', [b'not json', b'[]', b'1', b'"x"', b'null'])
+def test_body_not_an_object(server, body):
+    assert post(server, body)[0] == 400
+    assert server.bot.updates == []
@@ -0,0 +1,364 @@
+# backtest.py - БЭКТЕСТ МОДЕЛИ ПО ВСЕЙ ИСТОРИИ
+#
+# Модель прогоняется по каждому часу хранилища признаков (features.py) так,
+# как выглядел бы прогноз на сутки вперед, сделанный в конце предыдущих
+# суток: лаги (от 24 ч) берутся из хранилища, скользящие средние и профиль
+# суб-счетчиков пересчитываются только по часам до начала дня прогноза
+# (как household_feature_columns в households.py). История делится на
+# отрезки дат, отрезки считаются параллельно в пуле процессов, внутри
+# отрезка - одна float32-матрица и один вызов predict на кусок.
+#
+# Результат - не прогнозы, а суммы ошибок в кубе (час × день недели × сезон):
+# из него считаются MAE/RMSE/смещение в любом срезе. Часы до конца обучающих
+# данных модели (--train-end) идут в отдельный куб in-sample, основные
+# метрики - только по часам после него. Кубы и готовые сводки лежат в
+# models/backtest_summary.json, /stats читает этот файл при запросе.
+# Повторный запуск досчитывает только часы после последнего учтенного
+# (при смене модели или --train-end - полный пересчет).
+#   python tg_bot/backtest.py --features df/features --workers 4 --train-end 2009-12-31T23
+#   python tg_bot/backtest.py --full
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import config
+from features import TARGET, feature_matrix, flag, open_feature_store, submetering_features
+from history import ROLLING_END_LAG, ROLLING_SCALE, ROLLING_WINDOWS
+from households import HOURS, window_means
+from stream import BUFFER_HOURS
+
+# Поля куба: число часов и суммы для MAE, RMSE, смещения и R²
+STAT_FIELDS = ('count', 'abs_error', 'sq_error', 'actual', 'predicted', 'actual_sq')
+SEASONS = ['зима', 'весна', 'лето', 'осень']
+WEEKDAYS = ['пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс']
+CUBE_SHAPE = (24, 7, len(SEASONS), len(STAT_FIELDS))
+
+# Строк в одном вызове predict внутри отрезка
+CHUNK_ROWS = 100_000
+# Формат сводки: сводка другого формата пересчитывается полностью
+STATE_FORMAT = 2
+# Признаки суб-счетчиков: в хранилище только доли и активность, без самих показаний
+SUBMETERING_FEATURES = list(submetering_features(0.0, 0.0, 0.0))
+
+# Модель, открытая в процессе пула (initializer)
+_worker = {}
+
+
+def model_version(model_path):
+    """Хэш файла модели - как MODEL_VERSION в боте"""
+    with open(model_path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()[:12]
+
+
+def calendar_index(timestamps):
+    """Час, день недели (пн=0) и сезон (зима=0) для массива datetime64"""
+    hours = np.asarray(timestamps, dtype='datetime64[h]').astype(np.int64)
+    hour = hours % 24
+    # 1970-01-01 - четверг
+    day_of_week = (hours // 24 + 3) % 7
+    month = np.asarray(timestamps, dtype='datetime64[M]').astype(np.int64) % 12 + 1
+    season = (month % 12) // 3
+    return hour, day_of_week, season
+
+
+def accumulate(cube, timestamps, actual, predicted):
+    """Добавляет ошибки прогноза в куб (час × день недели × сезон × поле)"""
+    hour, day_of_week, season = calendar_index(timestamps)
+    cell = (hour * 7 + day_of_week) * len(SEASONS) + season
+    actual = np.asarray(actual, dtype=np.float64)
+    error = np.asarray(predicted, dtype=np.float64) - actual
+    size = 24 * 7 * len(SEASONS)
+    weights = {'count': None, 'abs_error': np.abs(error), 'sq_error': error ** 2,
+               'actual': actual, 'predicted': actual + error, 'actual_sq': actual ** 2}
+    flat = cube.reshape(size, len(STAT_FIELDS))
+    for i, field in enumerate(STAT_FIELDS):
+        flat[:, i] += np.bincount(cell, weights=weights[field], minlength=size)
+    return cube
+
+
+def init_worker(model_path, feature_names_path):
+    from inference import InferenceEngine
+
+    _worker['engine'] = InferenceEngine.load(model_path, feature_names_path)
+
+
+def day_ahead_columns(columns, start, stop, names):
+    """Признаки строк [start, stop) хранилища, известные в конце суток перед днем прогноза.
+
+    Лаги (от 24 ч) и календарь берутся из хранилища. Скользящие средние - окна
+    [t - w - 1, t - 2] только по часам до начала дня прогноза (окно, целиком
+    попавшее в день прогноза, - NaN). Доли и активность суб-счетчиков - средний
+    профиль по часу суток за BUFFER_HOURS часов до дня прогноза.
+    """
+    timestamps = columns['datetime']
+    hours = np.asarray(timestamps[start:stop], dtype='datetime64[h]').astype(np.int64)
+    # Часовая сетка от BUFFER_HOURS до первого дня отрезка до конца последнего дня
+    base = hours[0] // HOURS * HOURS - BUFFER_HOURS
+    n_grid = (hours[-1] // HOURS + 1) * HOURS - base
+    lo = int(np.searchsorted(timestamps, np.datetime64(int(base), 'h')))
+    grid_index = np.asarray(timestamps[lo:stop], dtype='datetime64[h]').astype(np.int64) - base
+
+    def hourly(name):
+        """Среднее колонки по часам сетки (NaN - часа нет в хранилище)"""
+        values = np.asarray(columns[name][lo:stop], dtype=np.float64)
+        known = ~np.isnan(values)
+        sums = np.bincount(grid_index[known], weights=values[known], minlength=n_grid)
+        counts = np.bincount(grid_index[known], minlength=n_grid)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+    features = {name: np.asarray(columns[name][start:stop]) for name in names}
+    target_index = hours - base
+    day_start = target_index // HOURS * HOURS
+    power = hourly(TARGET)[None, :]
+    for name, window in ROLLING_WINDOWS.items():
+        if name in names:
+            ends = np.minimum(target_index - ROLLING_END_LAG, day_start - 1)
+            lengths = ends - (target_index - ROLLING_END_LAG - window + 1) + 1
+            features[name] = window_means(power, ends[None, :], lengths[None, :])[0] * ROLLING_SCALE.get(name, 1.0)
+
+    days = target_index // HOURS
+    history_days = BUFFER_HOURS // HOURS
+    for name in SUBMETERING_FEATURES:
+        if name not in names:
+            continue
+        values = hourly(name).reshape(-1, HOURS)
+        known = ~np.isnan(values)
+        # Суммы по дням нарастающим итогом: профиль дня d - дни [d - history_days, d - 1]
+        sums = np.concatenate([np.zeros((1, HOURS)), np.cumsum(np.where(known, values, 0.0), axis=0)])
+        counts = np.concatenate([np.zeros((1, HOURS)), np.cumsum(known, axis=0)])
+        hour = target_index % HOURS
+        count = counts[days, hour] - counts[days - history_days, hour]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            profile = np.where(count > 0, (sums[days, hour] - sums[days - history_days, hour]) / count, np.nan)
+        # Активность - хотя бы в один из дней профиля, как доля > 0 у среднего профиля в households.py
+        features[name] = flag(profile > 0) if name.endswith('_active') else profile
+    return features
+
+
+def score_range(features_dir, start, stop, train_end=None):
+    """Задача пула: прогноз строк [start, stop) хранилища и кубы ошибок вне и внутри обучения"""
+    engine = _worker['engine']
+    columns = open_feature_store(features_dir)
+    names = engine.feature_names
+    train_end = None if train_end is None else np.datetime64(train_end)
+    cube = np.zeros(CUBE_SHAPE)
+    cube_in_sample = np.zeros(CUBE_SHAPE)
+    scored = 0
+    for chunk_start in range(start, stop, CHUNK_ROWS):
+        chunk_stop = min(chunk_start + CHUNK_ROWS, stop)
+        rows = slice(chunk_start, chunk_stop)
+        matrix = feature_matrix(day_ahead_columns(columns, chunk_start, chunk_stop, names), names)
+        actual = np.asarray(columns[TARGET][rows], dtype=np.float64)
+        # Пропуски в окнах и профиле (нет истории перед днем прогноза) модель обрабатывает сама
+        valid = ~np.isnan(actual)
+        if not valid.any():
+            continue
+        predicted = engine.predict(np.ascontiguousarray(matrix[valid]))
+        timestamps = np.asarray(columns['datetime'][rows])[valid]
+        in_sample = timestamps <= train_end if train_end is not None else np.zeros(len(timestamps), dtype=bool)
+        accumulate(cube, timestamps[~in_sample], actual[valid][~in_sample], predicted[~in_sample])
+        accumulate(cube_in_sample, timestamps[in_sample], actual[valid][in_sample], predicted[in_sample])
+        scored += int(valid.sum())
+    return cube, cube_in_sample, scored
+
+
+def split_ranges(timestamps, start, stop, parts):
+    """Делит строки [start, stop) на отрезки примерно равной длины по границам суток"""
+    if stop <= start:
+        return []
+    bounds = np.linspace(start, stop, parts + 1).astype(np.int64)
+    days = np.asarray(timestamps, dtype='datetime64[D]')
+    # Граница отрезка сдвигается на начало суток, чтобы день не делился между процессами
+    bounds[1:-1] = np.searchsorted(days, days[bounds[1:-1]])
+    bounds = np.unique(bounds)
+    return [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo]
+
+
+def slice_stats(cube, axes):
+    """Метрики по срезу: axes - оси куба, которые суммируются"""
+    sums = cube.sum(axis=axes)
+    count = sums[..., 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats = {
+            'count': count,
+            'MAE': sums[..., 1] / count,
+            'RMSE': np.sqrt(sums[..., 2] / count),
+            'actual': sums[..., 3] / count,
+            'predicted': sums[..., 4] / count,
+        }
+    return [{key: (None if np.isnan(value[i]) else round(float(value[i]), 4)) for key, value in stats.items()}
+            for i in range(len(count))]
+
+
+def hours_stats(cube, hours):
+    """MAE и средние факт/прогноз по набору часов суток (например, ночь 0-5)"""
+    return slice_stats(cube[list(hours)].sum(axis=0, keepdims=True), (1, 2))[0]
+
+
+def summarize(cube):
+    """Сводка для /stats: общие метрики и срезы по часам, дням недели и сезонам"""
+    total = cube.sum(axis=(0, 1, 2))
+    count, abs_error, sq_error, actual, predicted, actual_sq = total
+    if count == 0:
+        return {'count': 0}
+    variance = actual_sq - actual ** 2 / count
+    return {
+        'count': int(count),
+        'MAE': float(abs_error / count),
+        'RMSE': float(np.sqrt(sq_error / count)),
+        'R2': float(1 - sq_error / variance) if variance > 0 else None,
+        'bias': float((predicted - actual) / count),
+        'by_hour': slice_stats(cube, (1, 2)),
+        'by_weekday': slice_stats(cube, (0, 2)),
+        'by_season': slice_stats(cube, (0, 1)),
+    }
+
+
+def load_summary(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_summary(path, state):
+    """Атомарная запись: /stats не прочитает файл наполовину"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def run_backtest(features_dir, model_path, feature_names_path, summary_path,
+                 workers=1, parts_per_worker=4, full=False, train_end=None):
+    """Досчитывает бэктест по новым строкам хранилища (или весь при full/смене модели).
+
+    train_end - последний момент обучающих данных модели: часы до него
+    включительно считаются в отдельный куб in-sample.
+    """
+    version = model_version(model_path)
+
+    columns = open_feature_store(features_dir)
+    timestamps = columns['datetime']
+    previous = None if full else load_summary(summary_path)
+    if previous is not None and previous.get('model_version') != version:
+        print(f"🔄 Модель изменилась ({previous.get('model_version')} -> {version}): полный пересчет")
+        previous = None
+    if previous is not None and (previous.get('format') != STATE_FORMAT or previous.get('train_end') != train_end):
+        print(f"🔄 Изменились формат сводки или конец обучения ({previous.get('train_end')} -> {train_end}): "
+              f"полный пересчет")
+        previous = None
+
+    cube = np.asarray(previous['cube']) if previous else np.zeros(CUBE_SHAPE)
+    cube_in_sample = np.asarray(previous['cube_in_sample']) if previous else np.zeros(CUBE_SHAPE)
+    start = 0
+    if previous and previous.get('last_timestamp'):
+        start = int(np.searchsorted(timestamps, np.datetime64(previous['last_timestamp']), side='right'))
+    stop = len(timestamps)
+
+    ranges = split_ranges(timestamps, start, stop, max(1, workers * parts_per_worker))
+    scored = 0
+    if ranges:
+        import multiprocessing
+
+        # spawn: процессы не наследуют OpenMP-состояние LightGBM из родителя
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=init_worker, initargs=(model_path, feature_names_path)) as pool:
+            futures = [pool.submit(score_range, features_dir, lo, hi, train_end) for lo, hi in ranges]
+            for future in futures:
+                part, part_in_sample, n = future.result()
+                cube += part
+                cube_in_sample += part_in_sample
+                scored += n
+
+    state = {
+        'format': STATE_FORMAT,
+        'model_version': version,
+        'train_end': train_end,
+        'updated': np.datetime64('now', 's').astype(str),
+        'first_timestamp': previous['first_timestamp'] if previous else (str(timestamps[0]) if stop else None),
+        'last_timestamp': str(timestamps[stop - 1]) if stop else None,
+        'fields': list(STAT_FIELDS),
+        'cube': np.round(cube, 6).tolist(),
+        'summary': summarize(cube),
+        'cube_in_sample': np.round(cube_in_sample, 6).tolist(),
+        'summary_in_sample': summarize(cube_in_sample),
+    }
+    save_summary(summary_path, state)
+    return state, scored
+
+
+def format_period(state):
+    """Какие часы вне обучения, а какие - на обучающих данных модели"""
+    if state['train_end'] is None:
+        return "⚠️ Конец обучающих данных не задан (--train-end): часы обучающей выборки не отделены"
+    in_sample = state['summary_in_sample']
+    text = f"Обучение до {state['train_end']}: вне обучения {state['summary']['count']} часов"
+    if in_sample['count']:
+        text += f", in-sample {in_sample['count']} часов (MAE {in_sample['MAE']:.4f} кВт)"
+    return text
+
+
+def format_report(summary):
+    lines = [f"Часов: {summary['count']}, MAE {summary['MAE']:.4f} кВт, RMSE {summary['RMSE']:.4f} кВт, "
+             f"R² {summary['R2'] if summary['R2'] is None else round(summary['R2'], 4)}, "
+             f"смещение {summary['bias']:+.4f} кВт"]
+    for title, labels, rows in (('Час', [f'{h:02d}' for h in range(24)], summary['by_hour']),
+                                ('День', WEEKDAYS, summary['by_weekday']),
+                                ('Сезон', SEASONS, summary['by_season'])):
+        lines.append(f"\n{title:<6} {'часов':>7} {'MAE':>8} {'RMSE':>8} {'факт':>7} {'прогноз':>8}")
+        for label, row in zip(labels, rows):
+            if row['count']:
+                lines.append(f"{label:<6} {row['count']:7.0f} {row['MAE']:8.4f} {row['RMSE']:8.4f} "
+                             f"{row['actual']:7.3f} {row['predicted']:8.3f}")
+    return '\n'.join(lines)
+
+
+def default_train_end(features_dir):
+    """Конец матрицы последнего обучения (train.py) на этом же хранилище или None"""
+    from train import TRAIN_CACHE_DIR
+
+    meta_path = os.path.join(TRAIN_CACHE_DIR, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta['signature']['features_dir'] != os.path.abspath(features_dir):
+        return None
+    return meta.get('end')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Бэктест модели по истории с разбивкой ошибок')
+    parser.add_argument('--features', default=os.path.join(config.BASE_DIR, 'df', 'features'))
+    parser.add_argument('--model', default=config.MODEL_PATHS['lightgbm'])
+    parser.add_argument('--feature-names', default=config.FEATURE_NAMES_PATH)
+    parser.add_argument('--output', default=config.BACKTEST_SUMMARY_PATH)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--full', action='store_true', help='Пересчитать всю историю')
+    parser.add_argument('--train-end', default=None,
+                        help='Последний час обучающих данных модели (по умолчанию - конец матрицы train.py)')
+    args = parser.parse_args()
+
+    train_end = args.train_end or default_train_end(args.features)
+    if train_end is not None:
+        train_end = str(np.datetime64(train_end, 's'))
+    started = time.perf_counter()
+    state, scored = run_backtest(args.features, args.model, args.feature_names, args.output,
+                                 workers=args.workers, full=args.full, train_end=train_end)
+    print(f"✅ Новых часов учтено: {scored} за {time.perf_counter() - started:.1f} с "
+          f"(история {state['first_timestamp']} - {state['last_timestamp']})")
+    print(format_period(state))
+    if state['summary']['count']:
+        print(format_report(state['summary']))
+    if state['summary_in_sample']['count']:
+        print(f"\nIn-sample (до {state['train_end']}):")
+        print(format_report(state['summary_in_sample']))
+    print(f"💾 Сводка: {args.output}")
@@ -0,0 +1,252 @@
+# benchmark.py - БЕНЧМАРК ПУТИ ЗАПРОСА ПРОГНОЗА
+#
+# Работает без интернета: запросы telebot уходят на локальную заглушку Bot API
+# (fake_telegram.py). Замеряет каждый этап (признаки, model.predict,
+# predict_for_date, графики), полный handle_callback для каждой кнопки и
+# пропускную способность при N одновременных чатах. Результаты дописываются
+# в benchmarks/results.jsonl и сравниваются с предыдущим запуском.
+# --webhook - то же нажатия целиком: заглушка шлет их на webhook бота, ответы
+# идут обратно через общий пул соединений (webhook.py).
+#   python tg_bot/benchmark.py --repeat 50 --chats 8 --requests 96 --webhook
+import argparse
+import json
+import os
+import resource
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import config
+from fake_telegram import FakeTelegramServer
+
+RESULTS_PATH = os.path.join(config.BASE_DIR, 'benchmarks', 'results.jsonl')
+CALLBACKS = ['predict_tomorrow', 'predict_day_after', 'compare_both', 'bands_tomorrow']
+
+# Рост p50 больше чем на 20% относительно прошлого запуска считается регрессией
+REGRESSION_THRESHOLD = 0.2
+
+
+def summarize(seconds):
+    """Перцентили задержки в миллисекундах"""
+    ms = np.asarray(seconds) * 1000
+    return {'n': len(ms), 'mean_ms': float(ms.mean()),
+            'p50_ms': float(np.percentile(ms, 50)),
+            'p95_ms': float(np.percentile(ms, 95)),
+            'p99_ms': float(np.percentile(ms, 99))}
+
+
+def time_calls(fn, repeat, setup=None):
+    """Время каждого из repeat вызовов fn(); setup() перед вызовом не учитывается"""
+    samples = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def make_callback(chat_id, data, query_id):
+    """Нажатие кнопки в том виде, в каком его присылает Telegram"""
+    from telebot.types import CallbackQuery
+
+    return CallbackQuery.de_json({
+        'id': str(query_id), 'chat_instance': str(chat_id), 'data': data,
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'bench'},
+        'message': {'message_id': 1, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}},
+    })
+
+
+def clear_caches(bot):
+    bot.forecast_cache.clear()
+    bot.chart_cache.clear()
+
+
+def run_stages(bot, repeat):
+    """Задержка отдельных этапов и полного обработчика кнопки"""
+    target = datetime.now() + timedelta(days=1)
+    day_after = target + timedelta(days=1)
+    matrix_day = bot.create_features_batch([target])
+    hours, predictions, _, _ = bot.predict_for_date(target)
+
+    stages = {
+        'create_realistic_features': lambda: bot.create_realistic_features(12, target.weekday(), target.month, target),
+        'create_features_batch': lambda: bot.create_features_batch([target]),
+        'model.predict (1 строка)': lambda: bot.live.engine.predict(matrix_day[:1]),
+        'model.predict (24 строки)': lambda: bot.live.engine.predict(matrix_day),
+        'predict_for_date': lambda: bot.predict_for_date(target),
+        'predict_scenarios': lambda: bot.predict_scenarios([target]),
+        'create_single_plot': lambda: bot.create_single_plot(hours, predictions, '01.01.2000', 'понедельник'),
+        'create_comparison_plot': lambda: bot.create_comparison_plot(hours, predictions, predictions,
+                                                                     target.strftime('%d.%m'),
+                                                                     day_after.strftime('%d.%m')),
+    }
+    results = {name: summarize(time_calls(fn, repeat)) for name, fn in stages.items()}
+
+    # Полный путь кнопки (синхронно, без очереди): холодный кэш и готовый кэш
+    handler = bot.handle_callback.__wrapped__
+    for data in CALLBACKS:
+        call = make_callback(1, data, 0)
+        results[f'handle_callback:{data}'] = summarize(
+            time_calls(lambda: handler(call), repeat, setup=lambda: clear_caches(bot)))
+        results[f'handle_callback:{data} (кэш)'] = summarize(time_calls(lambda: handler(call), repeat))
+    return results
+
+
+def run_concurrency(bot, chats, requests):
+    """Нажатия из chats чатов одновременно через пул бота: пропускная способность и задержка"""
+    clear_caches(bot)
+    handler = bot.handle_callback.__wrapped__
+    latencies = []
+    rejected = 0
+
+    def timed(call, submitted):
+        handler(call)
+        latencies.append(time.perf_counter() - submitted)
+
+    start = time.perf_counter()
+    for i in range(requests):
+        call = make_callback(1000 + i % chats, CALLBACKS[i % len(CALLBACKS)], i)
+        if not bot.dispatcher.submit(call.message.chat.id, timed, call, time.perf_counter()):
+            rejected += 1
+    bot.dispatcher.join()
+    elapsed = time.perf_counter() - start
+
+    return {'chats': chats, 'requests': requests, 'workers': bot.dispatcher.max_workers,
+            'completed': len(latencies), 'rejected': rejected,
+            'throughput_rps': len(latencies) / elapsed, 'latency': summarize(latencies or [0.0])}
+
+
+def run_webhook(bot, server, chats, requests, connections=4):
+    """Нажатия через webhook: прием HTTP, разбор, очередь, обработка и ответы через пул соединений"""
+    from webhook import WebhookServer, install_session
+
+    clear_caches(bot)
+    install_session(bot.dispatcher.max_workers + 2)
+    webhook = WebhookServer(bot.bot, port=0, path='/bench').start()
+    updates = [{'update_id': i, 'callback_query': {
+        'id': str(i), 'chat_instance': str(1000 + i % chats), 'data': CALLBACKS[i % len(CALLBACKS)],
+        'from': {'id': 1000 + i % chats, 'is_bot': False, 'first_name': 'bench'},
+        'message': {'message_id': 1, 'date': 0, 'chat': {'id': 1000 + i % chats, 'type': 'private'}},
+    }} for i in range(requests)]
+    opened = server.connections
+    try:
+        start = time.perf_counter()
+        statuses = server.deliver(webhook.url, updates, connections=connections)
+        bot.dispatcher.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        webhook.stop()
+    return {'chats': chats, 'requests': requests, 'accepted': statuses.count(200),
+            'throughput_rps': requests / elapsed, 'api_connections': server.connections - opened}
+
+
+def peak_rss_mb():
+    """Пиковый объем памяти процесса (на Linux ru_maxrss в КБ)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=config.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous(path):
+    """Последний сохраненный результат (None, если запусков еще не было)"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = [line for line in f if line.strip()]
+    return json.loads(lines[-1]) if lines else None
+
+
+def save_result(path, result):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+
+def format_report(result, previous=None):
+    lines = [f"{'Этап':45s} {'p50':>9s} {'p95':>9s} {'p99':>9s}  (мс)"]
+    old_stages = (previous or {}).get('stages', {})
+    for name, stats in result['stages'].items():
+        line = f"{name:45s} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f}"
+        old = old_stages.get(name)
+        if old and old['p50_ms'] > 0:
+            change = stats['p50_ms'] / old['p50_ms'] - 1
+            line += f"  {change:+.0%}" + ('  ⚠️ регрессия' if change > REGRESSION_THRESHOLD else '')
+        lines.append(line)
+
+    load = result['concurrency']
+    lines.append(f"\n{load['chats']} чатов, {load['requests']} нажатий, {load['workers']} потоков: "
+                 f"{load['throughput_rps']:.1f} запросов/с, отклонено {load['rejected']}, "
+                 f"p50 {load['latency']['p50_ms']:.1f} мс, p99 {load['latency']['p99_ms']:.1f} мс")
+    webhook = result.get('webhook')
+    if webhook:
+        lines.append(f"Webhook: {webhook['requests']} обновлений, принято {webhook['accepted']}, "
+                     f"{webhook['throughput_rps']:.1f} обновлений/с, "
+                     f"соединений с Bot API: {webhook['api_connections']}")
+    lines.append(f"Пиковая память: {result['peak_rss_mb']:.0f} МБ")
+    if previous:
+        lines.append(f"Сравнение с запуском {previous.get('time')} ({previous.get('revision')})")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк пути запроса прогноза с заглушкой Telegram')
+    parser.add_argument('--repeat', type=int, default=30, help='Повторов на каждый этап')
+    parser.add_argument('--chats', type=int, default=8, help='Одновременных чатов')
+    parser.add_argument('--requests', type=int, default=96, help='Нажатий в тесте нагрузки')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Имитация задержки Telegram API')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=RESULTS_PATH)
+    parser.add_argument('--webhook', action='store_true', help='Нагрузка через webhook и общий пул соединений')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    server = FakeTelegramServer(latency=args.latency_ms / 1000).start().install()
+    try:
+        import bot
+
+        bot.bot.token = 'bench:token'
+        bot.data_gen.rng = np.random.default_rng(args.seed)
+        bot.warm_up()
+        stages = run_stages(bot, args.repeat)
+        # Очередь не должна отклонять нажатия теста нагрузки
+        bot.dispatcher.max_pending = max(bot.dispatcher.max_pending, args.requests)
+        bot.dispatcher.max_per_chat = max(bot.dispatcher.max_per_chat, args.requests)
+        concurrency = run_concurrency(bot, args.chats, args.requests)
+        webhook = None
+        if args.webhook:
+            # Ограничение частоты здесь мешало бы замеру: чаты теста жмут кнопки подряд
+            bot.rate_limiter.rate = 0
+            webhook = run_webhook(bot, server, args.chats, args.requests)
+        bot.dispatcher.shutdown()
+    finally:
+        server.stop()
+
+    result = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'args': {key: value for key, value in vars(args).items() if key not in ('output', 'no_save')},
+        'stages': stages,
+        'concurrency': concurrency,
+        'webhook': webhook,
+        'peak_rss_mb': peak_rss_mb(),
+        'telegram_calls': server.methods(),
+    }
+    previous = load_previous(args.output)
+    print(format_report(result, previous))
+    if not args.no_save:
+        save_result(args.output, result)
+        print(f"💾 Результаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
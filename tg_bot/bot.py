@@ -1,32 +1,80 @@
 # bot.py - ВЕРСИЯ С КНОПКАМИ ДЛЯ СРАВНЕНИЯ
+#
+# Импорт модуля не загружает модель: это делает startup() (пути из config.py),
+# затем прогрев и отчет о времени запуска. Тяжелые библиотеки (pandas,
+# matplotlib, lightgbm) импортируются там, где они впервые нужны.
+from startup import StartupTimer
+startup_timer = StartupTimer()
+
 import telebot
-import pandas as pd
-import joblib
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import io
-import json
+import time
+import functools
+import threading
+from collections import namedtuple
 from datetime import datetime, timedelta
 import os
-from dotenv import load_dotenv
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
-
-# Загружаем токен
-load_dotenv()
-BOT_TOKEN = os.getenv('BOT_TOKEN')
-bot = telebot.TeleBot(BOT_TOKEN)
-
-# Загружаем модель и признаки
-try:
-    model = joblib.load('models/lightgbm_best_model.pkl')
-    with open('models/feature_names.json', 'r', encoding='utf-8') as f:
-        FEATURE_NAMES = json.load(f)
-    print(f"✅ Модель загружена. Ожидает {len(FEATURE_NAMES)} признаков")
-except Exception as e:
-    print(f"❌ Ошибка загрузки модели: {e}")
-    exit(1)
+from telebot.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+import config
+from cache import ForecastCache
+from charts import ChartRenderer
+from inference import InferenceEngine
+from registry import ModelRegistry, file_version, score_side_by_side
+from dispatcher import ChatDispatcher
+from ratelimit import RateLimiter
+from metrics import MetricsRegistry
+from history import LAG_HOURS, HistoryStore
+from forecast_store import ForecastStore
+from features import LAG_INTERACTION_BASES, calendar_features, feature_matrix, lag_interactions, selected
+from backtest import SEASONS, STATE_FORMAT, WEEKDAYS, hours_stats, load_summary
+from calendar_table import CalendarTable
+from households import format_summary, forecast_csv, load_windows, score_households
+from webhook import WebhookServer, install_session
+
+# Обработчики вызываются прямо в потоке опроса (по порядку обновлений) и только
+# ставят задачу в очередь чата; тяжелая работа идет в пуле dispatcher.
+# Токен проверяется в config.check_config() при запуске
+bot = telebot.TeleBot(config.BOT_TOKEN or '', threaded=False, validate_token=False)
+
+# Метрики: этапы обработки (feature_build, predict, render, send) по обработчикам
+metrics = MetricsRegistry()
+metrics.describe('bot_stage_seconds', 'Время этапа обработки запроса')
+metrics.describe('bot_requests_total', 'Принятые запросы по обработчикам')
+metrics.describe('bot_rejected_total', 'Запросы, отклоненные из-за переполненной очереди')
+metrics.describe('bot_rate_limited_total', 'Запросы сверх ограничения частоты чата')
+metrics.describe('bot_queue_wait_seconds', 'Время ожидания в очереди чата')
+metrics.describe('bot_model_reloads_total', 'Загрузки модели (запуск и горячая замена)')
+metrics.describe('bot_households_scored_total', 'Домохозяйства в пакетных прогнозах по загруженным файлам')
+
+def timed_api(method):
+    """Вызов Bot API как этап send"""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        metrics.inc('bot_telegram_calls_total', method=method.__name__)
+        with metrics.timer('send'):
+            return method(*args, **kwargs)
+    return wrapper
+
+for api_method in ('send_message', 'send_photo', 'send_document', 'answer_callback_query'):
+    setattr(bot, api_method, timed_api(getattr(bot, api_method)))
+
+# Живая модель: движок прогноза, его признаки, версия и таблица календарных прогнозов
+# (None, если для версии ее не строили) одной ссылкой. reload_model() подменяет ее
+# целиком, поэтому запрос не смешает модель одной версии с признаками или таблицей другой
+LiveModel = namedtuple('LiveModel', 'engine feature_names version table')
+live = None
+registry = ModelRegistry()
+_reload_lock = threading.Lock()
+# Состояние реестра (активная версия, время записи CURRENT), с которым загружена живая модель:
+# watch_models сравнивает с ним, поэтому смену после /reload не перезагружает второй раз
+loaded_stamp = None
+
+def model_stamp():
+    return registry.current(), registry.current_mtime()
+
+# История заполняется в load_resources()
+history_store = None
 
 # ⚡ РЕАЛЬНЫЕ ДАННЫЕ ИЗ ВАШЕГО EDA АНАЛИЗА ⚡
 REAL_HOURLY_AVERAGES = {
@@ -48,288 +96,387 @@ SEASONAL_FACTORS = {
 # ДНЕВНЫЕ КОЭФФИЦИЕНТЫ ИЗ EDA
 WEEKEND_FACTOR = 1.366  # Выходные +36.6%
 
+# Те же таблицы в виде массивов - для векторных расчетов по всем часам сразу
+HOURLY_AVERAGES = np.array([REAL_HOURLY_AVERAGES[h] for h in range(24)])
+# Разброс синтетического лага вокруг среднего часа из EDA (±доля)
+LAG_SPREAD = {'lag_same_day_24h': 0.08, 'lag_week_ago_168h': 0.15, 'lag_48h_ago': 0.10,
+              'lag_72h_ago': 0.12, 'lag_96h_ago': 0.15}
+MONTH_SEASONAL_FACTORS = np.array([0.0] + [
+    SEASONAL_FACTORS['winter'] if m in [12, 1, 2] else
+    SEASONAL_FACTORS['spring'] if m in [3, 4, 5] else
+    SEASONAL_FACTORS['summer'] if m in [6, 7, 8] else
+    SEASONAL_FACTORS['autumn']
+    for m in range(1, 13)
+])
+
+def forecast_cutoff():
+    """Прогнозы бота идут в лаги только для дней раньше завтрашнего (уже наступивших).
+    
+    Поэтому прогноз на любую будущую дату видит одно и то же содержимое хранилища
+    и не зависит от того, какие даты и в каком порядке спрашивали раньше.
+    """
+    return np.datetime64(datetime.now().date(), 'D') + 1
+
 class RealisticDataGenerator:
-    def __init__(self):
-        self.historical_predictions = {}
+    def __init__(self, seed=None, history=None, forecasts=None):
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.history = history
+        # Выданные прогнозы: float32 по дням, ограничено по памяти (см. forecast_store.py)
+        self.historical_predictions = forecasts if forecasts is not None else ForecastStore.in_memory(
+            config.FORECAST_STORE_MAX_BYTES)
         
+    def for_date(self, target_date):
+        """Генератор со своим seed для даты: с фиксированным seed входы даты не зависят от других дат"""
+        if self.seed is None:
+            return self
+        return RealisticDataGenerator([*np.atleast_1d(self.seed), target_date.toordinal()],
+                                      self.history, self.historical_predictions)
+    
     def get_seasonal_factor(self, month):
-        """Возвращает сезонный коэффициент на основе реальных данных EDA"""
-        if month in [12, 1, 2]:  # Зима
-            return SEASONAL_FACTORS['winter']
-        elif month in [3, 4, 5]:  # Весна
-            return SEASONAL_FACTORS['spring'] 
-        elif month in [6, 7, 8]:  # Лето
-            return SEASONAL_FACTORS['summer']
-        else:  # Осень
-            return SEASONAL_FACTORS['autumn']
+        """Возвращает сезонный коэффициент на основе реальных данных EDA (месяц или массив месяцев)"""
+        return MONTH_SEASONAL_FACTORS[month]
     
     def get_day_factor(self, day_of_week):
-        """Коэффициент дня недели из EDA"""
-        return WEEKEND_FACTOR if day_of_week >= 5 else 1.0
+        """Коэффициент дня недели из EDA (день или массив дней)"""
+        return np.where(np.asarray(day_of_week) >= 5, WEEKEND_FACTOR, 1.0)
     
-    def generate_realistic_base_consumption(self, hour, day_of_week, month):
-        """Генерирует реалистичное базовое потребление на основе реальных данных EDA"""
+    def generate_realistic_base_consumption(self, hours, days_of_week, months):
+        """Генерирует реалистичное базовое потребление для массива часов"""
         # Базовое значение из реальных данных
-        base = REAL_HOURLY_AVERAGES[hour]
-        
-        # Применяем сезонные поправки
-        seasonal_factor = self.get_seasonal_factor(month)
-        
-        # Поправка на день недели
-        day_factor = self.get_day_factor(day_of_week)
+        base = HOURLY_AVERAGES[hours]
         
         # Небольшие случайные колебания (±3%) как в реальных данных
-        random_variation = np.random.normal(0, 0.02)
+        random_variation = self.rng.normal(0, 0.02, size=len(hours))
         
-        consumption = base * seasonal_factor * day_factor * (1 + random_variation)
+        consumption = (base * self.get_seasonal_factor(months) *
+                       self.get_day_factor(days_of_week) * (1 + random_variation))
         
-        return max(0.1, min(4.0, consumption))
+        return np.clip(consumption, 0.1, 4.0)
     
-    def get_realistic_lags(self, current_hour, current_consumption, target_date):
-        """Генерирует РЕАЛИСТИЧНЫЕ лаги на основе суточных паттернов"""
-        date_str = target_date.strftime('%Y-%m-%d')
+    def with_history(self, synthetic, real):
+        """Подставляет настоящие значения из истории там, где они есть"""
+        return {name: np.where(np.isnan(real[name]), values, real[name]) if name in real else values
+                for name, values in synthetic.items()}
+    
+    def get_realistic_lags(self, hours, days_of_week, timestamps=None, names=None):
+        """Лаги для массива часов: из истории, а где ее нет - на основе суточных паттернов EDA"""
+        n = len(hours)
+        names = None if names is None else set(names)
+        # Базовые лаги - запрошенные и те, на которых построены запрошенные взаимодействия
+        wanted = {name: lag for name, lag in LAG_HOURS.items()
+                  if names is None or name in names
+                  or any(base == name and interaction in names for interaction, base in LAG_INTERACTION_BASES.items())}
         
         # Используем реальные средние значения из EDA с небольшими вариациями
         # СООТВЕТСТВУЕМ ИМЕНАМ ПРИЗНАКОВ ИЗ feature_names.json
-        lag_24h = REAL_HOURLY_AVERAGES[current_hour] * np.random.uniform(0.92, 1.08)
-        lag_168h = REAL_HOURLY_AVERAGES[current_hour] * np.random.uniform(0.85, 1.15)
-        lag_48h = REAL_HOURLY_AVERAGES[(current_hour - 48) % 24] * np.random.uniform(0.90, 1.10)
-        lag_72h = REAL_HOURLY_AVERAGES[(current_hour - 72) % 24] * np.random.uniform(0.88, 1.12)
-        lag_96h = REAL_HOURLY_AVERAGES[(current_hour - 96) % 24] * np.random.uniform(0.85, 1.15)
-        
-        # Базовые лаги
-        lags = {
-            'lag_same_day_24h': max(0.1, lag_24h),
-            'lag_week_ago_168h': max(0.1, lag_168h),
-            'lag_48h_ago': max(0.1, lag_48h),
-            'lag_72h_ago': max(0.1, lag_72h),
-            'lag_96h_ago': max(0.1, lag_96h)
-        }
+        lags = {}
+        for name, lag in wanted.items():
+            spread = LAG_SPREAD[name]
+            lags[name] = np.maximum(0.1, HOURLY_AVERAGES[(hours - lag) % 24] * self.rng.uniform(1 - spread, 1 + spread, n))
+        
+        # Прошлые прогнозы бота заменяют шаблон EDA, настоящая история - и то и другое
+        if timestamps is not None and lags:
+            lags = self.with_history(lags, self.historical_predictions.lag_features(timestamps, wanted,
+                                                                                    forecast_cutoff()))
+            if self.history is not None:
+                lags = self.with_history(lags, self.history.lag_features(timestamps, wanted))
         
         # ПРИЗНАКИ ВЗАИМОДЕЙСТВИЯ - ВАЖНО!
         # Создаем признаки взаимодействия лагов с временными периодами
-        is_morning_peak = 1 if 7 <= current_hour <= 9 else 0
-        is_evening_peak = 1 if 18 <= current_hour <= 22 else 0
-        is_night = 1 if 0 <= current_hour <= 5 else 0
-        is_weekend = 1 if target_date.weekday() >= 5 else 0
+        lags.update(lag_interactions(lags.get('lag_same_day_24h'), lags.get('lag_48h_ago'),
+                                     lags.get('lag_week_ago_168h'), hours, days_of_week, names))
         
-        # Взаимодействия лагов с временными периодами
-        lags['lag_24h_morning'] = lag_24h * is_morning_peak
-        lags['lag_24h_evening'] = lag_24h * is_evening_peak
-        lags['lag_24h_night'] = lag_24h * is_night
-        lags['lag_24h_weekend'] = lag_24h * is_weekend
+        return lags
+    
+    def get_realistic_rolling_stats(self, hours, months, timestamps=None, names=None):
+        """Скользящие статистики для массива часов: из истории или на основе EDA"""
+        n = len(hours)
+        uniform = self.rng.uniform
         
-        lags['lag_48h_morning'] = lag_48h * is_morning_peak
-        lags['lag_48h_evening'] = lag_48h * is_evening_peak
+        # 24-часовое среднее - из общих статистик EDA (от него считаются недельные)
+        rolling_24h = HOURLY_AVERAGES.mean() * self.get_seasonal_factor(months)
         
-        lags['lag_week_morning'] = lag_168h * is_morning_peak
-        lags['lag_week_evening'] = lag_168h * is_evening_peak
+        rolling = selected({
+            # 3-часовое среднее - на основе реальных данных
+            'rolling_mean_3h_past': lambda: (HOURLY_AVERAGES[hours] + HOURLY_AVERAGES[(hours - 1) % 24] +
+                                             HOURLY_AVERAGES[(hours - 2) % 24]) / 3 * uniform(0.98, 1.02, n),
+            'rolling_mean_24h': lambda: rolling_24h,
+            # 7-дневное среднее
+            'rolling_mean_7d_past': lambda: rolling_24h * uniform(0.99, 1.01, n),
+            # 168-часовое среднее (неделя)
+            'rolling_mean_168h': lambda: rolling_24h * uniform(0.98, 1.02, n)
+        }, names)
+        rolling = {name: np.maximum(0.1, values) for name, values in rolling.items()}
         
-        return lags
-    
-    def get_realistic_rolling_stats(self, hour, month):
-        """Реалистичные скользящие статистики на основе EDA"""
-        # 3-часовое среднее - на основе реальных данных
-        recent_hours = [REAL_HOURLY_AVERAGES[(hour - i) % 24] for i in range(3)]
-        rolling_3h = np.mean(recent_hours) * np.random.uniform(0.98, 1.02)
-        
-        # 24-часовое среднее - из общих статистик EDA
-        all_hourly_values = list(REAL_HOURLY_AVERAGES.values())
-        rolling_24h = np.mean(all_hourly_values) * self.get_seasonal_factor(month)
-        
-        # 7-дневное среднее
-        rolling_7d = rolling_24h * np.random.uniform(0.99, 1.01)
-        
-        # 168-часовое среднее (неделя)
-        rolling_168h = rolling_24h * np.random.uniform(0.98, 1.02)
-        
-        return {
-            'rolling_mean_3h_past': max(0.1, rolling_3h),
-            'rolling_mean_24h': max(0.1, rolling_24h),
-            'rolling_mean_7d_past': max(0.1, rolling_7d),
-            'rolling_mean_168h': max(0.1, rolling_168h)
-        }
+        if self.history is not None and timestamps is not None and rolling:
+            rolling = self.with_history(rolling, self.history.rolling_features(timestamps, rolling))
+        
+        return rolling
     
-    def get_realistic_submetering(self, hour, day_of_week, month):
-        """Реалистичные данные суб-счетчиков на основе анализа EDA"""
+    def get_realistic_submetering(self, hours, days_of_week, months, names=None):
+        """Реалистичные данные суб-счетчиков на основе анализа EDA для массива часов"""
+        n = len(hours)
+        uniform = self.rng.uniform
+        
         # Активность основана на реальных паттернах
-        kitchen_active = 1 if (7 <= hour <= 9) or (18 <= hour <= 20) else 0
-        laundry_active = 1 if (10 <= hour <= 18) and (day_of_week >= 5) else 0
-        ac_heating_active = 1 if ((18 <= hour <= 22) and (month in [12, 1, 2])) or \
-                                ((13 <= hour <= 17) and (month in [6, 7, 8])) else 0
-        
-        # Соотношения на основе анализа потребления
-        if kitchen_active:
-            kitchen_ratio = np.random.uniform(0.15, 0.25)
-        else:
-            kitchen_ratio = np.random.uniform(0.02, 0.08)
-            
-        if laundry_active:
-            laundry_ratio = np.random.uniform(0.08, 0.15)
-        else:
-            laundry_ratio = np.random.uniform(0.01, 0.04)
-            
-        if ac_heating_active:
-            ac_heating_ratio = np.random.uniform(0.25, 0.35)
-        else:
-            ac_heating_ratio = np.random.uniform(0.05, 0.12)
+        kitchen_active = ((hours >= 7) & (hours <= 9)) | ((hours >= 18) & (hours <= 20))
+        laundry_active = (hours >= 10) & (hours <= 18) & (days_of_week >= 5)
+        ac_heating_active = (((hours >= 18) & (hours <= 22) & np.isin(months, [12, 1, 2])) |
+                             ((hours >= 13) & (hours <= 17) & np.isin(months, [6, 7, 8])))
         
-        return {
-            'kitchen_ratio': kitchen_ratio,
-            'laundry_ratio': laundry_ratio,
-            'ac_heating_ratio': ac_heating_ratio,
-            'kitchen_active': kitchen_active,
-            'laundry_active': laundry_active,
-            'ac_heating_active': ac_heating_active
-        }
+        # Соотношения на основе анализа потребления: диапазон зависит от активности зоны
+        return selected({
+            'kitchen_ratio': lambda: np.where(kitchen_active, uniform(0.15, 0.25, n), uniform(0.02, 0.08, n)),
+            'laundry_ratio': lambda: np.where(laundry_active, uniform(0.08, 0.15, n), uniform(0.01, 0.04, n)),
+            'ac_heating_ratio': lambda: np.where(ac_heating_active, uniform(0.25, 0.35, n), uniform(0.05, 0.12, n)),
+            'kitchen_active': lambda: kitchen_active.astype(int),
+            'laundry_active': lambda: laundry_active.astype(int),
+            'ac_heating_active': lambda: ac_heating_active.astype(int)
+        }, names)
 
 # Инициализация генератора
 data_gen = RealisticDataGenerator()
 
-def create_realistic_features(hour, day_of_week, month, target_date):
-    """Создает РЕАЛИСТИЧНЫЕ признаки на основе реальных данных EDA"""
-    
-    # Генерируем реалистичное базовое потребление
-    current_consumption = data_gen.generate_realistic_base_consumption(hour, day_of_week, month)
-    
-    features = {}
+def load_model(version=None, model_name='lightgbm'):
+    """Модель из реестра (активная или указанная версия), без реестра - models/*.pkl из config.py"""
+    version = version or registry.current()
+    if version:
+        engine = registry.load(version)
+    else:
+        # Booster LightGBM напрямую: float32-матрица в порядке feature_names.json, без pandas
+        model_path = config.MODEL_PATHS[model_name]
+        engine = InferenceEngine.load(model_path, config.FEATURE_NAMES_PATH)
+        # Версия модели - хэш файла, входит в ключи кэша прогнозов
+        version = file_version(model_path)
+    # Таблица с другими сценариями/seed разошлась бы с ключом кэша и прогнозом predict_scenarios
+    table = CalendarTable.open(version, scenarios=config.FORECAST_SCENARIOS,
+                               seed=config.FORECAST_SCENARIO_SEED) if config.CALENDAR_TABLE_ENABLED else None
+    return LiveModel(engine, engine.feature_names, version, table)
+
+def reload_model(version=None):
+    """Загружает и прогревает модель рядом с текущей, затем подменяет ее одним присваиванием.
     
-    # 1. ЦИКЛИЧЕСКИЕ ПРИЗНАКИ
-    features['hour_sin'] = np.sin(2 * np.pi * hour / 24)
-    features['hour_cos'] = np.cos(2 * np.pi * hour / 24)
-    features['month_sin'] = np.sin(2 * np.pi * month / 12)
-    features['month_cos'] = np.cos(2 * np.pi * month / 12)
-    features['day_of_week_sin'] = np.sin(2 * np.pi * day_of_week / 7)
-    features['day_of_week_cos'] = np.cos(2 * np.pi * day_of_week / 7)
+    Запросы в работе досчитываются старой моделью; при ошибке загрузки остается старая.
+    """
+    global live, loaded_stamp
+    with _reload_lock:
+        # Снимок до загрузки: смена версии во время загрузки не потеряется для watch_models
+        stamp = model_stamp()
+        candidate = load_model(version)
+        candidate.engine.predict(create_features_batch([datetime.now() + timedelta(days=1)],
+                                                       feature_names=candidate.feature_names))
+        previous, live = live, candidate
+        # Явная версия не меняет активную в реестре: наблюдатель по-прежнему ждет ее смены
+        if version is None:
+            loaded_stamp = stamp
+    metrics.inc('bot_model_reloads_total')
+    print(f"✅ Модель {candidate.version} загружена. Ожидает {len(candidate.feature_names)} признаков"
+          + (f" (была {previous.version})" if previous else "")
+          + (", таблица календаря загружена" if candidate.table is not None else ""))
+    return candidate
+
+def load_resources(model_name='lightgbm'):
+    """Загружает модель, список признаков и историю потребления (пути из config.py)"""
+    global history_store
+    reload_model()
     
-    # 2. СУТОЧНЫЕ ПАТТЕРНЫ ИЗ EDA
-    features['is_early_morning'] = 1 if 4 <= hour <= 6 else 0
-    features['is_midday'] = 1 if 10 <= hour <= 16 else 0
-    features['is_late_evening'] = 1 if 21 <= hour <= 23 else 0
-    features['is_evening_peak'] = 1 if 18 <= hour <= 22 else 0
-    features['is_morning_peak'] = 1 if 7 <= hour <= 9 else 0
-    features['is_night'] = 1 if 0 <= hour <= 5 else 0
-    features['is_deep_night'] = 1 if 1 <= hour <= 4 else 0
+    if os.path.exists(config.HISTORY_PREFIX + '.json'):
+        history_store = HistoryStore.open(config.HISTORY_PREFIX)
+        data_gen.history = history_store
+        print(f"✅ История потребления загружена: {len(history_store)} часов")
     
-    # 3. НЕДЕЛЬНЫЕ ПАТТЕРНЫ ИЗ EDA
-    features['is_monday'] = 1 if day_of_week == 0 else 0
-    features['is_friday'] = 1 if day_of_week == 4 else 0
-    features['is_sunday'] = 1 if day_of_week == 6 else 0
-    features['is_week_start'] = 1 if day_of_week in [0, 1] else 0
-    features['is_week_end'] = 1 if day_of_week in [4, 5] else 0
-    features['weekend_evening_boost'] = 1 if (day_of_week >= 5 and 18 <= hour <= 22) else 0
-    features['weekend_morning'] = 1 if (day_of_week >= 5 and 7 <= hour <= 9) else 0
+    if config.FORECAST_STORE_PREFIX:
+        data_gen.historical_predictions = ForecastStore.open(config.FORECAST_STORE_PREFIX,
+                                                             config.FORECAST_STORE_MAX_BYTES)
+        print(f"✅ Сохраненные прогнозы: {len(data_gen.historical_predictions)} дней")
+
+def create_feature_columns(target_dates, generator=None, scenarios=1, names=None):
+    """Признаки для списка дат: {признак: массив (дни × 24)}.
     
-    # 4. СЕЗОННЫЕ ПАТТЕРНЫ ИЗ EDA
-    features['is_high_season'] = 1 if month in [12, 1, 2] else 0
-    features['is_low_season'] = 1 if month in [6, 7, 8] else 0
-    features['is_spring'] = 1 if month in [3, 4, 5] else 0
+    names - только эти признаки (по умолчанию все, которые умеет считать бот).
+    scenarios > 1 - столько независимых сценариев входов (лаги, скользящие, суб-счетчики)
+    подряд: строки идут как (сценарий, день, час). generator - источник случайности
+    (по умолчанию общий data_gen).
+    """
+    generator = generator or data_gen
+    n_days = len(target_dates)
     
-    # 5. КРИТИЧЕСКИЕ ПЕРЕХОДЫ ИЗ EDA
-    features['morning_surge_6_7'] = 1 if 6 <= hour <= 7 else 0
-    features['evening_surge_17_18'] = 1 if 17 <= hour <= 18 else 0
-    features['evening_drop_22_23'] = 1 if 22 <= hour <= 23 else 0
+    # Каждая строка - один час одной из дат
+    hour = np.tile(np.arange(24), n_days)
+    day_of_week = np.repeat([d.weekday() for d in target_dates], 24)
+    month = np.repeat([d.month for d in target_dates], 24)
+    timestamps = (np.repeat(np.array([d.date() for d in target_dates], dtype='datetime64[D]'), 24)
+                  .astype('datetime64[h]') + hour)
     
-    # 6. ВЗАИМОДЕЙСТВИЯ ПРИЗНАКОВ
-    features['winter_evening'] = 1 if (month in [12, 1, 2] and 18 <= hour <= 22) else 0
-    features['summer_afternoon'] = 1 if (month in [6, 7, 8] and 10 <= hour <= 16) else 0
-    features['workday_evening'] = 1 if (day_of_week < 5 and 18 <= hour <= 22) else 0
-    features['sunday_evening'] = 1 if (day_of_week == 6 and 18 <= hour <= 22) else 0
+    # 1-6, 10. КАЛЕНДАРНЫЕ ПРИЗНАКИ ИЗ EDA (общие с обучением) - одинаковы во всех сценариях
+    features = {name: np.tile(values, scenarios)
+                for name, values in calendar_features(hour, day_of_week, month, names).items()}
+    if scenarios > 1:
+        hour, day_of_week, month, timestamps = (np.tile(a, scenarios) for a in (hour, day_of_week, month, timestamps))
     
     # 7. РЕАЛИСТИЧНЫЕ ЛАГИ (ОСНОВАНЫ НА РЕАЛЬНЫХ ДАННЫХ)
-    lag_features = data_gen.get_realistic_lags(hour, current_consumption, target_date)
-    features.update(lag_features)
+    features.update(generator.get_realistic_lags(hour, day_of_week, timestamps, names))
     
     # 8. РЕАЛИСТИЧНЫЕ СКОЛЬЗЯЩИЕ СТАТИСТИКИ
-    rolling_features = data_gen.get_realistic_rolling_stats(hour, month)
-    features.update(rolling_features)
+    features.update(generator.get_realistic_rolling_stats(hour, month, timestamps, names))
     
     # 9. РЕАЛИСТИЧНЫЕ СУБ-СЧЕТЧИКИ
-    submetering_features = data_gen.get_realistic_submetering(hour, day_of_week, month)
-    features.update(submetering_features)
-    
-    # 10. БАЗОВЫЕ ПРИЗНАКИ
-    features['hour'] = hour
-    features['day_of_week'] = day_of_week
-    features['month'] = month
-    features['is_weekend'] = 1 if day_of_week >= 5 else 0
-    
-    # Создаем DataFrame в правильном порядке
-    ordered_features = {name: features[name] for name in FEATURE_NAMES}
-    
-    return pd.DataFrame([ordered_features])
+    features.update(generator.get_realistic_submetering(hour, day_of_week, month, names))
+    return features
 
-def predict_for_date(target_date):
-    """Прогноз для конкретной даты"""
-    day_of_week = target_date.weekday()
-    month = target_date.month
-    date_str = target_date.strftime('%Y-%m-%d')
+def create_features_batch(target_dates, generator=None, scenarios=1, feature_names=None):
+    """Матрица признаков (дни × 24) × признаки модели для списка дат одним проходом"""
+    feature_names = feature_names or live.feature_names
+    # Считаются только признаки модели; float32-матрица - в правильном порядке столбцов
+    return feature_matrix(create_feature_columns(target_dates, generator, scenarios, feature_names),
+                          feature_names)
+
+def create_realistic_features(hour, day_of_week, month, target_date):
+    """Создает признаки для одного часа (обертка над create_features_batch)"""
+    import pandas as pd
     
-    predictions = []
+    current = live
+    matrix = create_features_batch([target_date], feature_names=current.feature_names)
+    return pd.DataFrame(matrix[hour:hour + 1], columns=current.feature_names)
+
+def has_known_lags(target_date):
+    """Есть ли для часов этой даты настоящие лаги: из истории потребления или из прошлых прогнозов"""
+    timestamps = np.datetime64(target_date.date(), 'h') + np.arange(24)
+    sources = [data_gen.historical_predictions.lag_features(timestamps, LAG_HOURS, forecast_cutoff())]
+    if data_gen.history is not None:
+        sources.append(data_gen.history.lag_features(timestamps))
+    return any(not np.isnan(values).all() for lags in sources for values in lags.values())
+
+def from_table(current, target_dates):
+    """Маска дат, для которых базовый прогноз берется из таблицы календаря (лагов не известно)"""
+    if current.table is None:
+        return np.zeros(len(target_dates), dtype=bool)
+    return np.array([not has_known_lags(d) for d in target_dates], dtype=bool)
+
+def predict_for_dates(target_dates):
+    """Прогноз сразу для нескольких дат: одна матрица признаков и один вызов model.predict.
     
-    print(f"📅 Прогноз на {target_date.strftime('%d.%m.%Y')} ({['пн','вт','ср','чт','пт','сб','вс'][day_of_week]}, месяц {month})")
+    Даты без настоящей истории берутся из таблицы календаря, если она есть для модели.
+    """
+    current = live
+    predictions = np.empty((len(target_dates), 24))
+    lookup = from_table(current, target_dates)
+    if lookup.any():
+        with metrics.timer('table_lookup'):
+            predictions[lookup] = current.table.lookup([d for d, hit in zip(target_dates, lookup) if hit])
+    if not lookup.all():
+        dates = [d for d, hit in zip(target_dates, lookup) if not hit]
+        with metrics.timer('feature_build'):
+            if data_gen.seed is None:
+                matrix = create_features_batch(dates, feature_names=current.feature_names)
+            else:
+                # Фиксированный seed: у каждой даты свой генератор, прогноз не зависит от состава батча
+                matrix = np.vstack([create_features_batch([d], data_gen.for_date(d),
+                                                          feature_names=current.feature_names) for d in dates])
+        with metrics.timer('predict'):
+            raw = current.engine.predict(matrix)
+        predictions[~lookup] = np.clip(raw, 0.1, 7.0).reshape(len(dates), 24)
     
-    # Прогнозируем каждый час
-    for hour in range(24):
-        # Создаем РЕАЛИСТИЧНЫЕ признаки для этого часа
-        features_df = create_realistic_features(hour, day_of_week, month, target_date)
+    results = []
+    for target_date, day_predictions in zip(target_dates, predictions):
+        day_of_week = target_date.weekday()
+        month = target_date.month
+        # Сохраняем для использования в будущих лагах
+        data_gen.historical_predictions.put(target_date, day_predictions)
+        day_predictions = day_predictions.tolist()
         
-        # Прогнозируем
-        prediction = model.predict(features_df)[0]
-        predictions.append(max(0.1, min(7.0, prediction)))
+        # Отладочная печать по часам - синхронный вывод, только с DEBUG_HOURLY_LOG=1
+        if config.DEBUG_HOURLY_LOG:
+            print(f"📅 Прогноз на {target_date.strftime('%d.%m.%Y')} ({['пн','вт','ср','чт','пт','сб','вс'][day_of_week]}, месяц {month})")
+            for hour, prediction in enumerate(day_predictions):
+                print(f"  Час {hour:2d}: {prediction:.2f} кВт")
         
-        print(f"  Час {hour:2d}: {predictions[-1]:.2f} кВт")
+        results.append((list(range(24)), day_predictions, day_of_week, month))
     
-    # Сохраняем для использования в будущих лагах
-    data_gen.historical_predictions[date_str] = {
-        hour: pred for hour, pred in enumerate(predictions)
-    }
+    return results
+
+def predict_scenarios(target_dates, scenarios=None, seed=None):
+    """Вероятностный прогноз: K сценариев входов, один вызов model.predict на все K × 24 строк.
+    
+    Возвращает для каждой даты (часы, P10, P50, P90, день недели, месяц). Генератор
+    сценариев свой, с фиксированным seed: общий data_gen не сдвигается, а результат
+    для даты воспроизводим (и кэшируется). Без явных scenarios/seed даты без истории
+    берутся из таблицы календаря (перцентили там посчитаны по тем же сценариям).
+    """
+    current = live
+    bands = np.empty((3, len(target_dates), 24))
+    lookup = from_table(current, target_dates) if scenarios is None and seed is None else \
+        np.zeros(len(target_dates), dtype=bool)
+    if lookup.any():
+        with metrics.timer('table_lookup'):
+            dates = [d for d, hit in zip(target_dates, lookup) if hit]
+            bands[:, lookup] = [current.table.lookup(dates, field) for field in ('p10', 'p50', 'p90')]
+    if not lookup.all():
+        dates = [d for d, hit in zip(target_dates, lookup) if not hit]
+        scenarios = scenarios or config.FORECAST_SCENARIOS
+        generator = RealisticDataGenerator(config.FORECAST_SCENARIO_SEED if seed is None else seed,
+                                           history=data_gen.history, forecasts=data_gen.historical_predictions)
+        with metrics.timer('feature_build'):
+            matrix = create_features_batch(dates, generator, scenarios, current.feature_names)
+        with metrics.timer('predict'):
+            raw = current.engine.predict(matrix)
+        samples = np.clip(raw, 0.1, 7.0).reshape(scenarios, len(dates), 24)
+        bands[:, ~lookup] = np.percentile(samples, [10, 50, 90], axis=0)
     
-    return list(range(24)), predictions, day_of_week, month
+    return [(list(range(24)), p10.tolist(), p50.tolist(), p90.tolist(), d.weekday(), d.month)
+            for d, p10, p50, p90 in zip(target_dates, *bands)]
+
+def predict_for_date(target_date):
+    """Прогноз для конкретной даты"""
+    return predict_for_dates([target_date])[0]
+
+# Кэши прогнозов и готовых PNG: сбрасываются при смене суток
+forecast_cache = ForecastCache(maxsize=64)
+chart_cache = ForecastCache(maxsize=32)
+
+def cache_key(kind, *dates):
+    """Ключ кэша: тип, целевые даты, версия модели, seed генератора признаков и отметка
+    прошлых прогнозов, которые попадают в лаги (до forecast_cutoff)"""
+    return (kind, *(d.strftime('%Y-%m-%d') for d in dates), live.version, data_gen.seed,
+            data_gen.historical_predictions.stamp(forecast_cutoff()))
+
+def get_forecasts(target_dates):
+    """Прогнозы для дат из кэша; недостающие считаются одним батчем"""
+    keys = [cache_key('forecast', d) for d in target_dates]
+    dates_by_key = dict(zip(keys, target_dates))
+    return forecast_cache.get_or_compute_many(
+        keys, lambda missing: predict_for_dates([dates_by_key[k] for k in missing])
+    )
+
+def get_bands(target_dates):
+    """Вероятностные прогнозы (P10/P50/P90) из кэша; недостающие - одним батчем сценариев"""
+    keys = [cache_key('bands', d) + (config.FORECAST_SCENARIOS, config.FORECAST_SCENARIO_SEED)
+            for d in target_dates]
+    dates_by_key = dict(zip(keys, target_dates))
+    return forecast_cache.get_or_compute_many(
+        keys, lambda missing: predict_scenarios([dates_by_key[k] for k in missing])
+    )
+
+# Графики: фигуры строятся один раз на поток, на запрос перерисовываются только линии.
+# CHART_COMPACT=0 - полноцветный PNG вместо палитры (больше байт)
+renderer = ChartRenderer(HOURLY_AVERAGES, compact=os.getenv('CHART_COMPACT', '1') != '0')
 
 def create_comparison_plot(hours, predictions_tomorrow, predictions_day_after, date_tomorrow, date_day_after):
     """Создает график сравнения двух прогнозов с ночным пиком"""
-    plt.figure(figsize=(14, 8))
-    
-    # Графики прогнозов
-    plt.plot(hours, predictions_tomorrow, 'b-', linewidth=3, marker='o', markersize=4, 
-             label=f'Завтра ({date_tomorrow})', alpha=0.8)
-    
-    plt.plot(hours, predictions_day_after, 'r-', linewidth=3, marker='s', markersize=4, 
-             label=f'Послезавтра ({date_day_after})', alpha=0.8)
-    
-    # Реальные средние значения из EDA для сравнения
-    real_values = [REAL_HOURLY_AVERAGES[h] for h in hours]
-    plt.plot(hours, real_values, 'g--', linewidth=2, label='Реальные средние из EDA', alpha=0.6)
-    
-    # Зоны пиков из EDA - ТЕПЕРЬ С НОЧНЫМ ПИКОМ!
-    plt.axvspan(0, 5, alpha=0.15, color='blue', label='Ночное время (0-5)')
-    plt.axvspan(7, 9, alpha=0.15, color='orange', label='Утренний пик (7-9)')
-    plt.axvspan(18, 22, alpha=0.15, color='red', label='Вечерний пик (18-22)')
-    
-    plt.title('Сравнение прогнозов энергопотребления\n(Честная оценка работы модели)', 
-              fontsize=14, fontweight='bold')
-    plt.xlabel('Час дня', fontsize=12)
-    plt.ylabel('Нагрузка (кВт)', fontsize=12)
-    plt.grid(True, alpha=0.3)
-    plt.legend()
-    plt.xticks(range(0, 24, 2))
-    plt.ylim(bottom=0, top=8)
-    
-    # Добавляем аннотации для пиковых зон
-    plt.text(2.5, 0.5, '', ha='center', va='center', 
-             fontsize=10, fontweight='bold', color='blue', alpha=0.7)
-    plt.text(8, 0.5, '', ha='center', va='center', 
-             fontsize=10, fontweight='bold', color='orange', alpha=0.7)
-    plt.text(20, 0.5, '', ha='center', va='center', 
-             fontsize=10, fontweight='bold', color='red', alpha=0.7)
-    
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-    buf.seek(0)
-    plt.close()
-    
-    return buf
+    with metrics.timer('render'):
+        return io.BytesIO(renderer.comparison_png(predictions_tomorrow, predictions_day_after,
+                                                  date_tomorrow, date_day_after))
+
+def create_single_plot(hours, predictions, date_str, day_name):
+    """Создает график прогноза на один день"""
+    with metrics.timer('render'):
+        return io.BytesIO(renderer.single_png(predictions, f'Прогноз на {date_str} ({day_name})'))
+
+def create_bands_plot(p10, p50, p90, date_str, day_name):
+    """Создает график медианы прогноза с полосой P10-P90"""
+    with metrics.timer('render'):
+        return io.BytesIO(renderer.bands_png(p10, p50, p90, f'Диапазон прогноза на {date_str} ({day_name})'))
 
 def create_prediction_keyboard():
     """Создает клавиатуру с кнопками для прогнозов"""
@@ -339,11 +486,81 @@ def create_prediction_keyboard():
         InlineKeyboardButton("📆 Послезавтра", callback_data="predict_day_after")
     )
     keyboard.row(
-        InlineKeyboardButton("📊 Сравнить оба", callback_data="compare_both")
+        InlineKeyboardButton("📊 Сравнить оба", callback_data="compare_both"),
+        InlineKeyboardButton("🎲 Диапазон на завтра", callback_data="bands_tomorrow")
     )
     return keyboard
 
+# Пул обработчиков: BOT_WORKERS потоков, не больше BOT_MAX_PENDING задач в очереди
+dispatcher = ChatDispatcher(max_workers=int(os.getenv('BOT_WORKERS', 0)) or None,
+                            max_pending=int(os.getenv('BOT_MAX_PENDING', 0)) or None)
+BUSY_TEXT = "⏳ Сейчас много запросов, попробуйте через несколько секунд"
+
+# Ограничение частоты по чатам: жетоны на запрос, тяжелые обработчики стоят дороже
+rate_limiter = RateLimiter(config.RATE_LIMIT_PER_MINUTE / 60, config.RATE_LIMIT_BURST)
+HANDLER_COSTS = {
+    'handle_callback:compare_both': 2,
+    'handle_callback:bands_tomorrow': 2,
+    'score_households_upload': 5,
+}
+RATE_LIMITED_TEXT = "🐢 Слишком часто. Повторите через {:.0f} с"
+metrics.gauge('bot_queue_pending', lambda: dispatcher.pending)
+metrics.gauge('bot_cache_hits', lambda: forecast_cache.hits, cache='forecast')
+metrics.gauge('bot_cache_misses', lambda: forecast_cache.misses, cache='forecast')
+metrics.gauge('bot_cache_hits', lambda: chart_cache.hits, cache='chart')
+metrics.gauge('bot_cache_misses', lambda: chart_cache.misses, cache='chart')
+
+def reply_busy(update):
+    """Мгновенный ответ, когда очередь переполнена"""
+    try:
+        if isinstance(update, CallbackQuery):
+            bot.answer_callback_query(update.id, BUSY_TEXT)
+        else:
+            bot.send_message(update.chat.id, BUSY_TEXT)
+    except Exception as e:
+        print(f"❌ Не удалось ответить о занятости: {e}")
+
+def reply_rate_limited(update, wait):
+    """Кнопке отвечаем всегда (иначе она крутится), сообщением - один раз за серию отказов"""
+    try:
+        if isinstance(update, CallbackQuery):
+            bot.answer_callback_query(update.id, RATE_LIMITED_TEXT.format(max(1, wait)))
+        elif rate_limiter.should_warn(update.chat.id):
+            bot.send_message(update.chat.id, RATE_LIMITED_TEXT.format(max(1, wait)))
+    except Exception as e:
+        print(f"❌ Не удалось ответить об ограничении: {e}")
+
+def handler_label(handler, update):
+    """Метка обработчика для метрик; у кнопок - вместе с callback_data"""
+    if isinstance(update, CallbackQuery):
+        return f"{handler.__name__}:{update.data}"
+    return handler.__name__
+
+def queued(handler):
+    """Обработчик выполняется в пуле, в очереди своего чата (порядок внутри чата сохраняется)"""
+    def run(update, label, submitted):
+        metrics.observe('bot_queue_wait_seconds', time.perf_counter() - submitted, handler=label)
+        with metrics.handler_context(label), metrics.timer('handler'):
+            handler(update)
+    
+    @functools.wraps(handler)
+    def wrapper(update):
+        message = update.message if isinstance(update, CallbackQuery) else update
+        label = handler_label(handler, update)
+        wait = rate_limiter.acquire(message.chat.id, HANDLER_COSTS.get(label, 1))
+        if wait:
+            metrics.inc('bot_rate_limited_total', handler=label)
+            reply_rate_limited(update, wait)
+            return
+        if dispatcher.submit(message.chat.id, run, update, label, time.perf_counter()):
+            metrics.inc('bot_requests_total', handler=label)
+        else:
+            metrics.inc('bot_rejected_total', handler=label)
+            reply_busy(update)
+    return wrapper
+
 @bot.message_handler(commands=['start', 'help'])
+@queued
 def send_welcome(message):
     welcome_text = """
 🤖 *Бот прогнозирования энергопотребления*
@@ -359,6 +576,9 @@ def send_welcome(message):
 /predict - Прогноз с сравнением
 /stats - Статистика и анализ проблем
 
+*Много домохозяйств:* пришлите CSV (схема df/obr.csv, по файлу на домохозяйство
+в ZIP или одним файлом с колонкой household) - прогноз на сутки для каждого
+
 *Используйте кнопки ниже для тестирования:*
     """
     bot.send_message(message.chat.id, welcome_text, 
@@ -366,6 +586,7 @@ def send_welcome(message):
                    reply_markup=create_prediction_keyboard())
 
 @bot.callback_query_handler(func=lambda call: True)
+@queued
 def handle_callback(call):
     try:
         if call.data == "predict_tomorrow":
@@ -380,6 +601,10 @@ def handle_callback(call):
             bot.answer_callback_query(call.id, "Сравниваю оба прогноза...")
             send_comparison(call.message)
             
+        elif call.data == "bands_tomorrow":
+            bot.answer_callback_query(call.id, "Считаю сценарии на завтра...")
+            send_bands_prediction(call.message, days_ahead=1)
+            
     except Exception as e:
         bot.send_message(call.message.chat.id, f"❌ Ошибка: {str(e)}")
 
@@ -387,23 +612,16 @@ def send_single_prediction(message, days_ahead=1):
     """Отправляет прогноз для одного дня"""
     try:
         target_date = datetime.now() + timedelta(days=days_ahead)
-        hours, predictions, day_of_week, month = predict_for_date(target_date)
+        hours, predictions, day_of_week, month = get_forecasts([target_date])[0]
         
         date_str = target_date.strftime('%d.%m.%Y')
         day_names = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота", "воскресенье"]
         
-        # Создаем график
-        plt.figure(figsize=(12, 6))
-        plt.plot(hours, predictions, 'b-', linewidth=2, marker='o', label='Прогноз ML')
-        plt.plot(hours, [REAL_HOURLY_AVERAGES[h] for h in hours], 'r--', label='Реальные средние')
-        plt.title(f'Прогноз на {date_str} ({day_names[day_of_week]})')
-        plt.grid(True, alpha=0.3)
-        plt.legend()
-        
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=100, bbox_inches='tight')
-        buf.seek(0)
-        plt.close()
+        # График берем из кэша или строим один раз
+        plot_png = chart_cache.get_or_compute(
+            cache_key('single', target_date),
+            lambda: create_single_plot(hours, predictions, date_str, day_names[day_of_week]).getvalue()
+        )
         
         # Статистика
         avg = np.mean(predictions)
@@ -423,7 +641,7 @@ def send_single_prediction(message, days_ahead=1):
 
 *Вывод:* Модель имеет систематические ошибки"""
         
-        bot.send_photo(message.chat.id, buf, caption=caption, parse_mode='Markdown',
+        bot.send_photo(message.chat.id, plot_png, caption=caption, parse_mode='Markdown',
                       reply_markup=create_prediction_keyboard())
         
     except Exception as e:
@@ -432,17 +650,18 @@ def send_single_prediction(message, days_ahead=1):
 def send_comparison(message):
     """Отправляет сравнение двух прогнозов"""
     try:
-        # Прогноз на завтра
+        # Прогноз на завтра и послезавтра - одним батчем
         tomorrow = datetime.now() + timedelta(days=1)
-        hours, pred_tomorrow, dow_tomorrow, month_tomorrow = predict_for_date(tomorrow)
-        
-        # Прогноз на послезавтра
         day_after = datetime.now() + timedelta(days=2)
-        _, pred_day_after, dow_day_after, month_day_after = predict_for_date(day_after)
+        (hours, pred_tomorrow, dow_tomorrow, month_tomorrow), \
+            (_, pred_day_after, dow_day_after, month_day_after) = get_forecasts([tomorrow, day_after])
         
-        # Создаем график сравнения
-        plot_buf = create_comparison_plot(hours, pred_tomorrow, pred_day_after,
-                                         tomorrow.strftime('%d.%m'), day_after.strftime('%d.%m'))
+        # Создаем график сравнения (или берем готовый из кэша)
+        plot_png = chart_cache.get_or_compute(
+            cache_key('compare', tomorrow, day_after),
+            lambda: create_comparison_plot(hours, pred_tomorrow, pred_day_after,
+                                           tomorrow.strftime('%d.%m'), day_after.strftime('%d.%m')).getvalue()
+        )
         
         # Анализ различий
         avg_tomorrow = np.mean(pred_tomorrow)
@@ -471,13 +690,49 @@ def send_comparison(message):
 
 *Это реалистичный результат для учебного проекта!*"""
         
-        bot.send_photo(message.chat.id, plot_buf, caption=caption, parse_mode='Markdown',
+        bot.send_photo(message.chat.id, plot_png, caption=caption, parse_mode='Markdown',
                       reply_markup=create_prediction_keyboard())
         
     except Exception as e:
         bot.send_message(message.chat.id, f"❌ Ошибка сравнения: {str(e)}")
 
+def send_bands_prediction(message, days_ahead=1):
+    """Отправляет вероятностный прогноз: медиана и диапазон P10-P90 по сценариям входов"""
+    try:
+        target_date = datetime.now() + timedelta(days=days_ahead)
+        hours, p10, p50, p90, day_of_week, month = get_bands([target_date])[0]
+        
+        date_str = target_date.strftime('%d.%m.%Y')
+        day_names = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота", "воскресенье"]
+        
+        plot_png = chart_cache.get_or_compute(
+            cache_key('bands', target_date) + (config.FORECAST_SCENARIOS, config.FORECAST_SCENARIO_SEED),
+            lambda: create_bands_plot(p10, p50, p90, date_str, day_names[day_of_week]).getvalue()
+        )
+        
+        width = np.subtract(p90, p10)
+        widest_hour = hours[np.argmax(width)]
+        peak_hour = hours[np.argmax(p50)]
+        
+        caption = f"""🎲 *Диапазон прогноза на {date_str}*
+*{day_names[day_of_week]}*, {config.FORECAST_SCENARIOS} сценариев
+
+*Метрики:*
+• Средняя нагрузка (P50): {np.mean(p50):.2f} кВт
+• Среднее за день P10-P90: {np.mean(p10):.2f}-{np.mean(p90):.2f} кВт
+• Пик (P50): {p50[peak_hour]:.2f} кВт в {peak_hour}:00 (P10-P90: {p10[peak_hour]:.2f}-{p90[peak_hour]:.2f})
+• Самый неопределенный час: {widest_hour}:00 (±{width[widest_hour] / 2:.2f} кВт)
+
+*Вывод:* 80% сценариев попадают в закрашенную полосу"""
+        
+        bot.send_photo(message.chat.id, plot_png, caption=caption, parse_mode='Markdown',
+                      reply_markup=create_prediction_keyboard())
+        
+    except Exception as e:
+        bot.send_message(message.chat.id, f"❌ Ошибка: {str(e)}")
+
 @bot.message_handler(commands=['predict'])
+@queued
 def send_predict_menu(message):
     """Меню прогнозов"""
     menu_text = """
@@ -488,6 +743,7 @@ def send_predict_menu(message):
 • *Завтра* - прогноз на 1 день вперед
 • *Послезавтра* - прогноз на 2 дня вперед  
 • *Сравнить оба* - анализ различий между днями
+• *Диапазон на завтра* - P10/P50/P90 по сценариям входов
 
 *Цель:* Убедиться что прогнозы РАЗНЫЕ для разных дат
 и оценить реальное качество модели.
@@ -496,8 +752,81 @@ def send_predict_menu(message):
                    parse_mode='Markdown',
                    reply_markup=create_prediction_keyboard())
 
+# Сводка бэктеста перечитывается, только когда файл изменился
+_backtest = {'mtime': None, 'state': None}
+
+def load_backtest():
+    """Последняя сводка backtest.py или None, если бэктест еще не запускался"""
+    try:
+        mtime = os.path.getmtime(config.BACKTEST_SUMMARY_PATH)
+    except OSError:
+        return None
+    if mtime != _backtest['mtime']:
+        state = load_summary(config.BACKTEST_SUMMARY_PATH)
+        # Сводка старого формата (без разделения in-sample) не показывается до пересчета
+        _backtest['state'] = state if state and state.get('format') == STATE_FORMAT else None
+        _backtest['mtime'] = mtime
+    return _backtest['state']
+
+def format_backtest_stats(state):
+    """Текст /stats по настоящим ошибкам модели на истории (основные метрики - вне обучения)"""
+    in_sample = state['summary_in_sample']
+    # Если все часы истории попали в обучение, показываются они - с пометкой
+    honest = state['summary']['count'] > 0
+    summary = state['summary'] if honest else in_sample
+    cube = np.asarray(state['cube'] if honest else state['cube_in_sample'])
+    night = hours_stats(cube, range(0, 6))
+    morning = hours_stats(cube, range(7, 10))
+    evening = hours_stats(cube, range(18, 23))
+    worst_hours = sorted((row['MAE'], hour) for hour, row in enumerate(summary['by_hour']) if row['count'])[::-1][:3]
+    weekdays = [(name, row['MAE']) for name, row in zip(WEEKDAYS, summary['by_weekday']) if row['count']]
+    seasons = [(name, row['MAE']) for name, row in zip(SEASONS, summary['by_season']) if row['count']]
+    
+    def ratio(part):
+        return f"{part['predicted']:.2f} кВт при факте {part['actual']:.2f} кВт ({part['predicted'] / part['actual'] - 1:+.0%})"
+    
+    r2 = f"{summary['R2'] * 100:.1f}%" if summary['R2'] is not None else "—"
+    if state['train_end'] is None:
+        sample = "⚠️ Конец обучающих данных не задан: часть часов может быть из обучающей выборки"
+    elif not honest:
+        sample = f"⚠️ Все часы - из обучающих данных (до {state['train_end'][:10]}), метрики завышены"
+    else:
+        sample = f"Вне обучения: после {state['train_end'][:10]}"
+        if in_sample['count']:
+            sample += f"; на обучающих данных MAE {in_sample['MAE']:.3f} кВт ({in_sample['count']} часов)"
+    return f"""
+📊 *Статистика модели на истории (бэктест на сутки вперед)*
+
+*Период:* {state['first_timestamp'][:10]} - {state['last_timestamp'][:10]}, {summary['count']} часов
+{sample}
+
+*Технические метрики:*
+• MAE: {summary['MAE']:.3f} кВт
+• RMSE: {summary['RMSE']:.3f} кВт
+• R²: {r2}
+• Смещение: {summary['bias']:+.3f} кВт
+
+*Средний прогноз по периодам суток:*
+• Ночь (0-5): {ratio(night)}
+• Утренний пик (7-9): {ratio(morning)}
+• Вечерний пик (18-22): {ratio(evening)}
+
+*Худшие часы по MAE:* {', '.join(f'{hour}:00 ({mae:.2f})' for mae, hour in worst_hours)}
+*MAE по дням недели:* {', '.join(f'{name} {mae:.2f}' for name, mae in weekdays)}
+*MAE по сезонам:* {', '.join(f'{name} {mae:.2f}' for name, mae in seasons)}
+
+_Обновлено {state['updated'][:16].replace('T', ' ')}, модель {state['model_version']}_
+    """
+
 @bot.message_handler(commands=['stats'])
+@queued
 def send_stats(message):
+    state = load_backtest()
+    if state and (state['summary']['count'] or state['summary_in_sample']['count']):
+        bot.send_message(message.chat.id, format_backtest_stats(state), parse_mode='Markdown')
+        return
+    
+    # Бэктест еще не запускался (python tg_bot/backtest.py) - оценка из ноутбука
     stats_text = """
 📊 *Честная статистика модели*
 
@@ -522,7 +851,128 @@ def send_stats(message):
     """
     bot.send_message(message.chat.id, stats_text, parse_mode='Markdown')
 
+def is_admin(message):
+    return message.from_user is not None and message.from_user.id in config.ADMIN_IDS
+
+@bot.message_handler(commands=['reload'])
+@queued
+def send_reload(message):
+    """/reload [версия] - перечитать активную (или указанную) версию модели без перезапуска"""
+    if not is_admin(message):
+        bot.send_message(message.chat.id, "⛔ Команда только для администраторов")
+        return
+    version = message.text.split(maxsplit=1)[1].strip() if ' ' in message.text.strip() else None
+    try:
+        if version:
+            registry.activate(version)
+        # reload_model() запоминает новое состояние реестра: watch_models эту смену пропустит
+        current = reload_model()
+        bot.send_message(message.chat.id, f"✅ Работает модель {current.version} ({len(current.feature_names)} признаков)")
+    except Exception as e:
+        bot.send_message(message.chat.id, f"❌ Модель не заменена: {str(e)}")
+
+@bot.message_handler(commands=['models'])
+@queued
+def send_models(message):
+    """Версии из реестра с метриками обучения"""
+    if not is_admin(message):
+        bot.send_message(message.chat.id, "⛔ Команда только для администраторов")
+        return
+    lines = [f"▶ Сейчас: {live.version}" + (" (+ таблица календаря)" if live.table is not None else "")]
+    for version in registry.versions():
+        manifest = registry.manifest(version)
+        scores = ', '.join(f"{key} {value:.3f}" for key, value in registry.metrics(version).items()
+                           if isinstance(value, float))
+        lines.append(f"{'▶' if version == live.version else '•'} {version} ({manifest['kind']}, "
+                     f"{manifest['n_features']} признаков) {scores}")
+    if len(lines) == 1:
+        lines.append("Реестр пуст: python tg_bot/registry.py publish ...")
+    bot.send_message(message.chat.id, '\n'.join(lines))
+
+@bot.message_handler(commands=['compare_models'])
+@queued
+def send_model_comparison(message):
+    """Все версии реестра на одном и том же наборе признаков (прогноз на завтра)"""
+    if not is_admin(message):
+        bot.send_message(message.chat.id, "⛔ Команда только для администраторов")
+        return
+    try:
+        tomorrow = datetime.now() + timedelta(days=1)
+        engines = {version: registry.load(version) for version in registry.versions()}
+        engines.setdefault(live.version, live.engine)
+        # Один генератор с фиксированным seed - одни и те же входы для всех моделей
+        generator = RealisticDataGenerator(config.FORECAST_SCENARIO_SEED, history=data_gen.history,
+                                           forecasts=data_gen.historical_predictions)
+        # Признаки всех версий сразу: у каждой модели те же входы
+        names = set().union(*(engine.feature_names for engine in engines.values()))
+        report, predictions = score_side_by_side(engines, create_feature_columns([tomorrow], generator, names=names))
+        lines = [f"📊 Модели на одном прогнозе ({tomorrow.strftime('%d.%m.%Y')}):"]
+        for version, row in report.items():
+            values = np.clip(predictions[version], 0.1, 7.0)
+            lines.append(f"{'▶' if version == live.version else '•'} {version}: среднее {values.mean():.2f} кВт, "
+                         f"пик {values.max():.2f} кВт в {int(values.argmax())}:00, {row['latency_us']:.0f} мкс")
+        bot.send_message(message.chat.id, '\n'.join(lines))
+    except Exception as e:
+        bot.send_message(message.chat.id, f"❌ Ошибка сравнения: {str(e)}")
+
+@bot.message_handler(content_types=['document'])
+@queued
+def score_households_upload(message):
+    """CSV/ZIP с выгрузками домохозяйств: прогноз на сутки для всех одним батчем"""
+    document = message.document
+    name = document.file_name or 'upload.csv'
+    if not name.lower().endswith(('.csv', '.zip')):
+        bot.send_message(message.chat.id, "📎 Нужен CSV в схеме df/obr.csv или ZIP с такими файлами")
+        return
+    if document.file_size and document.file_size > config.HOUSEHOLD_UPLOAD_MAX_BYTES:
+        bot.send_message(message.chat.id, f"❌ Файл больше {config.HOUSEHOLD_UPLOAD_MAX_BYTES // (1024 * 1024)} МБ")
+        return
+    try:
+        data = bot.download_file(bot.get_file(document.file_id).file_path)
+        current = live
+        with metrics.timer('feature_build'):
+            windows, n_rows = load_windows([(name, data)])
+        with metrics.timer('predict'):
+            predictions = score_households(current.engine, windows, current.feature_names)
+        metrics.inc('bot_households_scored_total', len(windows))
+        report = io.BytesIO(forecast_csv(windows, predictions).encode('utf-8'))
+        report.name = 'households_forecast.csv'
+        bot.send_message(message.chat.id, format_summary(windows, predictions) + f"\n📄 Строк в выгрузке: {n_rows}")
+        bot.send_document(message.chat.id, report)
+    except Exception as e:
+        bot.send_message(message.chat.id, f"❌ Не удалось обработать файл: {str(e)}")
+
+def watch_models(interval, stop_event=None):
+    """Фоновый поток: при смене активной версии в реестре модель перезагружается.
+    
+    Сравнение идет с loaded_stamp - состоянием, с которым модель загрузил последний
+    reload_model(), в том числе из /reload: ту же смену поток второй раз не загружает.
+    """
+    global loaded_stamp
+    stop_event = stop_event or threading.Event()
+    # Модель загружена не через reload_model(): отсчет от состояния на момент запуска
+    if loaded_stamp is None:
+        loaded_stamp = model_stamp()
+    # Версия, которую загрузить не удалось: повторять каждый шаг не нужно
+    failed = None
+    
+    def run():
+        nonlocal failed
+        while not stop_event.wait(interval):
+            stamp = model_stamp()
+            if stamp in (loaded_stamp, failed):
+                continue
+            try:
+                reload_model()
+            except Exception as e:
+                failed = stamp
+                print(f"❌ Новая версия модели не загружена, работает прежняя: {e}")
+    
+    threading.Thread(target=run, name='model-watch', daemon=True).start()
+    return stop_event
+
 @bot.message_handler(func=lambda message: True)
+@queued
 def echo_all(message):
     help_text = """
 🤖 Я бот для ЧЕСТНОЙ оценки ML модели.
@@ -536,8 +986,73 @@ def echo_all(message):
     bot.send_message(message.chat.id, help_text,
                    reply_markup=create_prediction_keyboard())
 
+def warm_up():
+    """Пробный прогноз и по одному графику в каждом потоке обработки до начала опроса"""
+    baseline = HOURLY_AVERAGES.tolist()
+    # Графики прогреваются в потоках пула, пока основной поток загружает модель
+    renders = dispatcher.run_on_workers(
+        lambda: (renderer.comparison_png(baseline, baseline, '', ''), renderer.single_png(baseline, ''),
+                 renderer.bands_png(baseline, baseline, baseline, ''))
+    )
+    # Модель прогревается пробным прогнозом внутри reload_model()
+    load_resources()
+    for future in renders:
+        future.result()
+
+def run_webhook():
+    """Прием обновлений через webhook: локальный сервер + регистрация адреса в Telegram"""
+    from urllib.parse import urlparse
+    
+    server = WebhookServer(bot, config.WEBHOOK_HOST, config.WEBHOOK_PORT,
+                           urlparse(config.WEBHOOK_URL).path, config.WEBHOOK_SECRET)
+    metrics.gauge('bot_webhook_updates', lambda: server.received, result='accepted')
+    metrics.gauge('bot_webhook_updates', lambda: server.rejected, result='rejected')
+    bot.set_webhook(config.WEBHOOK_URL, secret_token=config.WEBHOOK_SECRET,
+                    max_connections=config.WEBHOOK_MAX_CONNECTIONS)
+    print(f"🌐 Webhook {config.WEBHOOK_URL} -> http://{config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}")
+    try:
+        server.serve_forever()
+    finally:
+        server.stop()
+
+def startup():
+    """Проверка конфигурации, загрузка и прогрев; False - бот запускать нельзя"""
+    startup_timer.mark('Импорт модулей')
+    if not config.check_config():
+        return False
+    startup_timer.mark('Проверка конфигурации')
+    try:
+        warm_up()
+    except Exception as e:
+        print(f"❌ Ошибка загрузки модели: {e}")
+        return False
+    startup_timer.mark('Загрузка модели и прогрев')
+    print(startup_timer.report())
+    return True
+
 if __name__ == "__main__":
+    if not startup():
+        raise SystemExit(1)
     print("🚀 Бот запущен для ЧЕСТНОЙ оценки модели!")
     print("📊 Кнопки для сравнения прогнозов активированы")
     print("⚠️  Ожидаем выявления реальных проблем модели")
-    bot.infinity_polling()
\ No newline at end of file
+    print(f"🧵 Потоков обработки: {dispatcher.max_workers}, очередь до {dispatcher.max_pending} задач")
+    if config.METRICS_PORT:
+        metrics.serve(port=config.METRICS_PORT)
+        print(f"📈 Метрики: http://127.0.0.1:{config.METRICS_PORT}/metrics")
+    if config.MODEL_WATCH_INTERVAL > 0:
+        watch_models(config.MODEL_WATCH_INTERVAL)
+        print(f"👀 Реестр моделей проверяется каждые {config.MODEL_WATCH_INTERVAL:.0f} с ({config.MODEL_REGISTRY_DIR})")
+    if config.METRICS_DUMP_PATH:
+        metrics.dump_periodically(config.METRICS_DUMP_PATH, config.METRICS_DUMP_INTERVAL)
+        print(f"📈 Метрики пишутся в {config.METRICS_DUMP_PATH} каждые {config.METRICS_DUMP_INTERVAL:.0f} с")
+    install_session(config.HTTP_POOL_SIZE or dispatcher.max_workers + 2)
+    try:
+        if config.WEBHOOK_URL:
+            run_webhook()
+        else:
+            # Пока у бота есть webhook, getUpdates возвращает ошибку
+            bot.remove_webhook()
+            bot.infinity_polling()
+    finally:
+        dispatcher.shutdown()
\ No newline at end of file
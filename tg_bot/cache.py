@@ -0,0 +1,98 @@
+# cache.py - КЭШ ПРОГНОЗОВ И ГРАФИКОВ С ОБЪЕДИНЕНИЕМ ОДИНАКОВЫХ ЗАПРОСОВ
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import date
+
+
+class ForecastCache:
+    """Ограниченный LRU-кэш, который сбрасывается при смене суток.
+
+    Одинаковые запросы, пришедшие одновременно, ждут одного вычисления
+    (single-flight), а не считают одно и то же параллельно.
+    """
+
+    def __init__(self, maxsize=128, today=date.today):
+        self.maxsize = maxsize
+        self._today = today
+        self._day = today()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _expire_if_new_day(self):
+        """Наступили новые сутки - "завтра" уже другое, старые записи не нужны"""
+        current_day = self._today()
+        if current_day != self._day:
+            self._entries.clear()
+            self._day = current_day
+
+    def _store(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """Возвращает значение по ключу, вычисляя его через compute() при промахе"""
+        return self.get_or_compute_many([key], lambda missing: [compute()])[0]
+
+    def get_or_compute_many(self, keys, compute_missing):
+        """Возвращает значения для списка ключей.
+
+        compute_missing(missing_keys) вызывается один раз для всех ключей,
+        которых нет в кэше и которые никто сейчас не считает, и должна
+        вернуть список значений в том же порядке.
+        """
+        results = {}
+        waiting = {}
+        owned = []
+
+        with self._lock:
+            self._expire_if_new_day()
+            for key in keys:
+                if key in results or key in waiting or key in owned:
+                    continue
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    results[key] = self._entries[key]
+                    self.hits += 1
+                elif key in self._inflight:
+                    waiting[key] = self._inflight[key]
+                    self.hits += 1
+                else:
+                    self._inflight[key] = Future()
+                    owned.append(key)
+                    self.misses += 1
+
+        if owned:
+            try:
+                values = list(compute_missing(owned))
+                if len(values) != len(owned):
+                    raise ValueError(f"Ожидалось {len(owned)} значений, получено {len(values)}")
+            except BaseException as e:
+                with self._lock:
+                    for key in owned:
+                        self._inflight.pop(key).set_exception(e)
+                raise
+
+            with self._lock:
+                self._expire_if_new_day()
+                for key, value in zip(owned, values):
+                    self._store(key, value)
+                    self._inflight.pop(key).set_result(value)
+                    results[key] = value
+
+        for key, future in waiting.items():
+            results[key] = future.result()
+
+        return [results[key] for key in keys]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
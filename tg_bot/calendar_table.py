@@ -0,0 +1,149 @@
+# calendar_table.py - ТАБЛИЦА КАЛЕНДАРНЫХ ПРОГНОЗОВ
+#
+# Без настоящей истории входы модели в боте - функция (час, день недели,
+# месяц) плюс шум генератора EDA (REAL_HOURLY_AVERAGES, SEASONAL_FACTORS,
+# WEEKEND_FACTOR). Поэтому базовый прогноз можно посчитать заранее: для
+# каждой из 12 × 7 × 24 ячеек календаря модель прогоняется на K сценариях
+# входов, в таблицу идут среднее, разброс и перцентили. Ответ бота на
+# "завтра" без истории - чтение строки таблицы вместо сборки признаков
+# и model.predict.
+#
+# Таблица строится для конкретной версии модели (версия из реестра или хэш
+# файла модели) и лежит в models/calendar/<версия>.npy (+ .json с
+# параметрами сборки); бот загружает ее вместе с моделью.
+#   python tg_bot/calendar_table.py --scenarios 500
+#   python tg_bot/calendar_table.py --version 20250101-120000-lightgbm
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+import config
+
+FIELDS = ('mean', 'std', 'p10', 'p50', 'p90')
+# Месяц × день недели (пн=0) × час × поле
+TABLE_SHAPE = (12, 7, 24, len(FIELDS))
+
+
+def reference_dates(year=2024):
+    """Дата для каждой ячейки (месяц, день недели): первый такой день недели в месяце"""
+    dates = []
+    for month in range(1, 13):
+        first = datetime(year, month, 1)
+        dates.extend(first.replace(day=1 + (day_of_week - first.weekday()) % 7) for day_of_week in range(7))
+    return dates
+
+
+def build_table(predict, feature_columns, feature_names, scenarios=500):
+    """Статистики прогноза по сценариям для всех ячеек календаря.
+
+    predict(matrix) - прогноз модели; feature_columns(dates, scenarios) - признаки
+    {имя: массив} со строками (сценарий, день, час), как create_feature_columns в боте.
+    Месяцы считаются по одному, чтобы матрица оставалась в пределах десятков МБ.
+    """
+    from features import feature_matrix
+
+    table = np.empty(TABLE_SHAPE, dtype=np.float32)
+    dates = reference_dates()
+    for month in range(12):
+        month_dates = dates[month * 7:(month + 1) * 7]
+        matrix = feature_matrix(feature_columns(month_dates, scenarios), feature_names)
+        # Те же границы, что у прогноза в боте
+        samples = np.clip(predict(matrix), 0.1, 7.0).reshape(scenarios, 7, 24)
+        table[month, ..., FIELDS.index('mean')] = samples.mean(axis=0)
+        table[month, ..., FIELDS.index('std')] = samples.std(axis=0)
+        for field, percentile in (('p10', 10), ('p50', 50), ('p90', 90)):
+            table[month, ..., FIELDS.index(field)] = np.percentile(samples, percentile, axis=0)
+    return table
+
+
+class CalendarTable:
+    """Прогнозы модели по ячейкам (месяц, день недели, час)"""
+
+    def __init__(self, values, meta=None):
+        if values.shape != TABLE_SHAPE:
+            raise ValueError(f"Таблица формы {values.shape}, ожидается {TABLE_SHAPE}")
+        self.values = values
+        self.meta = meta or {}
+
+    @staticmethod
+    def paths(version, directory=None):
+        prefix = os.path.join(directory or config.CALENDAR_TABLE_DIR, version)
+        return prefix + '.npy', prefix + '.json'
+
+    @classmethod
+    def open(cls, version, directory=None, scenarios=None, seed=None):
+        """Таблица версии модели или None, если ее еще не строили.
+
+        С scenarios/seed таблица, собранная с другими параметрами, тоже не
+        загружается: ее перцентили не совпали бы с прогнозом по сценариям.
+        """
+        values_path, meta_path = cls.paths(version, directory)
+        if not os.path.exists(values_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        expected = {'scenarios': scenarios, 'seed': seed}
+        stale = {name: meta.get(name) for name, value in expected.items()
+                 if value is not None and meta.get(name) != value}
+        if stale:
+            print(f"⚠️ Таблица календаря {version} собрана с {stale}, ожидается {expected} - не используется")
+            return None
+        return cls(np.load(values_path), meta)
+
+    def save(self, version, directory=None):
+        values_path, meta_path = self.paths(version, directory)
+        os.makedirs(os.path.dirname(values_path), exist_ok=True)
+        # Сначала метаданные, потом массив: open() проверяет наличие .npy
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False, indent=2)
+        os.replace(meta_path + '.tmp', meta_path)
+        with open(values_path + '.tmp', 'wb') as f:
+            np.save(f, self.values)
+        os.replace(values_path + '.tmp', values_path)
+        return values_path
+
+    def lookup(self, target_dates, field='mean'):
+        """Прогноз (дни × 24) для списка дат"""
+        months = [d.month - 1 for d in target_dates]
+        days_of_week = [d.weekday() for d in target_dates]
+        return self.values[months, days_of_week, :, FIELDS.index(field)]
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Таблица прогнозов модели по ячейкам календаря')
+    parser.add_argument('--version', default=None, help='Версия из реестра (по умолчанию - та, что загрузит бот)')
+    parser.add_argument('--scenarios', type=int, default=config.FORECAST_SCENARIOS)
+    parser.add_argument('--seed', type=int, default=config.FORECAST_SCENARIO_SEED)
+    parser.add_argument('--output-dir', default=config.CALENDAR_TABLE_DIR)
+    args = parser.parse_args()
+
+    # Признаки и генератор входов - те же функции, что у бота (импорт бота не загружает модель)
+    import bot
+
+    model = bot.load_model(args.version)
+    # Генератор без истории и сохраненных прогнозов: только календарь и шум EDA
+    generator = bot.RealisticDataGenerator(args.seed)
+    started = time.perf_counter()
+    values = build_table(model.engine.predict,
+                         lambda dates, scenarios: bot.create_feature_columns(dates, generator, scenarios,
+                                                                             model.feature_names),
+                         model.feature_names, args.scenarios)
+    table = CalendarTable(values, {'version': model.version, 'fields': list(FIELDS),
+                                   'scenarios': args.scenarios, 'seed': args.seed,
+                                   'created': datetime.now().isoformat(timespec='seconds')})
+    path = table.save(model.version, args.output_dir)
+    print(f"✅ Таблица для модели {model.version}: {12 * 7 * 24} ячеек × {args.scenarios} сценариев "
+          f"за {time.perf_counter() - started:.1f} с")
+    print(f"💾 {path} ({table.nbytes // 1024} КБ)")
+
+
+if __name__ == "__main__":
+    main()
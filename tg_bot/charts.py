@@ -0,0 +1,183 @@
+# charts.py - БЫСТРАЯ ОТРИСОВКА ГРАФИКОВ ПРОГНОЗА
+#
+# Вместо новой pyplot-фигуры на каждый запрос каждая фигура строится один
+# раз: оси, зоны пиков, кривая средних из EDA и сетка рисуются в фон и
+# запоминаются. На запрос фон восстанавливается, поверх рисуются только
+# линии прогноза, легенда и заголовок, и буфер кодируется в PNG.
+#
+# Фигуры matplotlib нельзя рисовать из нескольких потоков одновременно,
+# поэтому у каждого потока свой набор фигур (threading.local).
+# matplotlib импортируется при построении первой фигуры, а не при импорте модуля.
+import io
+import threading
+
+import numpy as np
+
+HOURS = np.arange(24)
+
+# Зоны из EDA: (начало, конец, цвет, подпись)
+PEAK_ZONES = [
+    (0, 5, 'blue', 'Ночное время (0-5)'),
+    (7, 9, 'orange', 'Утренний пик (7-9)'),
+    (18, 22, 'red', 'Вечерний пик (18-22)'),
+]
+
+# Прогнозы обрезаются до 7 кВт, поэтому шкала фиксирована и фон не меняется
+Y_LIMITS = (0, 8)
+
+
+class ChartTemplate:
+    """Фигура с готовым фоном; на каждый запрос меняются только данные линий и подписи"""
+
+    def __init__(self, figure, lines, texts, legend, patches=()):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.figure = figure
+        self.canvas = FigureCanvasAgg(figure)
+        self.lines = lines
+        self.texts = texts
+        self.legend = legend
+        # patches - прочие изменяемые элементы (полосы), их данные задает вызывающий код
+        self.patches = list(patches)
+        self.dynamic = [*self.patches, *lines, *texts, legend]
+
+        # Фон рисуется один раз без изменяемых элементов (у подписей - пустой текст,
+        # чтобы положение заголовка над осями считалось как обычно)
+        figure.tight_layout()
+        for artist in [*self.patches, *lines, legend]:
+            artist.set_visible(False)
+        for text in texts:
+            text.set_text('')
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(figure.bbox)
+        for artist in [*self.patches, *lines, legend]:
+            artist.set_visible(True)
+
+    def render(self, series, texts):
+        """series - значения по y для каждой линии, texts - новые подписи; возвращает RGBA-массив"""
+        for line, values in zip(self.lines, series):
+            line.set_ydata(values)
+        for artist, text in zip(self.texts, texts):
+            artist.set_text(text)
+        for handle_text, line in zip(self.legend.get_texts(), self.lines):
+            handle_text.set_text(line.get_label())
+
+        self.canvas.restore_region(self.background)
+        for artist in self.dynamic:
+            artist.axes.draw_artist(artist)
+        return np.asarray(self.canvas.buffer_rgba())
+
+
+def encode_png(rgba, compact=False):
+    """RGBA-буфер -> PNG. compact=True - палитра из 64 цветов: в 2-3 раза меньше байт"""
+    from PIL import Image
+
+    height, width = rgba.shape[:2]
+    image = Image.frombuffer('RGBA', (width, height), rgba, 'raw', 'RGBA', 0, 1).convert('RGB')
+    buf = io.BytesIO()
+    if compact:
+        image.quantize(colors=64, method=Image.Quantize.FASTOCTREE).save(buf, format='PNG', compress_level=6)
+    else:
+        image.save(buf, format='PNG', compress_level=1)
+    return buf.getvalue()
+
+
+class ChartRenderer:
+    """Графики прогноза; безопасно вызывать из рабочих потоков"""
+
+    def __init__(self, baseline, compact=False, dpi=100):
+        self.baseline = np.asarray(baseline, dtype=float)
+        self.compact = compact
+        self.dpi = dpi
+        self._local = threading.local()
+
+    def _template(self, name, build):
+        templates = self._local.__dict__.setdefault('templates', {})
+        if name not in templates:
+            templates[name] = build()
+        return templates[name]
+
+    def _build_comparison(self):
+        from matplotlib.figure import Figure
+
+        figure = Figure(figsize=(14, 8), dpi=self.dpi)
+        ax = figure.add_subplot()
+
+        # Реальные средние значения из EDA и зоны пиков - статичный фон
+        ax.plot(HOURS, self.baseline, 'g--', linewidth=2, label='Реальные средние из EDA', alpha=0.6)
+        for start, end, color, label in PEAK_ZONES:
+            ax.axvspan(start, end, alpha=0.15, color=color, label=label)
+        ax.set_title('Сравнение прогнозов энергопотребления\n(Честная оценка работы модели)',
+                     fontsize=14, fontweight='bold')
+        ax.set_xlabel('Час дня', fontsize=12)
+        ax.set_ylabel('Нагрузка (кВт)', fontsize=12)
+        ax.grid(True, alpha=0.3)
+        ax.set_xticks(range(0, 24, 2))
+        ax.set_ylim(*Y_LIMITS)
+
+        # Линии прогнозов - обновляются на каждый запрос
+        first, = ax.plot(HOURS, self.baseline, 'b-', linewidth=3, marker='o', markersize=4,
+                         label='Завтра', alpha=0.8)
+        second, = ax.plot(HOURS, self.baseline, 'r-', linewidth=3, marker='s', markersize=4,
+                          label='Послезавтра', alpha=0.8)
+        handles = [first, second, *ax.get_lines()[:1], *ax.patches]
+        legend = ax.legend(handles=handles, loc='upper left')
+        return ChartTemplate(figure, [first, second], [], legend)
+
+    def _build_single(self):
+        from matplotlib.figure import Figure
+
+        figure = Figure(figsize=(12, 6), dpi=self.dpi)
+        ax = figure.add_subplot()
+        ax.plot(HOURS, self.baseline, 'r--', label='Реальные средние')
+        ax.grid(True, alpha=0.3)
+        ax.set_xlim(-1.15, 24.15)
+        ax.set_ylim(*Y_LIMITS)
+
+        forecast, = ax.plot(HOURS, self.baseline, 'b-', linewidth=2, marker='o', label='Прогноз ML')
+        # Заголовок-заготовка нужен, чтобы tight_layout оставил под него место
+        title = ax.set_title('Прогноз на 01.01.2000 (понедельник)')
+        legend = ax.legend(handles=[forecast, *ax.get_lines()[:1]], loc='upper left')
+        return ChartTemplate(figure, [forecast], [title], legend)
+
+    def _build_bands(self):
+        from matplotlib.figure import Figure
+
+        figure = Figure(figsize=(12, 6), dpi=self.dpi)
+        ax = figure.add_subplot()
+        ax.plot(HOURS, self.baseline, 'r--', label='Реальные средние')
+        ax.grid(True, alpha=0.3)
+        ax.set_xlim(-1.15, 24.15)
+        ax.set_ylim(*Y_LIMITS)
+        ax.set_xlabel('Час дня')
+        ax.set_ylabel('Нагрузка (кВт)')
+
+        # Полоса P10-P90: многоугольник, вершины которого меняются на каждый запрос
+        band = ax.fill_between(HOURS, self.baseline, self.baseline, color='blue', alpha=0.2,
+                               linewidth=0, label='P10-P90')
+        median, = ax.plot(HOURS, self.baseline, 'b-', linewidth=2, marker='o', label='Медиана (P50)')
+        title = ax.set_title('Диапазон прогноза на 01.01.2000 (понедельник)')
+        legend = ax.legend(handles=[median, band, *ax.get_lines()[:1]], loc='upper left')
+        return ChartTemplate(figure, [median], [title], legend, patches=[band])
+
+    def comparison_png(self, predictions_a, predictions_b, label_a, label_b):
+        """PNG сравнения двух прогнозов по 24 часам"""
+        template = self._template('comparison', self._build_comparison)
+        first, second = template.lines
+        first.set_label(f'Завтра ({label_a})')
+        second.set_label(f'Послезавтра ({label_b})')
+        return encode_png(template.render([predictions_a, predictions_b], []), self.compact)
+
+    def single_png(self, predictions, title):
+        """PNG прогноза на один день"""
+        template = self._template('single', self._build_single)
+        return encode_png(template.render([predictions], [title]), self.compact)
+
+    def bands_png(self, p10, p50, p90, title):
+        """PNG вероятностного прогноза: медиана и полоса P10-P90"""
+        template = self._template('bands', self._build_bands)
+        band, = template.patches
+        upper = np.column_stack([HOURS, np.asarray(p90, dtype=float)])
+        lower = np.column_stack([HOURS, np.asarray(p10, dtype=float)])[::-1]
+        band.set_verts([np.concatenate([upper, lower])])
+        return encode_png(template.render([p50], [title]), self.compact)
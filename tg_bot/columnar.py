@@ -0,0 +1,60 @@
+# columnar.py - КОЛОНОЧНОЕ БИНАРНОЕ ХРАНИЛИЩЕ
+#
+# Каталог: <колонка>.bin (сырые значения в своем dtype) + meta.json.
+# Индекс datetime хранится колонкой 'datetime' (datetime64[s]).
+# Колонки открываются через memory-map: загрузка не зависит от размера файла.
+import json
+import os
+
+import numpy as np
+
+
+def write_store(chunks, directory, meta=None):
+    """Дописывает куски DataFrame (индекс datetime) в хранилище, возвращает число строк"""
+    os.makedirs(directory, exist_ok=True)
+    files = {}
+    dtypes = {}
+    n_rows = 0
+    try:
+        for chunk in chunks:
+            if not files:
+                dtypes = {col: str(dtype) for col, dtype in chunk.dtypes.items()}
+                dtypes['datetime'] = 'datetime64[s]'
+                files = {col: open(os.path.join(directory, col + '.bin'), 'wb') for col in dtypes}
+            files['datetime'].write(chunk.index.values.astype('datetime64[s]').tobytes())
+            for col in chunk.columns:
+                files[col].write(np.ascontiguousarray(chunk[col].values).tobytes())
+            n_rows += len(chunk)
+    finally:
+        for f in files.values():
+            f.close()
+
+    write_meta(directory, {**(meta or {}), 'n_rows': n_rows, 'dtypes': dtypes})
+    return n_rows
+
+
+def read_meta(directory):
+    with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_meta(directory, meta):
+    with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def open_store(directory, mode='r'):
+    """Открывает все колонки через memory-map: {колонка: массив}"""
+    meta = read_meta(directory)
+    return {col: np.memmap(os.path.join(directory, col + '.bin'), dtype=dtype, mode=mode,
+                           shape=(meta['n_rows'],))
+            for col, dtype in meta['dtypes'].items()}
+
+
+def load_frame(directory):
+    """Хранилище как DataFrame с индексом datetime"""
+    import pandas as pd
+
+    columns = open_store(directory)
+    index = pd.DatetimeIndex(np.asarray(columns.pop('datetime')), name='datetime')
+    return pd.DataFrame({col: np.asarray(values) for col, values in columns.items()}, index=index)
@@ -2,20 +2,76 @@
 import os
 from dotenv import load_dotenv
 
-load_dotenv()
+# Все пути считаются от корня проекта, а не от текущей директории
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+load_dotenv(os.path.join(BASE_DIR, '.env'))
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 
-if not BOT_TOKEN:
-    raise ValueError("❌ BOT_TOKEN не найден в .env файле!")
-
 # Пути к моделям
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 FEATURE_NAMES_PATH = os.path.join(BASE_DIR, 'models', 'feature_names.json')
 MODEL_PATHS = {
     'lightgbm': os.path.join(BASE_DIR, 'models', 'lightgbm_best_model.pkl')
 }
 
+# Реестр версий моделей (python tg_bot/registry.py): активная версия - в versions/CURRENT.
+# Бот раз в MODEL_WATCH_INTERVAL секунд проверяет, не сменилась ли она (0 - не следить)
+MODEL_REGISTRY_DIR = os.path.join(BASE_DIR, 'models', 'versions')
+MODEL_WATCH_INTERVAL = float(os.getenv('MODEL_WATCH_INTERVAL', '5'))
+
+# Telegram id администраторов через запятую: им доступны /reload, /models, /compare_models
+ADMIN_IDS = {int(value) for value in os.getenv('ADMIN_IDS', '').split(',') if value.strip()}
+
+# Почасовая история потребления (python tg_bot/history.py df/obr.csv df/history_hourly)
+HISTORY_PREFIX = os.path.join(BASE_DIR, 'df', 'history_hourly')
+
+# Выданные прогнозы (для лагов и оценки точности): лимит памяти и, по желанию,
+# файлы на диске (FORECAST_STORE_PREFIX=df/forecasts), чтобы пережить перезапуск
+FORECAST_STORE_MAX_BYTES = int(os.getenv('FORECAST_STORE_MAX_BYTES', str(256 * 1024)))
+FORECAST_STORE_PREFIX = os.getenv('FORECAST_STORE_PREFIX')
+if FORECAST_STORE_PREFIX and not os.path.isabs(FORECAST_STORE_PREFIX):
+    FORECAST_STORE_PREFIX = os.path.join(BASE_DIR, FORECAST_STORE_PREFIX)
+
+# Вероятностный прогноз: число сценариев входов и seed их генератора
+FORECAST_SCENARIOS = int(os.getenv('FORECAST_SCENARIOS', '500'))
+FORECAST_SCENARIO_SEED = int(os.getenv('FORECAST_SCENARIO_SEED', '42'))
+
+# Таблица календарных прогнозов (python tg_bot/calendar_table.py): по файлу на версию модели.
+# Без настоящей истории прогноз на дату берется из таблицы; CALENDAR_TABLE=0 - всегда считать моделью
+CALENDAR_TABLE_DIR = os.path.join(BASE_DIR, 'models', 'calendar')
+CALENDAR_TABLE_ENABLED = os.getenv('CALENDAR_TABLE', '1') != '0'
+
+# Пакетный прогноз по загруженным выгрузкам домохозяйств (CSV/ZIP в схеме df/obr.csv).
+# Bot API отдает боту файлы не больше 20 МБ
+HOUSEHOLD_UPLOAD_MAX_BYTES = int(os.getenv('HOUSEHOLD_UPLOAD_MAX_BYTES', str(20 * 1024 * 1024)))
+
+# Сводка бэктеста по истории (python tg_bot/backtest.py), ее читает /stats
+BACKTEST_SUMMARY_PATH = os.path.join(BASE_DIR, 'models', 'backtest_summary.json')
+
+# Печать прогноза по каждому часу (отладка, 25 строк на дату): по умолчанию выключена,
+# DEBUG_HOURLY_LOG=1 включает
+DEBUG_HOURLY_LOG = os.getenv('DEBUG_HOURLY_LOG', '0') != '0'
+
+# Метрики в формате Prometheus: HTTP-порт (/metrics) и/или файл, перезаписываемый раз в интервал
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_DUMP_PATH = os.getenv('METRICS_DUMP_PATH')
+METRICS_DUMP_INTERVAL = float(os.getenv('METRICS_DUMP_INTERVAL', '60'))
+
+# Прием обновлений: WEBHOOK_URL (публичный https-адрес для Telegram) включает webhook вместо
+# long polling; локальный сервер слушает WEBHOOK_HOST:WEBHOOK_PORT (снаружи - reverse proxy с TLS)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Соединений с Bot API в общем keep-alive пуле (0 - по числу потоков обработки + 2)
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '0'))
+
+# Ограничение частоты по чатам (token bucket): запросов в минуту и сколько можно подряд; 0 - без ограничения
+RATE_LIMIT_PER_MINUTE = float(os.getenv('RATE_LIMIT_PER_MINUTE', '30'))
+RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', '6'))
+
 # Настройки бота
 BOT_CONFIG = {
     'parse_mode': 'Markdown',
@@ -24,9 +80,25 @@ BOT_CONFIG = {
 
 # Функция для проверки конфигурации
 def check_config():
-    """Проверяет что все настройки загружены корректно"""
+    """Проверяет что все настройки загружены корректно; возвращает список доступных моделей"""
+    if not BOT_TOKEN:
+        print("❌ BOT_TOKEN не найден в .env файле!")
+        return []
     print(f"🔧 Конфигурация загружена. Токен: {BOT_TOKEN[:15]}...")
-    
+
+    if not os.path.exists(FEATURE_NAMES_PATH):
+        print(f"❌ Список признаков не найден ({FEATURE_NAMES_PATH})")
+        return []
+
+    # Активная версия из реестра важнее модели по умолчанию
+    current_path = os.path.join(MODEL_REGISTRY_DIR, 'CURRENT')
+    if os.path.exists(current_path):
+        with open(current_path, 'r', encoding='utf-8') as f:
+            version = f.read().strip()
+        if version:
+            print(f"✅ Активная версия модели из реестра: {version}")
+            return [version]
+
     # Проверяем только LightGBM (остальные не используем)
     model_path = MODEL_PATHS['lightgbm']
     if os.path.exists(model_path):
@@ -35,5 +107,3 @@ def check_config():
     else:
         print(f"❌ LightGBM модель не найдена ({model_path})")
         return []
-
-print("Конфигурация загружена. Токен:", BOT_TOKEN[:5] + "..." if BOT_TOKEN else "НЕ НАЙДЕН")
\ No newline at end of file
@@ -0,0 +1,94 @@
+# dispatcher.py - ПАРАЛЛЕЛЬНАЯ ОБРАБОТКА ЗАПРОСОВ С СОХРАНЕНИЕМ ПОРЯДКА В ЧАТЕ
+#
+# Обработчики бота (признаки, model.predict, график, отправка) выполняются в
+# ограниченном пуле потоков. У каждого чата своя очередь: его задачи идут
+# строго по порядку, задачи разных чатов - параллельно. Очередь ограничена,
+# при переполнении submit сразу возвращает False и бот отвечает "занят".
+import os
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ChatDispatcher:
+    """Пул потоков с очередью на каждый чат и ограничением глубины очереди"""
+
+    def __init__(self, max_workers=None, max_pending=None, max_per_chat=3):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.max_workers * 4
+        self.max_per_chat = max_per_chat
+        self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='chat')
+        # chat_id -> задачи чата; первая в очереди сейчас выполняется
+        self._queues = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, chat_id, task, *args, **kwargs):
+        """Ставит задачу в очередь чата; False - очередь переполнена, задача не принята"""
+        with self._lock:
+            queue = self._queues.get(chat_id)
+            if self._pending >= self.max_pending or (queue and len(queue) >= self.max_per_chat):
+                self.rejected += 1
+                return False
+            self._pending += 1
+            if queue:
+                queue.append((task, args, kwargs))
+                return True
+            self._queues[chat_id] = deque([(task, args, kwargs)])
+
+        self._executor.submit(self._run_next, chat_id)
+        return True
+
+    def _run_next(self, chat_id):
+        """Выполняет первую задачу чата, следующую ставит в конец общего пула"""
+        with self._lock:
+            task, args, kwargs = self._queues[chat_id][0]
+        try:
+            task(*args, **kwargs)
+        except Exception:
+            traceback.print_exc()
+
+        with self._lock:
+            queue = self._queues[chat_id]
+            queue.popleft()
+            self._pending -= 1
+            self.completed += 1
+            if not queue:
+                del self._queues[chat_id]
+                if not self._pending:
+                    self._idle.notify_all()
+                return
+        # Поток не держится за чат: остальные чаты тоже получают свою очередь
+        self._executor.submit(self._run_next, chat_id)
+
+    @property
+    def pending(self):
+        """Сколько задач принято и еще не завершено"""
+        return self._pending
+
+    def run_on_workers(self, task, timeout=60):
+        """Запускает task по одному разу в каждом потоке пула (прогрев); возвращает futures"""
+        barrier = threading.Barrier(self.max_workers, timeout=timeout)
+
+        def run():
+            # Пока все задачи не встретились на барьере, ни один поток не освободится,
+            # поэтому каждая задача попадает в свой поток
+            barrier.wait()
+            return task()
+
+        return [self._executor.submit(run) for _ in range(self.max_workers)]
+
+    def join(self, timeout=None):
+        """Ждет, пока не будут выполнены все принятые задачи; False - не дождались"""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending, timeout)
+
+    def shutdown(self, wait=True):
+        """Останавливает пул; wait=True - сначала дожидается всех принятых задач"""
+        if wait:
+            self.join()
+        self._executor.shutdown(wait=wait)
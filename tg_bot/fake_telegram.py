@@ -0,0 +1,185 @@
+# fake_telegram.py - ЛОКАЛЬНАЯ ЗАГЛУШКА TELEGRAM BOT API
+#
+# HTTP-сервер на 127.0.0.1, который отвечает на методы Bot API так, как это
+# нужно telebot: sendMessage/sendPhoto возвращают сообщение, остальные - true.
+# Все вызовы записываются, задержку сети можно имитировать. Бенчмарки и
+# проверки бота работают без интернета и без настоящего токена.
+# Файлы для getFile/download_file (загрузки пользователей) кладутся через add_file.
+# Как Telegram в режиме webhook, заглушка умеет сама слать обновления боту (deliver);
+# connections - сколько TCP-соединений открыл бот (проверка keep-alive пула).
+#   server = FakeTelegramServer(latency=0.02).start()
+#   server.install()   # telebot отправляет запросы на заглушку
+#   file_id = server.add_file(b'datetime,...', 'site.csv')
+#   server.deliver('http://127.0.0.1:8443/telegram', updates, secret='...')
+import http.client
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+MESSAGE_METHODS = {'sendMessage', 'sendPhoto', 'sendDocument', 'editMessageText', 'editMessageMedia'}
+
+
+class FakeTelegramServer:
+    """Заглушка Bot API: записывает вызовы (метод, chat_id, размер тела)"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        self.latency = latency
+        self.calls = []
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self.updates = []
+        self.files = {}
+        self.connections = 0
+        self.webhook_url = None
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Заголовки и тело уходят одним пакетом, без задержек алгоритма Нейгла
+            disable_nagle_algorithm = True
+            wbufsize = 1 << 16
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def do_GET(self):
+                self._reply()
+
+            def do_POST(self):
+                self._reply()
+
+            def _reply(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                url = urlparse(self.path)
+                if url.path.startswith('/file/'):
+                    self._send(fake.files.get(url.path.rsplit('/', 1)[-1], b''), 'application/octet-stream')
+                    return
+                method = url.path.rsplit('/', 1)[-1]
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+                    params.update({key: values[-1] for key, values in parse_qs(body.decode()).items()})
+
+                result = fake.handle(method, params, len(body))
+                self._send(json.dumps({'ok': True, 'result': result}).encode(), 'application/json')
+
+            def _send(self, payload, content_type):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def handle(self, method, params, body_size):
+        """Ответ на вызов метода Bot API"""
+        if self.latency:
+            time.sleep(self.latency)
+        chat_id = params.get('chat_id')
+        with self._lock:
+            self.calls.append({'method': method, 'chat_id': chat_id, 'bytes': body_size, 'time': time.time()})
+            if method == 'getUpdates':
+                updates, self.updates = self.updates, []
+                return updates
+            if method == 'setWebhook':
+                self.webhook_url = params.get('url')
+            if method == 'deleteWebhook':
+                self.webhook_url = None
+            if method == 'getFile':
+                file_id = params.get('file_id')
+                return {'file_id': file_id, 'file_unique_id': file_id,
+                        'file_size': len(self.files.get(file_id, b'')), 'file_path': file_id}
+            if method == 'getMe':
+                return {'id': 1, 'is_bot': True, 'first_name': 'fake', 'username': 'fake_bot'}
+            if method in MESSAGE_METHODS:
+                self._message_id += 1
+                return {'message_id': self._message_id, 'date': int(time.time()),
+                        'chat': {'id': int(chat_id or 0), 'type': 'private'}}
+        return True
+
+    def add_file(self, data, name='file'):
+        """Файл, который бот скачает через getFile; возвращает file_id"""
+        with self._lock:
+            file_id = f"{len(self.files) + 1}-{name}"
+            self.files[file_id] = data
+            return file_id
+
+    def deliver(self, url, updates, secret=None, connections=1):
+        """Шлет обновления POST-запросами на webhook бота, как Telegram; возвращает коды ответов.
+
+        connections - сколько keep-alive соединений параллельно (max_connections у Telegram).
+        """
+        target = urlparse(url)
+        statuses = [None] * len(updates)
+
+        def send(indexes):
+            conn = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+            try:
+                for i in indexes:
+                    headers = {'Content-Type': 'application/json'}
+                    if secret:
+                        headers[SECRET_HEADER] = secret
+                    conn.request('POST', target.path or '/', json.dumps(updates[i]), headers)
+                    response = conn.getresponse()
+                    response.read()
+                    statuses[i] = response.status
+            finally:
+                conn.close()
+
+        threads = [threading.Thread(target=send, args=(range(k, len(updates), connections),))
+                   for k in range(connections)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-telegram', daemon=True)
+        self._thread.start()
+        return self
+
+    def install(self):
+        """Перенаправляет запросы telebot на заглушку"""
+        from telebot import apihelper
+
+        apihelper.API_URL = self.url + '/bot{0}/{1}'
+        apihelper.FILE_URL = self.url + '/file/bot{0}/{1}'
+        return self
+
+    def stop(self):
+        from telebot import apihelper
+
+        if apihelper.API_URL and apihelper.API_URL.startswith(self.url):
+            apihelper.API_URL = None
+        if apihelper.FILE_URL and apihelper.FILE_URL.startswith(self.url):
+            apihelper.FILE_URL = None
+        self._server.shutdown()
+        self._server.server_close()
+
+    def methods(self):
+        """Сколько раз вызывался каждый метод"""
+        with self._lock:
+            counts = {}
+            for call in self.calls:
+                counts[call['method']] = counts.get(call['method'], 0) + 1
+            return counts
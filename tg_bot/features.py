@@ -0,0 +1,293 @@
+# features.py - ОБЩИЕ ОПРЕДЕЛЕНИЯ ПРИЗНАКОВ ДЛЯ ОБУЧЕНИЯ И БОТА
+#
+# Календарные признаки и взаимодействия лагов - чистые функции часа, дня
+# недели и месяца. Все функции принимают numpy-массивы и считают признаки
+# сразу для всех строк.
+#
+# Для обучения CSV со схемой df/obr.csv читается кусками и сводится к
+# часовой сетке (resample.py), признаки пишутся в компактных типах
+# (int8 флаги, float32 значения) в колоночное хранилище:
+# одна колонка = один бинарный файл, открывается через memory-map.
+#   python tg_bot/features.py df/obr.csv df/features [--interval 1h]
+import argparse
+import os
+
+import numpy as np
+
+from columnar import load_frame, open_store, read_meta, write_store
+from history import LAG_HOURS, ROLLING_END_LAG, ROLLING_SCALE, ROLLING_WINDOWS
+from ingest import source_signature
+from resample import DEFAULT_INTERVAL, hours_to_steps, read_obr_chunks, resample_chunks
+
+TARGET = 'Global_active_power'
+
+
+def context_rows(interval=DEFAULT_INTERVAL):
+    """Сколько предыдущих строк нужно, чтобы посчитать лаги и окна на границе куска"""
+    return max(hours_to_steps(max(LAG_HOURS.values()), interval),
+               hours_to_steps(max(ROLLING_WINDOWS.values()) + ROLLING_END_LAG - 1, interval))
+
+
+def flag(mask):
+    """Булева маска -> признак 0/1"""
+    return np.asarray(mask).astype(int)
+
+
+def selected(columns, names=None):
+    """Считает только нужные признаки: columns - {имя: функция без аргументов}, names - None (все) или список"""
+    names = None if names is None else set(names)
+    return {name: column() for name, column in columns.items() if names is None or name in names}
+
+
+def calendar_features(hour, day_of_week, month, names=None):
+    """Календарные признаки из EDA для массивов час/день недели/месяц (names - только эти)"""
+    hour = np.asarray(hour)
+    day_of_week = np.asarray(day_of_week)
+    month = np.asarray(month)
+
+    is_evening_peak = (hour >= 18) & (hour <= 22)
+    is_morning_peak = (hour >= 7) & (hour <= 9)
+    is_weekend = day_of_week >= 5
+    is_winter = np.isin(month, [12, 1, 2])
+    is_summer = np.isin(month, [6, 7, 8])
+
+    return selected({
+        # 1. ЦИКЛИЧЕСКИЕ ПРИЗНАКИ
+        'hour_sin': lambda: np.sin(2 * np.pi * hour / 24),
+        'hour_cos': lambda: np.cos(2 * np.pi * hour / 24),
+        'month_sin': lambda: np.sin(2 * np.pi * month / 12),
+        'month_cos': lambda: np.cos(2 * np.pi * month / 12),
+        'day_of_week_sin': lambda: np.sin(2 * np.pi * day_of_week / 7),
+        'day_of_week_cos': lambda: np.cos(2 * np.pi * day_of_week / 7),
+
+        # 2. СУТОЧНЫЕ ПАТТЕРНЫ ИЗ EDA
+        'is_early_morning': lambda: flag((hour >= 4) & (hour <= 6)),
+        'is_midday': lambda: flag((hour >= 10) & (hour <= 16)),
+        'is_late_evening': lambda: flag((hour >= 21) & (hour <= 23)),
+        'is_evening_peak': lambda: flag(is_evening_peak),
+        'is_morning_peak': lambda: flag(is_morning_peak),
+        'is_night': lambda: flag(hour <= 5),
+        'is_deep_night': lambda: flag((hour >= 1) & (hour <= 4)),
+
+        # 3. НЕДЕЛЬНЫЕ ПАТТЕРНЫ ИЗ EDA
+        'is_monday': lambda: flag(day_of_week == 0),
+        'is_friday': lambda: flag(day_of_week == 4),
+        'is_sunday': lambda: flag(day_of_week == 6),
+        'is_week_start': lambda: flag(np.isin(day_of_week, [0, 1])),
+        'is_week_end': lambda: flag(np.isin(day_of_week, [4, 5])),
+        'weekend_evening_boost': lambda: flag(is_weekend & is_evening_peak),
+        'weekend_morning': lambda: flag(is_weekend & is_morning_peak),
+
+        # 4. СЕЗОННЫЕ ПАТТЕРНЫ ИЗ EDA
+        'is_high_season': lambda: flag(is_winter),
+        'is_low_season': lambda: flag(is_summer),
+        'is_spring': lambda: flag(np.isin(month, [3, 4, 5])),
+
+        # 5. КРИТИЧЕСКИЕ ПЕРЕХОДЫ ИЗ EDA
+        'morning_surge_6_7': lambda: flag((hour >= 6) & (hour <= 7)),
+        'evening_surge_17_18': lambda: flag((hour >= 17) & (hour <= 18)),
+        'evening_drop_22_23': lambda: flag((hour >= 22) & (hour <= 23)),
+
+        # 6. ВЗАИМОДЕЙСТВИЯ ПРИЗНАКОВ
+        'winter_evening': lambda: flag(is_winter & is_evening_peak),
+        # В model.ipynb summer_afternoon переопределяется на 13-17 ч - модель обучена на нем
+        'summer_afternoon': lambda: flag(is_summer & (hour >= 13) & (hour <= 17)),
+        'workday_evening': lambda: flag(~is_weekend & is_evening_peak),
+        'sunday_evening': lambda: flag((day_of_week == 6) & is_evening_peak),
+
+        # 10. БАЗОВЫЕ ПРИЗНАКИ
+        'hour': lambda: hour,
+        'day_of_week': lambda: day_of_week,
+        'month': lambda: month,
+        'is_weekend': lambda: flag(is_weekend),
+    }, names)
+
+
+# Взаимодействия лагов: признак -> лаг, на котором он построен
+LAG_INTERACTION_BASES = {
+    'lag_24h_morning': 'lag_same_day_24h',
+    'lag_24h_evening': 'lag_same_day_24h',
+    'lag_24h_night': 'lag_same_day_24h',
+    'lag_24h_weekend': 'lag_same_day_24h',
+    'lag_48h_morning': 'lag_48h_ago',
+    'lag_48h_evening': 'lag_48h_ago',
+    'lag_week_morning': 'lag_week_ago_168h',
+    'lag_week_evening': 'lag_week_ago_168h'
+}
+
+
+def lag_interactions(lag_24h, lag_48h, lag_168h, hour, day_of_week, names=None):
+    """Взаимодействия лагов с временными периодами (names - только эти)"""
+    hour = np.asarray(hour)
+    is_morning_peak = (hour >= 7) & (hour <= 9)
+    is_evening_peak = (hour >= 18) & (hour <= 22)
+    is_night = hour <= 5
+    is_weekend = np.asarray(day_of_week) >= 5
+
+    return selected({
+        'lag_24h_morning': lambda: lag_24h * is_morning_peak,
+        'lag_24h_evening': lambda: lag_24h * is_evening_peak,
+        'lag_24h_night': lambda: lag_24h * is_night,
+        'lag_24h_weekend': lambda: lag_24h * is_weekend,
+        'lag_48h_morning': lambda: lag_48h * is_morning_peak,
+        'lag_48h_evening': lambda: lag_48h * is_evening_peak,
+        'lag_week_morning': lambda: lag_168h * is_morning_peak,
+        'lag_week_evening': lambda: lag_168h * is_evening_peak
+    }, names)
+
+
+def submetering_features(sub_1, sub_2, sub_3):
+    """Доли и активность зон по показаниям суб-счетчиков (как в model.ipynb)"""
+    sub_1, sub_2, sub_3 = np.asarray(sub_1), np.asarray(sub_2), np.asarray(sub_3)
+    total = sub_1 + sub_2 + sub_3
+
+    return {
+        'kitchen_ratio': sub_1 / (total + 0.001),
+        'laundry_ratio': sub_2 / (total + 0.001),
+        'ac_heating_ratio': sub_3 / (total + 0.001),
+        'kitchen_active': flag(sub_1 > 0),
+        'laundry_active': flag(sub_2 > 0),
+        'ac_heating_active': flag(sub_3 > 0)
+    }
+
+
+def history_features(df, interval=DEFAULT_INTERVAL):
+    """Лаги и скользящие статистики без заполнения пропусков (NaN там, где истории нет)"""
+    import pandas as pd
+
+    power = df[TARGET].astype('float64')
+    features = {}
+
+    # ЛАГИ
+    for name, lag in LAG_HOURS.items():
+        features[name] = power.shift(hours_to_steps(lag, interval))
+
+    # СКОЛЬЗЯЩИЕ СТАТИСТИКИ БЕЗ УТЕЧЕК: shift(1).rolling(w).mean().shift(1)
+    past = power.shift(1)
+    end_shift = hours_to_steps(ROLLING_END_LAG - 1, interval)
+    for name, window in ROLLING_WINDOWS.items():
+        rolling = past.rolling(hours_to_steps(window, interval), min_periods=1).mean().shift(end_shift)
+        features[name] = rolling * ROLLING_SCALE.get(name, 1.0)
+    std_window = hours_to_steps(24, interval)
+    features['rolling_std_24h_past'] = past.rolling(std_window, min_periods=1).std().shift(end_shift)
+
+    return pd.DataFrame(features, index=df.index)
+
+
+HISTORY_COLUMNS = list(LAG_HOURS) + list(ROLLING_WINDOWS) + ['rolling_std_24h_past']
+
+
+def build_feature_frame(df, interval=DEFAULT_INTERVAL, context=None, last_history=None):
+    """Все признаки для DataFrame на регулярной сетке с шагом interval.
+
+    Лаги и окна задаются в часах и переводятся в строки сетки: при часовой
+    сетке lag_same_day_24h - это ровно 24 часа назад. Пропуски в лагах и окнах
+    заполняются предыдущим известным значением.
+    При расчете по кускам: context - хвост предыдущего куска (нужен лагам и
+    окнам, в результат не входит), last_history - заполненные лаги и окна на
+    последней строке предыдущего куска.
+    """
+    import pandas as pd
+
+    data = df if context is None else pd.concat([context, df])
+    history = history_features(data, interval).iloc[len(data) - len(df):]
+    if last_history is not None:
+        history = pd.concat([last_history.to_frame().T, history]).ffill().iloc[1:]
+    else:
+        history = history.ffill()
+
+    index = df.index
+    features = calendar_features(index.hour.values, index.dayofweek.values, index.month.values)
+    features.update({name: history[name].values for name in HISTORY_COLUMNS})
+    features.update(lag_interactions(features['lag_same_day_24h'], features['lag_48h_ago'],
+                                     features['lag_week_ago_168h'], features['hour'],
+                                     features['day_of_week']))
+
+    # СУБ-СЧЕТЧИКИ
+    features.update(submetering_features(df['Sub_metering_1'].values, df['Sub_metering_2'].values,
+                                         df['Sub_metering_3'].values))
+    features[TARGET] = df[TARGET].values
+
+    return compact_dtypes(pd.DataFrame(features, index=index))
+
+
+def compact_dtypes(frame):
+    """Целые и флаги -> int8, остальное -> float32"""
+    dtypes = {col: np.int8 if np.issubdtype(dtype, np.integer) or dtype == bool else np.float32
+              for col, dtype in frame.dtypes.items()}
+    return frame.astype(dtypes)
+
+
+def iter_feature_chunks(frames, interval=DEFAULT_INTERVAL):
+    """Признаки по кускам ряда на регулярной сетке с шагом interval.
+
+    Каждый кусок считается с хвостом предыдущего (context_rows строк), а
+    заполнение пропусков продолжается с последней строки предыдущего куска,
+    поэтому результат совпадает с расчетом по всему файлу. Строки в начале
+    ряда, для которых истории еще нет, и интервалы без данных отбрасываются.
+    """
+    import pandas as pd
+
+    n_context = context_rows(interval)
+    context = None
+    last_history = None
+    for frame in frames:
+        features = build_feature_frame(frame, interval, context, last_history)
+        last_history = features[HISTORY_COLUMNS].iloc[-1]
+        context = (frame if context is None else pd.concat([context, frame])).iloc[-n_context:]
+        features = features.dropna()
+        if len(features):
+            yield features
+
+
+def build_feature_store(csv_path, directory, chunksize=500_000, interval=DEFAULT_INTERVAL):
+    """CSV со схемой df/obr.csv -> агрегация до interval -> колоночное хранилище признаков"""
+    resampled = resample_chunks(read_obr_chunks(csv_path, chunksize), interval)
+    return write_store(iter_feature_chunks(resampled, interval), directory,
+                       {'target': TARGET, 'interval': interval, 'source': source_signature(csv_path)})
+
+
+def is_feature_store_fresh(csv_path, directory, interval=DEFAULT_INTERVAL):
+    """Хранилище есть, собрано с тем же шагом и из текущей версии CSV (если файла нет - годится любое)"""
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        return False
+    meta = read_meta(directory)
+    if meta.get('interval') != interval:
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    source = meta.get('source', {})
+    current = source_signature(csv_path)
+    return source.get('size') == current['size'] and source.get('mtime_ns') == current['mtime_ns']
+
+
+def open_feature_store(directory):
+    """Открывает все колонки хранилища признаков через memory-map: {колонка: массив}"""
+    return open_store(directory)
+
+
+def feature_matrix(columns, feature_names, dtype=np.float32):
+    """Собирает матрицу признаков в порядке feature_names (одна копия, без промежуточных DataFrame)"""
+    n_rows = len(next(iter(columns.values())))
+    matrix = np.empty((n_rows, len(feature_names)), dtype=dtype)
+    for i, name in enumerate(feature_names):
+        matrix[:, i] = columns[name]
+    return matrix
+
+
+def load_feature_frame(directory):
+    """Хранилище признаков как DataFrame с индексом datetime (для ноутбука)"""
+    return load_frame(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Расчет признаков по CSV со схемой df/obr.csv')
+    parser.add_argument('csv_path', help='CSV со схемой df/obr.csv')
+    parser.add_argument('directory', help='Каталог колоночного хранилища признаков')
+    parser.add_argument('--chunksize', type=int, default=500_000)
+    parser.add_argument('--interval', default=DEFAULT_INTERVAL, help='Шаг агрегации (1h, 30min, ...)')
+    args = parser.parse_args()
+
+    n_rows = build_feature_store(args.csv_path, args.directory, chunksize=args.chunksize,
+                                 interval=args.interval)
+    print(f"✅ Признаки сохранены в {args.directory}: {n_rows} строк")
@@ -0,0 +1,207 @@
+# forecast_store.py - ОГРАНИЧЕННОЕ ХРАНИЛИЩЕ ВЫДАННЫХ ПРОГНОЗОВ
+#
+# Прогноз на день - строка из 24 значений float32 в массиве фиксированного
+# размера (слоты). Число слотов задается лимитом памяти: когда место
+# кончается, вытесняется день, к которому дольше всего не обращались (LRU),
+# а дни старше max_age_days от самого нового удаляются сразу.
+# С prefix массивы лежат на диске (.npy через memory-map) и переживают
+# перезапуск бота; без него хранилище живет только в памяти.
+#   store = ForecastStore.open('df/forecasts', max_bytes=1 << 20)
+#   store.put(date, predictions)
+#   store.get_range(start, end)   # (дни × 24), NaN там, где прогноза нет
+#   store.stamp(before)           # меняется, когда меняются дни до before
+import json
+import os
+import threading
+
+import numpy as np
+
+HOURS = 24
+EMPTY_DAY = np.iinfo(np.int64).min
+# Байт на слот: 24 значения float32 + номер дня + отметка последнего обращения
+SLOT_BYTES = HOURS * 4 + 8 + 8
+DEFAULT_MAX_BYTES = 256 * 1024
+DEFAULT_MAX_AGE_DAYS = 400
+
+
+def to_epoch_days(dates):
+    """Даты (datetime, date, строки, datetime64) -> номера дней от эпохи"""
+    return np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+
+
+class ForecastStore:
+    """Прогнозы по дням: put/get, чтение диапазона дней и часов для лагов"""
+
+    def __init__(self, values, days, max_age_days=DEFAULT_MAX_AGE_DAYS, prefix=None):
+        self.values = values
+        self.days = days
+        self.max_age_days = max_age_days
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        # Отметки обращений для LRU - только в памяти; после открытия файла
+        # старшинство слотов восстанавливается по дате прогноза
+        self._used = np.zeros(len(days), dtype=np.int64)
+        self._clock = 0
+        # Номер записи для каждого слота (stamp): только в памяти, после открытия - 0
+        self._written = np.zeros(len(days), dtype=np.int64)
+        self._writes = 0
+        self._slots = {}
+        for slot in np.flatnonzero(days != EMPTY_DAY)[np.argsort(days[days != EMPTY_DAY], kind='stable')]:
+            self._slots[int(days[slot])] = int(slot)
+            self._touch(slot)
+        self.evictions = 0
+
+    @classmethod
+    def in_memory(cls, max_bytes=DEFAULT_MAX_BYTES, **options):
+        capacity = cls.capacity_for(max_bytes)
+        values = np.full((capacity, HOURS), np.nan, dtype=np.float32)
+        return cls(values, np.full(capacity, EMPTY_DAY, dtype=np.int64), **options)
+
+    @staticmethod
+    def capacity_for(max_bytes):
+        return max(1, int(max_bytes) // SLOT_BYTES)
+
+    @staticmethod
+    def _paths(prefix):
+        return prefix + '.npy', prefix + '.days.npy', prefix + '.json'
+
+    @classmethod
+    def open(cls, prefix, max_bytes=DEFAULT_MAX_BYTES, **options):
+        """Открывает (или создает) хранилище на диске через memory-map.
+
+        Если файлы уже есть, число слотов берется из них: лимит памяти
+        применяется только при создании.
+        """
+        values_path, days_path, meta_path = cls._paths(prefix)
+        if os.path.exists(meta_path):
+            values = np.load(values_path, mmap_mode='r+')
+            days = np.load(days_path, mmap_mode='r+')
+            if values.shape != (len(days), HOURS):
+                raise ValueError(f"Повреждено хранилище прогнозов {prefix}: {values.shape} / {days.shape}")
+            return cls(values, days, prefix=prefix, **options)
+
+        os.makedirs(os.path.dirname(os.path.abspath(values_path)), exist_ok=True)
+        capacity = cls.capacity_for(max_bytes)
+        values = np.lib.format.open_memmap(values_path, mode='w+', dtype=np.float32, shape=(capacity, HOURS))
+        days = np.lib.format.open_memmap(days_path, mode='w+', dtype=np.int64, shape=(capacity,))
+        values[:] = np.nan
+        days[:] = EMPTY_DAY
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'slots': capacity, 'hours': HOURS, 'dtype': 'float32'}, f, ensure_ascii=False, indent=2)
+        return cls(values, days, prefix=prefix, **options)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, date):
+        return int(to_epoch_days(date)) in self._slots
+
+    @property
+    def capacity(self):
+        return len(self.days)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.days.nbytes + self._used.nbytes
+
+    def _touch(self, slot):
+        self._clock += 1
+        self._used[slot] = self._clock
+
+    def _free_slot(self):
+        """Свободный слот; если его нет - вытесняем давно не использованный день"""
+        empty = np.flatnonzero(self.days == EMPTY_DAY)
+        if len(empty):
+            return int(empty[0])
+        slot = int(np.argmin(self._used))
+        del self._slots[int(self.days[slot])]
+        self.evictions += 1
+        return slot
+
+    def _expire(self):
+        """Удаляет дни старше max_age_days относительно самого нового дня"""
+        if not self.max_age_days or not self._slots:
+            return
+        stored = self.days != EMPTY_DAY
+        old = stored & (self.days < max(self._slots) - self.max_age_days)
+        for slot in np.flatnonzero(old):
+            del self._slots[int(self.days[slot])]
+        self.days[old] = EMPTY_DAY
+        self.values[old] = np.nan
+        self.evictions += int(old.sum())
+
+    def put(self, date, predictions):
+        """Сохраняет 24 почасовых значения прогноза на день"""
+        predictions = np.asarray(predictions, dtype=np.float32)
+        if predictions.shape != (HOURS,):
+            raise ValueError(f"Ожидается {HOURS} значений прогноза, получено {predictions.shape}")
+        day = int(to_epoch_days(date))
+        with self._lock:
+            slot = self._slots.get(day)
+            if slot is None:
+                slot = self._slots[day] = self._free_slot()
+                self.days[slot] = day
+            self.values[slot] = predictions
+            self._writes += 1
+            self._written[slot] = self._writes
+            self._touch(slot)
+            self._expire()
+
+    def get(self, date):
+        """Прогноз на день (копия float32) или None"""
+        with self._lock:
+            slot = self._slots.get(int(to_epoch_days(date)))
+            if slot is None:
+                return None
+            self._touch(slot)
+            return self.values[slot].copy()
+
+    def get_range(self, start, end):
+        """Прогнозы на дни [start, end): матрица (дни × 24), NaN для дней без прогноза"""
+        first, last = int(to_epoch_days(start)), int(to_epoch_days(end))
+        result = np.full((max(0, last - first), HOURS), np.nan, dtype=np.float32)
+        with self._lock:
+            inside = (self.days >= first) & (self.days < last)
+            slots = np.flatnonzero(inside)
+            result[self.days[slots] - first] = self.values[slots]
+            self._clock += 1
+            self._used[slots] = self._clock
+        return result
+
+    def power_at(self, epoch_hours):
+        """Прогноз на каждый час (номера часов от эпохи); NaN там, где прогноза нет"""
+        epoch_hours = np.asarray(epoch_hours, dtype=np.int64)
+        if epoch_hours.size == 0:
+            return np.empty(epoch_hours.shape, dtype=np.float64)
+        day_numbers = epoch_hours // HOURS
+        first = int(day_numbers.min())
+        table = self.get_range(np.datetime64(first, 'D'), np.datetime64(int(day_numbers.max()) + 1, 'D'))
+        return table[day_numbers - first, epoch_hours % HOURS].astype(np.float64)
+
+    def lag_features(self, timestamps, lag_hours, before=None):
+        """Лаги из прошлых прогнозов: {имя: значения} для словаря {имя: часов назад}.
+
+        before - учитываются только прогнозы на дни раньше этой даты (позже - NaN).
+        """
+        epoch_hours = np.asarray(timestamps, dtype='datetime64[h]').astype(np.int64)
+        limit = None if before is None else int(to_epoch_days(before)) * HOURS
+        features = {}
+        for name, lag in lag_hours.items():
+            values = self.power_at(epoch_hours - lag)
+            if limit is not None:
+                values[epoch_hours - lag >= limit] = np.nan
+            features[name] = values
+        return features
+
+    def stamp(self, before):
+        """Отметка содержимого дней раньше before: меняется при записи или вытеснении любого из них"""
+        first_excluded = int(to_epoch_days(before))
+        with self._lock:
+            inside = (self.days != EMPTY_DAY) & (self.days < first_excluded)
+            return int(inside.sum()), int(self._written[inside].max(initial=0))
+
+    def flush(self):
+        """Сбрасывает изменения memory-map на диск (для хранилища в памяти - ничего)"""
+        for array in (self.values, self.days):
+            if isinstance(array, np.memmap):
+                array.flush()
@@ -0,0 +1,140 @@
+# history.py - ИНДЕКСИРОВАННОЕ ХРАНИЛИЩЕ ИСТОРИИ ПОТРЕБЛЕНИЯ
+#
+# Почасовой ряд хранится плотным массивом float32 на диске (.npy) и
+# открывается через memory-map. Строка = один час от начала ряда, поэтому
+# поиск по времени - это O(1) вычисление смещения, без загрузки CSV.
+#
+# Сборка из df/obr.csv:
+#   python tg_bot/history.py df/obr.csv df/history_hourly
+import argparse
+import json
+import os
+
+import numpy as np
+
+from resample import COLUMNS, read_obr_chunks, resample_chunks
+
+# Лаги из feature_names.json: имя признака -> сколько часов назад
+LAG_HOURS = {
+    'lag_same_day_24h': 24,
+    'lag_week_ago_168h': 168,
+    'lag_48h_ago': 48,
+    'lag_72h_ago': 72,
+    'lag_96h_ago': 96
+}
+
+# Скользящие окна как в model.ipynb: shift(1).rolling(w).mean().shift(1),
+# т.е. среднее по часам [t-w-1, t-2]. Окно 3h при обучении умножалось на 0.3
+ROLLING_WINDOWS = {
+    'rolling_mean_3h_past': 3,
+    'rolling_mean_24h': 24,
+    'rolling_mean_7d_past': 24 * 7,
+    'rolling_mean_168h': 168
+}
+ROLLING_SCALE = {'rolling_mean_3h_past': 0.3}
+ROLLING_END_LAG = 2
+
+
+def to_epoch_hours(timestamps):
+    """Переводит даты/время (datetime, строки, datetime64) в номера часов от эпохи"""
+    return np.asarray(timestamps, dtype='datetime64[h]').astype(np.int64)
+
+
+def build_store(csv_path, prefix, chunksize=500_000):
+    """Строит почасовое хранилище из упорядоченного по времени CSV со схемой df/obr.csv"""
+    import pandas as pd
+
+    hourly = pd.concat(resample_chunks(read_obr_chunks(csv_path, chunksize), '1h'))
+    start_hour = int(to_epoch_hours(hourly.index[0].to_datetime64()))
+    return HistoryStore.save(prefix, hourly[COLUMNS].to_numpy(np.float32), start_hour)
+
+
+class HistoryStore:
+    """Почасовой ряд потребления с доступом к лагам и окнам по времени"""
+
+    def __init__(self, values, cumsum, start_hour):
+        self.values = values
+        self.cumsum = cumsum
+        self.start_hour = start_hour
+
+    @staticmethod
+    def _paths(prefix):
+        return prefix + '.npy', prefix + '.cumsum.npy', prefix + '.json'
+
+    @classmethod
+    def save(cls, prefix, values, start_hour):
+        """Сохраняет массив (часы × COLUMNS) и префиксные суммы, возвращает открытое хранилище"""
+        values_path, cumsum_path, meta_path = cls._paths(prefix)
+        os.makedirs(os.path.dirname(os.path.abspath(values_path)), exist_ok=True)
+
+        power = values[:, 0].astype(np.float64)
+        valid = ~np.isnan(power)
+        # Префиксные суммы (сумма, количество) - окно любой длины за O(1)
+        cumsum = np.zeros((len(values) + 1, 2), dtype=np.float64)
+        cumsum[1:, 0] = np.cumsum(np.where(valid, power, 0.0))
+        cumsum[1:, 1] = np.cumsum(valid)
+
+        np.save(values_path, values.astype(np.float32))
+        np.save(cumsum_path, cumsum)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'start': str(np.datetime64(start_hour, 'h')), 'step': '1h',
+                       'columns': COLUMNS}, f, ensure_ascii=False, indent=2)
+        return cls.open(prefix)
+
+    @classmethod
+    def open(cls, prefix):
+        """Открывает хранилище через memory-map (данные читаются с диска по мере обращения)"""
+        values_path, cumsum_path, meta_path = cls._paths(prefix)
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        values = np.load(values_path, mmap_mode='r')
+        cumsum = np.load(cumsum_path, mmap_mode='r')
+        return cls(values, cumsum, int(to_epoch_hours(meta['start'])))
+
+    def __len__(self):
+        return len(self.values)
+
+    def offsets(self, timestamps):
+        """Смещение строки для каждого момента времени (может выходить за границы)"""
+        return to_epoch_hours(timestamps) - self.start_hour
+
+    def power_at(self, offsets):
+        """Global_active_power по смещениям; NaN вне ряда и в пропусках"""
+        offsets = np.asarray(offsets)
+        result = np.full(offsets.shape, np.nan, dtype=np.float64)
+        inside = (offsets >= 0) & (offsets < len(self.values))
+        result[inside] = self.values[offsets[inside], 0]
+        return result
+
+    def window_mean(self, offsets, window, end_lag=ROLLING_END_LAG):
+        """Среднее по часам [t-end_lag-window+1, t-end_lag]; NaN если в окне нет данных"""
+        offsets = np.asarray(offsets)
+        hi = np.clip(offsets - end_lag + 1, 0, len(self.values))
+        lo = np.clip(offsets - end_lag - window + 1, 0, len(self.values))
+        total = self.cumsum[hi, 0] - self.cumsum[lo, 0]
+        count = self.cumsum[hi, 1] - self.cumsum[lo, 1]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, total / count, np.nan)
+
+    def lag_features(self, timestamps, names=None):
+        """Настоящие значения лагов для каждого момента времени (names - только эти)"""
+        offsets = self.offsets(timestamps)
+        return {name: self.power_at(offsets - lag) for name, lag in LAG_HOURS.items()
+                if names is None or name in names}
+
+    def rolling_features(self, timestamps, names=None):
+        """Настоящие скользящие средние для каждого момента времени (names - только эти)"""
+        offsets = self.offsets(timestamps)
+        return {name: self.window_mean(offsets, window) * ROLLING_SCALE.get(name, 1.0)
+                for name, window in ROLLING_WINDOWS.items() if names is None or name in names}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Сборка почасового хранилища истории из CSV')
+    parser.add_argument('csv_path', help='CSV со схемой df/obr.csv')
+    parser.add_argument('prefix', help='Путь к файлам хранилища без расширения')
+    parser.add_argument('--chunksize', type=int, default=500_000)
+    args = parser.parse_args()
+
+    store = build_store(args.csv_path, args.prefix, chunksize=args.chunksize)
+    print(f"✅ Хранилище создано: {len(store)} часов начиная с {np.datetime64(store.start_hour, 'h')}")
@@ -0,0 +1,324 @@
+# households.py - ПАКЕТНЫЙ ПРОГНОЗ ДЛЯ МНОГИХ ДОМОХОЗЯЙСТВ
+#
+# Поминутные выгрузки в схеме df/obr.csv (по файлу на домохозяйство, или
+# один файл с колонкой household, или ZIP с такими файлами) сводятся к
+# часам сразу для всех домохозяйств: ключ (домохозяйство, час), суммы через
+# bincount. От каждого домохозяйства хранятся только последние BUFFER_HOURS
+# часов - общий массив float32 (домохозяйства × часы × 4 колонки), как
+# буфер StreamingFeatureState в stream.py, но для всех сразу.
+#
+# Прогноз - на сутки после последнего дня данных каждого домохозяйства:
+# признаки всех домохозяйств собираются одной матрицей (домохозяйства × 24
+# строк) и считаются одним вызовом predict.
+#   python tg_bot/households.py df/sites/*.csv --output df/households_forecast.csv
+#   python tg_bot/households.py sites.zip --version 20250101-120000-lightgbm
+import argparse
+import csv
+import glob
+import io
+import os
+import time
+import warnings
+import zipfile
+
+import numpy as np
+
+from features import calendar_features, feature_matrix, lag_interactions, submetering_features
+from history import LAG_HOURS, ROLLING_END_LAG, ROLLING_SCALE, ROLLING_WINDOWS
+from resample import COLUMNS
+from stream import BUFFER_HOURS
+
+HOUSEHOLD_COLUMN = 'household'
+HOURS = 24
+# Ключ (домохозяйство, час) - одно int64: код домохозяйства в старших битах
+HOUR_BITS = 32
+
+
+def expand_sources(paths):
+    """Файлы CSV/ZIP из списка путей; каталоги раскрываются в *.csv и *.zip"""
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, '*.csv')) + glob.glob(os.path.join(path, '*.zip')))
+        else:
+            yield path
+
+
+def household_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def read_household_chunks(source, name, chunksize=500_000):
+    """Куски CSV со схемой df/obr.csv: (id домохозяйств, часы от эпохи, значения COLUMNS).
+
+    source - путь или файловый объект. Без колонки household все строки
+    относятся к домохозяйству name.
+    """
+    import pandas as pd
+
+    wanted = {'datetime', HOUSEHOLD_COLUMN, *COLUMNS}
+    for chunk in pd.read_csv(source, usecols=lambda col: col in wanted, chunksize=chunksize,
+                             dtype={col: 'float32' for col in COLUMNS} | {HOUSEHOLD_COLUMN: str}):
+        # Суб-счетчиков в выгрузке может не быть - тогда их доли NaN
+        values = np.column_stack([chunk[col].values if col in chunk else np.full(len(chunk), np.nan, np.float32)
+                                  for col in COLUMNS])
+        hours = pd.to_datetime(chunk['datetime'], format='%Y-%m-%d %H:%M:%S').values.astype('datetime64[h]')
+        ids = chunk[HOUSEHOLD_COLUMN].values if HOUSEHOLD_COLUMN in chunk else np.full(len(chunk), name, dtype=object)
+        yield ids, hours.astype(np.int64), values
+
+
+def read_sources(sources, chunksize=500_000):
+    """Куски всех источников: пути CSV/ZIP или пары (имя, байты) - например, загрузка в боте"""
+    for source in sources:
+        if isinstance(source, tuple):
+            name, data = source
+            handle = io.BytesIO(data)
+        else:
+            name, handle = source, source
+        if zipfile.is_zipfile(handle):
+            with zipfile.ZipFile(handle) as archive:
+                for member in archive.namelist():
+                    if member.endswith('.csv'):
+                        with archive.open(member) as f:
+                            yield from read_household_chunks(f, household_name(member), chunksize)
+            continue
+        if isinstance(handle, io.BytesIO):
+            handle.seek(0)
+        yield from read_household_chunks(handle, household_name(name), chunksize)
+
+
+class HouseholdWindows:
+    """Последние BUFFER_HOURS часов каждого домохозяйства перед днем прогноза.
+
+    values[i, j] - средние COLUMNS за час target_days[i] * 24 - BUFFER_HOURS + j
+    (NaN - часа нет в данных).
+    """
+
+    def __init__(self, ids, target_days, values):
+        self.ids = list(ids)
+        self.target_days = np.asarray(target_days, dtype=np.int64)
+        self.values = values
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.target_days.nbytes
+
+    @property
+    def dates(self):
+        return self.target_days.astype('datetime64[D]')
+
+    def has_data(self):
+        """Домохозяйства, у которых в окне есть хоть одно значение потребления"""
+        return ~np.isnan(self.values[..., 0]).all(axis=1)
+
+
+class HourlyAggregator:
+    """Часовые суммы и количества показаний по ключу (домохозяйство, час).
+
+    После каждого куска отбрасываются часы старше BUFFER_HOURS от последнего
+    часа своего домохозяйства, поэтому память ~ домохозяйства × BUFFER_HOURS.
+    """
+
+    def __init__(self, buffer_hours=BUFFER_HOURS):
+        self.buffer_hours = buffer_hours
+        self.codes = {}
+        self.last_hour = np.zeros(0, dtype=np.int64)
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.sums = np.zeros((0, len(COLUMNS)))
+        self.counts = np.zeros((0, len(COLUMNS)))
+        self.rows = 0
+
+    def encode(self, ids):
+        """Коды домохозяйств (по порядку первого появления)"""
+        uniques, inverse = np.unique(np.asarray(ids, dtype=str), return_inverse=True)
+        codes = np.array([self.codes.setdefault(name, len(self.codes)) for name in uniques], dtype=np.int64)
+        return codes[inverse]
+
+    def add(self, ids, hours, values):
+        # Час занимает младшие HOUR_BITS бит ключа: отрицательный или больший час испортил бы код
+        if len(hours) and (hours.min() < 0 or hours.max() >= 1 << HOUR_BITS):
+            raise ValueError(f"Часы {hours.min()}..{hours.max()} от эпохи вне [0, 2**{HOUR_BITS})")
+        codes = self.encode(ids)
+        self.rows += len(codes)
+        if len(self.codes) > len(self.last_hour):
+            self.last_hour = np.concatenate([self.last_hour, np.full(len(self.codes) - len(self.last_hour),
+                                                                     np.iinfo(np.int64).min)])
+        np.maximum.at(self.last_hour, codes, hours)
+
+        known = ~np.isnan(values)
+        keys = np.concatenate([self.keys, (codes << HOUR_BITS) | hours])
+        sums = np.concatenate([self.sums, np.where(known, values, 0.0)])
+        counts = np.concatenate([self.counts, known])
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.sums = np.column_stack([np.bincount(inverse, weights=sums[:, i], minlength=len(self.keys))
+                                     for i in range(len(COLUMNS))])
+        self.counts = np.column_stack([np.bincount(inverse, weights=counts[:, i], minlength=len(self.keys))
+                                       for i in range(len(COLUMNS))])
+
+        # Окно прогноза начинается позже last_hour - buffer_hours: более старые часы не понадобятся
+        recent = self.key_hours() >= self.last_hour[self.key_codes()] - self.buffer_hours
+        self.keys, self.sums, self.counts = self.keys[recent], self.sums[recent], self.counts[recent]
+
+    def key_codes(self):
+        return self.keys >> HOUR_BITS
+
+    def key_hours(self):
+        return self.keys & ((1 << HOUR_BITS) - 1)
+
+    def windows(self):
+        """Окна всех домохозяйств: день прогноза - следующий после последнего часа данных"""
+        ids = sorted(self.codes, key=self.codes.get)
+        target_days = self.last_hour // HOURS + 1
+        values = np.full((len(ids), self.buffer_hours, len(COLUMNS)), np.nan, dtype=np.float32)
+        codes = self.key_codes()
+        offsets = self.key_hours() - (target_days[codes] * HOURS - self.buffer_hours)
+        inside = offsets >= 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values[codes[inside], offsets[inside]] = self.sums[inside] / self.counts[inside]
+        return HouseholdWindows(ids, target_days, values)
+
+
+def load_windows(sources, chunksize=500_000):
+    aggregator = HourlyAggregator()
+    for ids, hours, values in read_sources(sources, chunksize):
+        aggregator.add(ids, hours, values)
+    return aggregator.windows(), aggregator.rows
+
+
+def window_means(series, ends, window):
+    """Средние по часам [end - window + 1, end] окна (домохозяйства × часы); NaN не считаются"""
+    n_hours = series.shape[1]
+    known = ~np.isnan(series)
+    cumsum = np.zeros((len(series), n_hours + 1))
+    cumsum[:, 1:] = np.cumsum(np.where(known, series, 0.0), axis=1)
+    counts = np.zeros((len(series), n_hours + 1))
+    counts[:, 1:] = np.cumsum(known, axis=1)
+    hi = np.clip(ends + 1, 0, n_hours)
+    lo = np.clip(ends - window + 1, 0, n_hours)
+    rows = np.arange(len(series))[:, None]
+    count = counts[rows, hi] - counts[rows, lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, (cumsum[rows, hi] - cumsum[rows, lo]) / count, np.nan)
+
+
+def household_feature_columns(windows):
+    """Признаки прогноза на сутки для всех домохозяйств: {признак: массив (домохозяйства × 24)}.
+
+    Лаги и скользящие средние - из окна домохозяйства (как HistoryStore: окна,
+    заходящие в день прогноза, считаются по известным часам). Суб-счетчики в
+    день прогноза неизвестны - берется их средний профиль по часу суток за окно.
+    """
+    n = len(windows)
+    buffer_hours = windows.values.shape[1]
+    power = windows.values[..., 0].astype(np.float64)
+
+    timestamps = windows.target_days[:, None] * HOURS + np.arange(HOURS)
+    hour = np.broadcast_to(np.arange(HOURS), (n, HOURS))
+    day_of_week = (timestamps // HOURS + 3) % 7
+    month = timestamps.astype('datetime64[h]').astype('datetime64[M]').astype(np.int64) % 12 + 1
+
+    features = calendar_features(hour, day_of_week, month)
+    # Час прогноза t в координатах окна - buffer_hours + час суток
+    target_index = buffer_hours + hour
+    rows = np.arange(n)[:, None]
+    for name, lag in LAG_HOURS.items():
+        features[name] = power[rows, target_index - lag]
+    for name, window in ROLLING_WINDOWS.items():
+        features[name] = window_means(power, target_index - ROLLING_END_LAG, window) * ROLLING_SCALE.get(name, 1.0)
+    features.update(lag_interactions(features['lag_same_day_24h'], features['lag_48h_ago'],
+                                     features['lag_week_ago_168h'], hour, day_of_week))
+
+    with warnings.catch_warnings():
+        # Час суток без показаний суб-счетчиков за все окно - NaN (Mean of empty slice)
+        warnings.simplefilter('ignore', RuntimeWarning)
+        profile = np.nanmean(windows.values[..., 1:].reshape(n, buffer_hours // HOURS, HOURS, 3), axis=1)
+    features.update(submetering_features(profile[..., 0], profile[..., 1], profile[..., 2]))
+
+    return {name: np.ravel(values) for name, values in features.items()}
+
+
+def score_households(engine, windows, feature_names=None):
+    """Прогноз (домохозяйства × 24) одним вызовом predict; без данных - NaN"""
+    feature_names = feature_names or engine.feature_names
+    predictions = np.full((len(windows), HOURS), np.nan)
+    valid = windows.has_data()
+    if valid.any():
+        subset = HouseholdWindows([name for name, ok in zip(windows.ids, valid) if ok],
+                                  windows.target_days[valid], windows.values[valid])
+        matrix = feature_matrix(household_feature_columns(subset), feature_names)
+        # Те же границы, что у прогноза в боте
+        predictions[valid] = np.clip(engine.predict(matrix), 0.1, 7.0).reshape(len(subset), HOURS)
+    return predictions
+
+
+def forecast_csv(windows, predictions):
+    """Таблица прогнозов: домохозяйство, дата, кВт·ч за сутки, час пика, 24 значения (кВт)"""
+    # Имя домохозяйства - имя файла или значение из CSV: запятые и кавычки экранирует csv.writer
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(['household', 'date', 'total_kwh', 'peak_hour'] + [f'h{hour:02d}' for hour in range(HOURS)])
+    for name, date, values in zip(windows.ids, windows.dates, predictions):
+        if np.isnan(values).all():
+            writer.writerow([name, date] + [''] * (HOURS + 2))
+            continue
+        writer.writerow([name, date, f'{values.sum():.3f}', int(values.argmax())]
+                        + [f'{value:.3f}' for value in values])
+    return output.getvalue()
+
+
+def format_summary(windows, predictions, top=5):
+    """Короткий отчет: сколько домохозяйств, суммарное потребление и крупнейшие"""
+    totals = predictions.sum(axis=1)
+    valid = ~np.isnan(totals)
+    lines = [f"🏠 Домохозяйств: {len(windows)}, с прогнозом: {int(valid.sum())}"]
+    if valid.any():
+        lines.append(f"⚡ Всего за сутки: {totals[valid].sum():.1f} кВт·ч, "
+                     f"в среднем {totals[valid].mean():.1f} кВт·ч на домохозяйство")
+        order = np.argsort(-np.where(valid, totals, -np.inf))[:min(top, int(valid.sum()))]
+        lines.append("Больше всего:")
+        lines.extend(f"  {windows.ids[i]} ({windows.dates[i]}): {totals[i]:.1f} кВт·ч, "
+                     f"пик в {int(predictions[i].argmax())}:00" for i in order)
+    if not valid.all():
+        lines.append(f"⚠️ Нет данных о потреблении в последние {windows.values.shape[1] // HOURS} дней: "
+                     + ', '.join(name for name, ok in zip(windows.ids, valid) if not ok)[:200])
+    return '\n'.join(lines)
+
+
+def main():
+    import config
+    from inference import InferenceEngine
+    from registry import ModelRegistry
+
+    parser = argparse.ArgumentParser(description='Прогноз на сутки для многих домохозяйств одним батчем')
+    parser.add_argument('sources', nargs='+', help='CSV со схемой df/obr.csv, ZIP или каталоги с ними')
+    parser.add_argument('--output', default=os.path.join(config.BASE_DIR, 'df', 'households_forecast.csv'))
+    parser.add_argument('--version', default=None, help='Версия из реестра (по умолчанию активная)')
+    parser.add_argument('--model', default=config.MODEL_PATHS['lightgbm'], help='Модель, если реестр пуст')
+    parser.add_argument('--feature-names', default=config.FEATURE_NAMES_PATH)
+    parser.add_argument('--chunksize', type=int, default=500_000)
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    version = args.version or registry.current()
+    engine = registry.load(version) if version else InferenceEngine.load(args.model, args.feature_names)
+
+    started = time.perf_counter()
+    windows, n_rows = load_windows(list(expand_sources(args.sources)), args.chunksize)
+    loaded = time.perf_counter()
+    predictions = score_households(engine, windows)
+    scored = time.perf_counter()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(forecast_csv(windows, predictions))
+
+    print(format_summary(windows, predictions))
+    print(f"⏱ Чтение и агрегация {n_rows} строк: {loaded - started:.2f} с, "
+          f"признаки и прогноз: {(scored - loaded) * 1000:.0f} мс "
+          f"({len(windows) / max(scored - loaded, 1e-9):.0f} домохозяйств/с), "
+          f"окна в памяти: {windows.nbytes // 1024} КБ")
+    print(f"💾 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
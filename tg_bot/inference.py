@@ -0,0 +1,199 @@
+# inference.py - БЫСТРЫЙ ПРОГНОЗ НАПРЯМУЮ ЧЕРЕЗ LightGBM Booster
+#
+# LGBMRegressor.predict на DataFrame из одной строки тратит почти миллисекунду
+# на проверку колонок и конвертацию pandas. Здесь модель загружается как
+# lightgbm.Booster и принимает непрерывную float32-матрицу в порядке
+# models/feature_names.json. Родной текстовый формат (.txt рядом с .pkl)
+# читается быстрее pickle, но создается только явно: --export здесь или
+# публикация версии в реестре (registry.py); загрузка ничего не записывает.
+#   predict(matrix)         - быстрый путь, без проверок
+#   predict_checked(data)   - DataFrame / dict / массив: проверка схемы и порядок колонок
+#
+#   python tg_bot/inference.py models/lightgbm_best_model.pkl models/feature_names.json
+#   python tg_bot/inference.py models/lightgbm_best_model.pkl --export
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+# До стольких строк прогноз считается в одном потоке: запуск потоков OpenMP
+# дороже самого прогноза, а параллелизм уже дает пул обработчиков бота
+SMALL_BATCH = 512
+
+
+class SchemaError(ValueError):
+    """Признаки не совпадают с тем, что ожидает модель"""
+
+
+def native_model_path(model_path):
+    return os.path.splitext(model_path)[0] + '.txt'
+
+
+def load_booster(model_path):
+    """Booster LightGBM: из родного .txt рядом с моделью, если он есть и не старше .pkl, иначе из .pkl"""
+    import lightgbm as lgb
+
+    native_path = native_model_path(model_path)
+    if os.path.exists(native_path) and (not os.path.exists(model_path)
+                                        or os.path.getmtime(native_path) >= os.path.getmtime(model_path)):
+        return lgb.Booster(model_file=native_path)
+
+    import joblib
+
+    return joblib.load(model_path).booster_
+
+
+def export_native(model_path, native_path=None):
+    """Сохраняет LGBMRegressor из .pkl в родном формате LightGBM; возвращает путь к .txt"""
+    import joblib
+
+    native_path = native_path or native_model_path(model_path)
+    joblib.load(model_path).booster_.save_model(native_path)
+    return native_path
+
+
+class InferenceEngine:
+    """Прогноз по матрице признаков с учетом времени каждого вызова"""
+
+    def __init__(self, booster, feature_names, num_threads=0):
+        self.booster = booster
+        self.feature_names = list(feature_names)
+        self.num_threads = num_threads
+        self._check_schema()
+
+        self.calls = 0
+        self.total_seconds = 0.0
+        self.last_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _check_schema(self):
+        model_names = self.booster.feature_name()
+        if model_names != self.feature_names:
+            raise SchemaError(f"Порядок признаков модели не совпадает с feature_names.json "
+                              f"(модель: {len(model_names)}, список: {len(self.feature_names)})")
+
+    @classmethod
+    def load(cls, model_path, feature_names_path, **kwargs):
+        with open(feature_names_path, 'r', encoding='utf-8') as f:
+            feature_names = json.load(f)
+        return cls(load_booster(model_path), feature_names, **kwargs)
+
+    @property
+    def n_features(self):
+        return len(self.feature_names)
+
+    def predict(self, matrix):
+        """Быстрый путь: float32-матрица (строки × признаки) в порядке feature_names, без проверок"""
+        num_threads = 1 if len(matrix) <= SMALL_BATCH else self.num_threads
+        start = time.perf_counter()
+        result = self.booster.predict(matrix, num_threads=num_threads)
+        self._record(time.perf_counter() - start)
+        return result
+
+    def _record(self, elapsed):
+        with self._lock:
+            self.calls += 1
+            self.total_seconds += elapsed
+            self.last_seconds = elapsed
+
+    def prepare(self, data, feature_names=None):
+        """Приводит DataFrame, словарь колонок или массив к float32-матрице в порядке модели.
+
+        Для массива feature_names - порядок его колонок (по умолчанию порядок модели).
+        Лишние колонки игнорируются, недостающие - ошибка SchemaError.
+        """
+        if hasattr(data, 'columns'):
+            feature_names, columns = list(data.columns), data
+        elif isinstance(data, dict):
+            feature_names, columns = list(data), data
+        else:
+            matrix = np.atleast_2d(np.asarray(data))
+            feature_names = list(feature_names or self.feature_names)
+            if matrix.ndim != 2 or matrix.shape[1] != len(feature_names):
+                raise SchemaError(f"Ожидалась матрица (строки × {len(feature_names)}), получено {matrix.shape}")
+            if feature_names == self.feature_names:
+                return np.ascontiguousarray(matrix, dtype=np.float32)
+            columns = dict(zip(feature_names, matrix.T))
+
+        available = set(feature_names)
+        missing = [name for name in self.feature_names if name not in available]
+        if missing:
+            raise SchemaError(f"Нет признаков: {', '.join(missing[:5])}" + (' ...' if len(missing) > 5 else ''))
+
+        first = np.atleast_1d(np.asarray(columns[self.feature_names[0]]))
+        matrix = np.empty((len(first), self.n_features), dtype=np.float32)
+        for i, name in enumerate(self.feature_names):
+            matrix[:, i] = np.asarray(columns[name], dtype=np.float32)
+        return matrix
+
+    def predict_checked(self, data, feature_names=None):
+        """Проверяемый путь: схема сверяется с моделью, колонки переставляются в нужный порядок"""
+        return self.predict(self.prepare(data, feature_names))
+
+    def latency(self):
+        """Время прогноза: число вызовов, среднее и последнее (мкс)"""
+        with self._lock:
+            mean = self.total_seconds / self.calls if self.calls else 0.0
+            return {'calls': self.calls, 'mean_us': mean * 1e6, 'last_us': self.last_seconds * 1e6}
+
+    def reset_latency(self):
+        with self._lock:
+            self.calls, self.total_seconds, self.last_seconds = 0, 0.0, 0.0
+
+
+class EstimatorEngine(InferenceEngine):
+    """Тот же интерфейс для моделей sklearn/XGBoost из .pkl (RandomForest, XGBRegressor)"""
+
+    def __init__(self, estimator, feature_names):
+        self.estimator = estimator
+        super().__init__(None, feature_names)
+
+    def _check_schema(self):
+        n_features = getattr(self.estimator, 'n_features_in_', len(self.feature_names))
+        model_names = getattr(self.estimator, 'feature_names_in_', None)
+        if n_features != len(self.feature_names) or (
+                model_names is not None and list(model_names) != self.feature_names):
+            raise SchemaError(f"Признаки модели не совпадают со списком "
+                              f"(модель: {n_features}, список: {len(self.feature_names)})")
+
+    @classmethod
+    def load(cls, model_path, feature_names_path, **kwargs):
+        import joblib
+
+        with open(feature_names_path, 'r', encoding='utf-8') as f:
+            feature_names = json.load(f)
+        return cls(joblib.load(model_path), feature_names)
+
+    def predict(self, matrix):
+        start = time.perf_counter()
+        result = self.estimator.predict(matrix)
+        self._record(time.perf_counter() - start)
+        return result
+
+
+if __name__ == "__main__":
+    import config
+
+    parser = argparse.ArgumentParser(description='Экспорт модели в формат LightGBM и замер скорости прогноза')
+    parser.add_argument('model_path', nargs='?', default=config.MODEL_PATHS['lightgbm'])
+    parser.add_argument('feature_names_path', nargs='?', default=config.FEATURE_NAMES_PATH)
+    parser.add_argument('--repeat', type=int, default=1000)
+    parser.add_argument('--export', action='store_true', help='Сохранить модель в родном формате LightGBM (.txt)')
+    args = parser.parse_args()
+
+    if args.export:
+        print(f"💾 Родной формат LightGBM: {export_native(args.model_path)}")
+    engine = InferenceEngine.load(args.model_path, args.feature_names_path)
+    print(f"✅ Модель загружена: {engine.booster.num_trees()} деревьев, {engine.n_features} признаков")
+
+    rng = np.random.default_rng(0)
+    for rows in (1, 24, 48):
+        matrix = rng.random((rows, engine.n_features), dtype=np.float32)
+        engine.predict(matrix)
+        engine.reset_latency()
+        for _ in range(args.repeat):
+            engine.predict(matrix)
+        print(f"⚡ {rows:3d} строк: {engine.latency()['mean_us']:.1f} мкс на вызов")
@@ -0,0 +1,161 @@
+# ingest.py - БЫСТРАЯ ЗАГРУЗКА ИСХОДНОГО ФАЙЛА (ФОРМАТ UCI) С БИНАРНЫМ КЭШЕМ
+#
+# Исходный df/isxod.csv (Date, Time, 7 числовых колонок) читается кусками с
+# явными типами (float32). datetime собирается без склейки строк: даты и время
+# повторяются (в файле ~181 дата и 1440 значений времени), поэтому разбираются
+# только уникальные значения, а затем раскладываются по кодам строк.
+# Результат пишется в колоночное хранилище (columnar.py); следующие запуски
+# открывают его через memory-map, пока исходный файл не изменился.
+#   python tg_bot/ingest.py df/isxod.csv df/raw_cache
+import argparse
+import os
+
+import numpy as np
+
+import config
+from columnar import load_frame, open_store, read_meta, write_meta, write_store
+
+RAW_COLUMNS = ['Global_active_power', 'Global_reactive_power', 'Voltage', 'Global_intensity',
+               'Sub_metering_1', 'Sub_metering_2', 'Sub_metering_3']
+
+# Все варианты записи пропусков, встречавшиеся при анализе в main.ipynb
+MISSING_VALUES = ['?', '', ' ', 'null', 'NULL', 'NaN', 'nan', 'None', 'N/A', 'n/a', '#N/A',
+                  '--', '-', '...', 'NA', 'na', 'Null']
+
+# Формат даты в файле - день первым ('1/1/07'); полный UCI-файл пишет год четырьмя цифрами
+DATE_FORMATS = ['%d/%m/%y', '%d/%m/%Y']
+
+# Пути от корня проекта, а не от текущего каталога (ноутбук, tg_bot/, cron)
+RAW_CSV_PATH = os.path.join(config.BASE_DIR, 'df', 'isxod.csv')
+RAW_CACHE_DIR = os.path.join(config.BASE_DIR, 'df', 'raw_cache')
+
+
+def detect_date_format(sample_dates, formats=DATE_FORMATS):
+    """Выбирает формат, который разбирает больше всего образцов дат"""
+    import pandas as pd
+
+    sample = pd.Series(pd.Series(sample_dates).dropna().unique()[:100])
+    parsed = {date_format: int(pd.to_datetime(sample, format=date_format, errors='coerce').notna().sum())
+              for date_format in formats}
+    best = max(parsed, key=parsed.get)
+    if not parsed[best]:
+        raise ValueError(f"Не удалось определить формат даты по образцам: {list(sample[:3])}")
+    return best
+
+
+def parse_datetime(dates, times, date_format):
+    """Date + Time -> datetime64[ns] без склейки строк: разбираются только уникальные значения.
+
+    Нераспознанные и пропущенные значения дают NaT.
+    """
+    import pandas as pd
+
+    date_codes, date_uniques = pd.factorize(dates)
+    time_codes, time_uniques = pd.factorize(times)
+
+    # Последний элемент NaT: код -1 (пропуск) попадает на него
+    parsed_dates = np.append(pd.to_datetime(pd.Series(date_uniques), format=date_format,
+                                            errors='coerce').values.astype('datetime64[ns]'),
+                             np.datetime64('NaT', 'ns'))
+    parsed_times = np.append(pd.to_timedelta(pd.Series(time_uniques), errors='coerce')
+                             .values.astype('timedelta64[ns]'),
+                             np.timedelta64('NaT', 'ns'))
+
+    return parsed_dates[date_codes] + parsed_times[time_codes]
+
+
+def read_raw_chunks(csv_path, chunksize=500_000, date_format=None, sep=',', stats=None):
+    """Читает исходный файл кусками: явные типы, фиксированный формат даты, индекс datetime.
+
+    Строки с нераспознанными Date/Time отбрасываются (их число - в stats['dropped_rows']).
+    """
+    import pandas as pd
+
+    dtypes = {col: 'float32' for col in RAW_COLUMNS}
+    dtypes.update({'Date': str, 'Time': str})
+    for chunk in pd.read_csv(csv_path, sep=sep, usecols=['Date', 'Time'] + RAW_COLUMNS,
+                             dtype=dtypes, na_values=MISSING_VALUES, chunksize=chunksize):
+        if date_format is None:
+            date_format = detect_date_format(chunk['Date'])
+
+        index = parse_datetime(chunk['Date'].values, chunk['Time'].values, date_format)
+        valid = ~np.isnat(index)
+        if stats is not None:
+            stats['dropped_rows'] = stats.get('dropped_rows', 0) + int((~valid).sum())
+            stats['date_format'] = date_format
+
+        frame = chunk.loc[valid, RAW_COLUMNS]
+        frame.index = pd.DatetimeIndex(index[valid], name='datetime')
+        yield frame
+
+
+def source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {'path': os.path.abspath(csv_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def is_cache_fresh(csv_path, cache_dir=RAW_CACHE_DIR):
+    """Кэш есть и собран из текущей версии файла (если файла нет - годится любой кэш)"""
+    if not os.path.exists(os.path.join(cache_dir, 'meta.json')):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    source = read_meta(cache_dir).get('source', {})
+    current = source_signature(csv_path)
+    return source.get('size') == current['size'] and source.get('mtime_ns') == current['mtime_ns']
+
+
+def build_raw_cache(csv_path, cache_dir=RAW_CACHE_DIR, chunksize=500_000, date_format=None, sep=','):
+    """Исходный файл -> колоночный кэш; медианы и число пропусков сохраняются в meta.json"""
+    stats = {}
+    n_rows = write_store(read_raw_chunks(csv_path, chunksize, date_format, sep, stats), cache_dir,
+                         {'source': source_signature(csv_path)})
+
+    # Медианы считаются один раз по memory-map и хранятся в метаданных
+    columns = open_store(cache_dir)
+    missing = {col: int(np.isnan(columns[col]).sum()) for col in RAW_COLUMNS}
+    medians = {col: float(np.nanmedian(columns[col])) if missing[col] < n_rows else None
+               for col in RAW_COLUMNS}
+
+    meta = read_meta(cache_dir)
+    meta.update({'missing': missing, 'medians': medians, **stats})
+    write_meta(cache_dir, meta)
+    return meta
+
+
+def load_raw_frame(csv_path=RAW_CSV_PATH, cache_dir=RAW_CACHE_DIR, fill_missing=False, rebuild=False,
+                   **build_options):
+    """Исходные данные как DataFrame с индексом datetime.
+
+    Кэш пересобирается, только если исходный файл изменился (или rebuild=True).
+    fill_missing=True заполняет пропуски сохраненными медианами.
+    """
+    if rebuild or not is_cache_fresh(csv_path, cache_dir):
+        build_raw_cache(csv_path, cache_dir, **build_options)
+
+    df = load_frame(cache_dir)
+    if fill_missing:
+        medians = {col: value for col, value in read_meta(cache_dir)['medians'].items() if value is not None}
+        df = df.fillna(medians)
+    return df
+
+
+if __name__ == "__main__":
+    import time
+
+    parser = argparse.ArgumentParser(description='Загрузка исходного файла в бинарный кэш')
+    parser.add_argument('csv_path', nargs='?', default=RAW_CSV_PATH)
+    parser.add_argument('cache_dir', nargs='?', default=RAW_CACHE_DIR)
+    parser.add_argument('--chunksize', type=int, default=500_000)
+    parser.add_argument('--date-format', default=None, help='Например %%d/%%m/%%y; по умолчанию - автоопределение')
+    parser.add_argument('--sep', default=',', help='Разделитель (в оригинальном файле UCI - ;)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    meta = build_raw_cache(args.csv_path, args.cache_dir, args.chunksize, args.date_format, args.sep)
+    print(f"✅ Кэш создан за {time.perf_counter() - start:.1f} с: {meta['n_rows']} строк, "
+          f"отброшено {meta.get('dropped_rows', 0)}")
+
+    start = time.perf_counter()
+    load_raw_frame(args.csv_path, args.cache_dir)
+    print(f"⚡ Загрузка из кэша: {time.perf_counter() - start:.3f} с")
@@ -0,0 +1,200 @@
+# metrics.py - СЧЕТЧИКИ И ГИСТОГРАММЫ ЗАДЕРЖЕК БОТА
+#
+# Этапы обработки (признаки, прогноз, график, отправка в Telegram) замеряются
+# через timer(stage) и попадают в гистограмму с метками stage и handler.
+# handler - обработчик, в потоке которого идет замер (задается handler_context).
+# Экспорт в текстовом формате Prometheus:
+#   registry.serve(port=9100)                 - http://127.0.0.1:9100/metrics
+#   registry.dump_periodically(path, 60)      - файл, перезаписываемый раз в минуту
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Границы корзин гистограммы (секунды): от долей миллисекунды до секунд
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        """Накопленные значения корзин (в Prometheus корзина le включает все меньшие)"""
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            yield bound, running
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=()):
+    """(('stage', 'predict'),) -> {stage="predict"}"""
+    items = [*labels, *extra]
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in items) + '}'
+
+
+class MetricsRegistry:
+    """Потокобезопасный набор счетчиков, гистограмм и вычисляемых показателей"""
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._help = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def gauge(self, name, read, **labels):
+        """Показатель, значение которого читается функцией read() в момент экспорта"""
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = read
+
+    @property
+    def current_handler(self):
+        return getattr(self._local, 'handler', None) or 'none'
+
+    @contextmanager
+    def handler_context(self, handler):
+        """Все замеры этапов внутри блока получают метку handler"""
+        previous = getattr(self._local, 'handler', None)
+        self._local.handler = handler
+        try:
+            yield
+        finally:
+            self._local.handler = previous
+
+    @contextmanager
+    def timer(self, stage):
+        """Замеряет этап: гистограмма bot_stage_seconds{stage, handler}"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('bot_stage_seconds', time.perf_counter() - start,
+                         stage=stage, handler=self.current_handler)
+
+    def snapshot(self):
+        """Текущие значения: {имя{метки}: число} (для гистограмм - count и sum)"""
+        result = {}
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                result[name + format_labels(labels)] = value
+            for (name, labels), histogram in self._histograms.items():
+                result[name + '_count' + format_labels(labels)] = histogram.count
+                result[name + '_sum' + format_labels(labels)] = histogram.total
+        return result
+
+    def render_prometheus(self):
+        """Все показатели в текстовом формате Prometheus"""
+        lines = []
+
+        def header(name, kind, seen):
+            if name in seen:
+                return
+            seen.add(name)
+            if name in self._help:
+                lines.append(f'# HELP {name} {self._help[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        seen = set()
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            gauges = sorted(self._gauges.items(), key=lambda item: item[0])
+            for (name, labels), value in counters:
+                header(name, 'counter', seen)
+                lines.append(f'{name}{format_labels(labels)} {value}')
+            for (name, labels), histogram in histograms:
+                header(name, 'histogram', seen)
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{name}_bucket{format_labels(labels, [("le", bound)])} {count}')
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", "+Inf")])} {histogram.count}')
+                lines.append(f'{name}_sum{format_labels(labels)} {histogram.total:.6f}')
+                lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+
+        for (name, labels), read in gauges:
+            header(name, 'gauge', seen)
+            try:
+                lines.append(f'{name}{format_labels(labels)} {float(read())}')
+            except Exception:
+                continue
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, host='127.0.0.1', port=9100):
+        """HTTP-сервер с /metrics в фоновом потоке"""
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                payload = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        return server
+
+    def dump(self, path):
+        """Атомарно перезаписывает файл с показателями"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+    def dump_periodically(self, path, interval=60.0, stop_event=None):
+        """Фоновый поток, который раз в interval секунд пишет показатели в файл"""
+        stop_event = stop_event or threading.Event()
+
+        def run():
+            while not stop_event.wait(interval):
+                try:
+                    self.dump(path)
+                except OSError as e:
+                    print(f"⚠️ Не удалось записать метрики в {path}: {e}")
+
+        threading.Thread(target=run, name='metrics-dump', daemon=True).start()
+        return stop_event
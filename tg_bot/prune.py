@@ -0,0 +1,204 @@
+# prune.py - ОТБОР ПРИЗНАКОВ РАДИ СКОРОСТИ ПРОГНОЗА
+#
+# Обратное исключение для LightGBM: модель обучается на всех признаках,
+# на проверочном отрезке (последний кусок ряда, строго после обучения)
+# считается важность каждого признака - рост MAE при перемешивании столбца
+# (permutation) или вклад в разбиения (gain). Наименее важные признаки
+# отбрасываются, модель переобучается; шаг принимается, пока MAE не выходит
+# за допуск --tolerance относительно полной модели. На каждом шаге
+# замеряются задержка прогноза на сутки (24 строки) и сборки признаков на
+# сутки тем же путем, что в боте: create_features_batch считает только
+# признаки модели, поэтому меньше признаков - быстрее сборка.
+#
+# Результат - пара файлов, как у обычной модели: lightgbm_pruned_model.pkl и
+# feature_names.json (+ prune_report.json с историей шагов) в --output;
+# --publish добавляет их в реестр версий (registry.py).
+#   python tg_bot/prune.py --features df/features --tolerance 0.02 --step 0.15
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import config
+import train
+from tune import LATENCY_ROWS, predict_latency_us
+
+PRUNED_DIR = os.path.join(config.BASE_DIR, 'models', 'pruned')
+
+
+def fit_lightgbm(X, y, names, params, cores):
+    model = train.make_model('LightGBM', n_jobs=cores, **params)
+    return train.fit_model(model, 'LightGBM', X, y, names)
+
+
+def permutation_importance(model, X_valid, y_valid, rng, repeats=1):
+    """Рост MAE при перемешивании каждого столбца проверочного отрезка"""
+    booster = model.booster_
+    base = np.mean(np.abs(booster.predict(X_valid) - y_valid))
+    importance = np.zeros(X_valid.shape[1])
+    shuffled = X_valid.copy()
+    for j in range(X_valid.shape[1]):
+        for _ in range(repeats):
+            shuffled[:, j] = X_valid[rng.permutation(len(X_valid)), j]
+            importance[j] += np.mean(np.abs(booster.predict(shuffled) - y_valid)) - base
+        shuffled[:, j] = X_valid[:, j]
+    return importance / repeats
+
+
+def gain_importance(model):
+    return model.booster_.feature_importance(importance_type='gain')
+
+
+def build_latency_us(names, repeat=200):
+    """Сборка признаков names на сутки (bot.create_features_batch), медиана в мкс"""
+    # Импорт бота не загружает модель; генератор без истории - календарь и шум EDA
+    import bot
+
+    generator = bot.RealisticDataGenerator(0)
+    target_dates = [datetime.now() + timedelta(days=1)]
+    bot.create_features_batch(target_dates, generator, feature_names=names)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        bot.create_features_batch(target_dates, generator, feature_names=names)
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples) * 1e6)
+
+
+def evaluate(model, X_valid, y_valid, names):
+    predicted = model.booster_.predict(X_valid)
+    return {'n_features': len(names),
+            **train.regression_metrics(y_valid.astype(np.float64), predicted),
+            'predict_us': predict_latency_us(model, X_valid[:LATENCY_ROWS]),
+            'build_us': build_latency_us(names)}
+
+
+def backward_elimination(X_train, y_train, X_valid, y_valid, names, params, tolerance=0.02, step=0.15,
+                         min_features=5, method='permutation', cores=1, seed=42):
+    """Отбрасывает наименее важные признаки, пока MAE в пределах допуска.
+
+    Если шаг из нескольких признаков выходит за допуск, пробуется убрать один;
+    когда и это не проходит - отбор заканчивается. Возвращает (признаки, модель, шаги).
+    """
+    rng = np.random.default_rng(seed)
+    selected = list(range(len(names)))
+    model = fit_lightgbm(X_train, y_train, names, params, cores)
+    baseline = evaluate(model, X_valid, y_valid, names)
+    limit = baseline['MAE'] * (1 + tolerance)
+    steps = [{**baseline, 'dropped': [], 'accepted': True}]
+    print(f"🔹 {len(names)} признаков: MAE {baseline['MAE']:.4f} (допуск до {limit:.4f})")
+
+    while len(selected) > min_features:
+        current = [names[j] for j in selected]
+        if method == 'gain':
+            importance = gain_importance(model)
+        else:
+            importance = permutation_importance(model, X_valid[:, selected], y_valid, rng)
+        order = np.argsort(importance, kind='stable')
+
+        accepted = False
+        for n_drop in dict.fromkeys([max(1, int(len(selected) * step)), 1]):
+            n_drop = min(n_drop, len(selected) - min_features)
+            if n_drop <= 0:
+                break
+            keep = sorted(selected[i] for i in order[n_drop:])
+            keep_names = [names[j] for j in keep]
+            candidate = fit_lightgbm(X_train[:, keep], y_train, keep_names, params, cores)
+            scores = evaluate(candidate, X_valid[:, keep], y_valid, keep_names)
+            dropped = [current[i] for i in order[:n_drop]]
+            accepted = scores['MAE'] <= limit
+            steps.append({**scores, 'dropped': dropped, 'accepted': accepted})
+            print(f"{'✅' if accepted else '❌'} {len(keep)} признаков: MAE {scores['MAE']:.4f}, "
+                  f"прогноз {scores['predict_us']:.0f} мкс, сборка {scores['build_us']:.1f} мкс "
+                  f"(убраны {', '.join(dropped)})")
+            if accepted:
+                selected, model = keep, candidate
+                break
+        if not accepted:
+            break
+    return [names[j] for j in selected], model, steps
+
+
+def save_pruned(output_dir, model, feature_names, report):
+    """Пара файлов модель + список признаков (и отчет) в каталоге output_dir"""
+    import joblib
+
+    os.makedirs(output_dir, exist_ok=True)
+    model_path = os.path.join(output_dir, 'lightgbm_pruned_model.pkl')
+    features_path = os.path.join(output_dir, 'feature_names.json')
+    joblib.dump(model, model_path)
+    with open(features_path, 'w', encoding='utf-8') as f:
+        json.dump(feature_names, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(output_dir, 'prune_report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return model_path, features_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Отбор признаков LightGBM с допуском по MAE')
+    parser.add_argument('--features', default=os.path.join(config.BASE_DIR, 'df', 'features'))
+    parser.add_argument('--feature-names', default=config.FEATURE_NAMES_PATH)
+    parser.add_argument('--params', default=None, help='JSON {модель: параметры} (например, из tune.py)')
+    parser.add_argument('--method', choices=['permutation', 'gain'], default='permutation')
+    parser.add_argument('--tolerance', type=float, default=0.02, help='Допустимый рост MAE (доля)')
+    parser.add_argument('--step', type=float, default=0.15, help='Доля признаков, убираемая за шаг')
+    parser.add_argument('--min-features', type=int, default=5)
+    parser.add_argument('--valid-size', type=int, default=None, help='Строк в проверочном отрезке')
+    parser.add_argument('--cores', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--work-dir', default=train.TRAIN_CACHE_DIR)
+    parser.add_argument('--output', default=PRUNED_DIR)
+    parser.add_argument('--publish', action='store_true', help='Опубликовать результат в реестре версий')
+    parser.add_argument('--activate', action='store_true', help='С --publish: сразу сделать версию активной')
+    args = parser.parse_args()
+
+    with open(args.feature_names, 'r', encoding='utf-8') as f:
+        names = json.load(f)
+    params = {}
+    if args.params:
+        with open(args.params, 'r', encoding='utf-8') as f:
+            params = json.load(f).get('LightGBM', {})
+
+    x_path, y_path = train.prepare_matrix(args.features, names, args.work_dir)
+    X = np.load(x_path, mmap_mode='r')
+    y = np.load(y_path, mmap_mode='r')
+    valid_size = args.valid_size or len(y) // 5
+    train_rows, valid_rows = train.rolling_origin_folds(len(y), 1, valid_size, min_train=len(y) - valid_size)[0]
+    X_train, y_train = np.asarray(X[train_rows]), np.asarray(y[train_rows])
+    X_valid, y_valid = np.asarray(X[valid_rows]), np.asarray(y[valid_rows])
+
+    started = time.perf_counter()
+    selected, _, steps = backward_elimination(X_train, y_train, X_valid, y_valid, names, params,
+                                              args.tolerance, args.step, args.min_features,
+                                              args.method, args.cores, args.seed)
+    first, last = steps[0], [s for s in steps if s['accepted']][-1]
+    print(f"\n{'':12} {'признаков':>9} {'MAE':>8} {'прогноз, мкс':>13} {'сборка, мкс':>12}")
+    for title, row in (('Все', first), ('После отбора', last)):
+        print(f"{title:12} {row['n_features']:9d} {row['MAE']:8.4f} {row['predict_us']:13.0f} {row['build_us']:12.1f}")
+
+    # Итоговая модель - на всех строках, только с отобранными признаками
+    keep = [names.index(name) for name in selected]
+    model = fit_lightgbm(np.asarray(X[:, keep]), np.asarray(y), selected, params, args.cores)
+    report = {'method': args.method, 'tolerance': args.tolerance, 'params': params,
+              'removed': [name for name in names if name not in selected], 'steps': steps,
+              'seconds': time.perf_counter() - started}
+    model_path, features_path = save_pruned(args.output, model, selected, report)
+    print(f"💾 {model_path}\n💾 {features_path}")
+
+    if args.publish:
+        from registry import ModelRegistry
+
+        metrics = {key: last[key] for key in ('MAE', 'RMSE', 'R2', 'predict_us', 'build_us')}
+        registry = ModelRegistry()
+        version = registry.publish(model_path, features_path, metrics)
+        print(f"📦 Версия в реестре: {version}")
+        if args.activate:
+            registry.activate(version)
+            print(f"🔄 Версия {version} активна")
+
+
+if __name__ == "__main__":
+    main()
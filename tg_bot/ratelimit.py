@@ -0,0 +1,70 @@
+# ratelimit.py - ОГРАНИЧЕНИЕ ЧАСТОТЫ ЗАПРОСОВ ПО ЧАТАМ (TOKEN BUCKET)
+#
+# У каждого чата своя корзина на burst жетонов, она пополняется со скоростью
+# rate жетонов в секунду. Запрос тратит cost жетонов (тяжелые кнопки - больше).
+# Если жетонов не хватает, запрос не ставится в очередь пула, а чат узнает,
+# через сколько секунд можно повторить. Так один чат, без остановки жмущий
+# "Сравнить оба", не занимает потоки обработки, а остальные чаты
+# обслуживаются как обычно. Проверка - O(1) под одной блокировкой.
+#   limiter = RateLimiter(rate=0.5, burst=6)
+#   wait = limiter.acquire(chat_id, cost=2)   # 0.0 - можно выполнять
+import threading
+import time
+
+
+class RateLimiter:
+    """Корзины жетонов по chat_id; rate <= 0 - без ограничения"""
+
+    def __init__(self, rate, burst, max_chats=10_000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_chats = max_chats
+        self._clock = clock
+        # chat_id -> [жетоны, время обновления, предупреждение уже отправлено]
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    def acquire(self, chat_id, cost=1.0):
+        """Списывает cost жетонов; 0.0 - запрос разрешен, иначе через сколько секунд повторить"""
+        if self.rate <= 0:
+            return 0.0
+        now = self._clock()
+        # Запрос дороже всей корзины иначе не прошел бы никогда
+        cost = min(cost, self.burst)
+        with self._lock:
+            bucket = self._buckets.get(chat_id)
+            if bucket is None:
+                if len(self._buckets) >= self.max_chats:
+                    self._prune(now)
+                bucket = self._buckets[chat_id] = [self.burst, now, False]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= cost:
+                bucket[0] = tokens - cost
+                bucket[2] = False
+                self.allowed += 1
+                return 0.0
+            bucket[0] = tokens
+            self.limited += 1
+            return (cost - tokens) / self.rate
+
+    def should_warn(self, chat_id):
+        """True один раз за серию отказов: ответы бота об ограничении сами не становятся спамом"""
+        with self._lock:
+            bucket = self._buckets.get(chat_id)
+            if bucket is None or bucket[2]:
+                return False
+            bucket[2] = True
+            return True
+
+    def _prune(self, now):
+        """Удаляет полностью пополненные корзины: они не отличаются от новой"""
+        full = [chat_id for chat_id, (tokens, updated, _) in self._buckets.items()
+                if tokens + (now - updated) * self.rate >= self.burst]
+        for chat_id in full:
+            del self._buckets[chat_id]
+
+    def __len__(self):
+        return len(self._buckets)
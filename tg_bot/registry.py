@@ -0,0 +1,243 @@
+# registry.py - РЕЕСТР ВЕРСИЙ МОДЕЛЕЙ
+#
+# Каждая версия - отдельный каталог models/versions/<версия>/:
+#   model.pkl            - модель (LGBMRegressor, XGBRegressor, RandomForest...)
+#   model.txt            - та же модель LightGBM в родном формате (быстрая загрузка)
+#   feature_names.json   - признаки в порядке модели
+#   metrics.json         - метрики обучения (если есть)
+#   manifest.json        - тип модели, дата, откуда опубликована
+# Активная версия записана в models/versions/CURRENT. Бот следит за этим
+# файлом (или получает /reload) и подменяет модель на лету: новая версия
+# загружается и прогревается рядом со старой, затем подмена одним
+# присваиванием, запросы в работе досчитываются старой моделью.
+#   python tg_bot/registry.py publish models/lightgbm_best_model.pkl --activate
+#   python tg_bot/registry.py list
+#   python tg_bot/registry.py activate 20250101-120000-lightgbm
+#   python tg_bot/registry.py compare --features df/features --rows 5000
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+
+import config
+from inference import EstimatorEngine, InferenceEngine, SchemaError
+
+CURRENT_FILE = 'CURRENT'
+
+# Класс модели -> тип в манифесте
+MODEL_KINDS = {'LGBMRegressor': 'lightgbm', 'XGBRegressor': 'xgboost',
+               'RandomForestRegressor': 'randomforest'}
+
+
+def read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_text_atomic(path, text):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def file_version(path):
+    """Хэш файла модели (как MODEL_VERSION для модели вне реестра)"""
+    with open(path, 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()[:12]
+
+
+def validate_features(feature_names, schema):
+    """Признаки версии должны быть из схемы бота (тех, что умеет считать create_features_batch)"""
+    unknown = [name for name in feature_names if name not in set(schema)]
+    if unknown:
+        raise SchemaError(f"Бот не умеет считать признаки: {', '.join(unknown[:5])}"
+                          + (' ...' if len(unknown) > 5 else ''))
+    if len(set(feature_names)) != len(feature_names):
+        raise SchemaError("В списке признаков есть повторы")
+
+
+class ModelRegistry:
+    """Каталоги версий моделей и указатель на активную"""
+
+    def __init__(self, root=None):
+        self.root = root or config.MODEL_REGISTRY_DIR
+
+    def path(self, version, name=''):
+        return os.path.join(self.root, version, name)
+
+    def versions(self):
+        """Версии по времени публикации (старые первыми)"""
+        if not os.path.isdir(self.root):
+            return []
+        # Каталоги с точкой - версии, которые еще копируются (publish)
+        found = [name for name in os.listdir(self.root)
+                 if not name.startswith('.') and os.path.exists(self.path(name, 'manifest.json'))]
+        return sorted(found, key=lambda name: read_json(self.path(name, 'manifest.json'))['created'])
+
+    def manifest(self, version):
+        manifest = read_json(self.path(version, 'manifest.json'))
+        if manifest is None:
+            raise KeyError(f"Нет версии модели {version} в {self.root}")
+        return manifest
+
+    def metrics(self, version):
+        return read_json(self.path(version, 'metrics.json'), {})
+
+    def current(self):
+        """Активная версия или None, если реестр пуст"""
+        current_path = os.path.join(self.root, CURRENT_FILE)
+        if not os.path.exists(current_path):
+            return None
+        with open(current_path, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+
+    def current_mtime(self):
+        try:
+            return os.path.getmtime(os.path.join(self.root, CURRENT_FILE))
+        except OSError:
+            return None
+
+    def activate(self, version):
+        self.manifest(version)
+        write_text_atomic(os.path.join(self.root, CURRENT_FILE), version + '\n')
+
+    def publish(self, model_path, feature_names_path, metrics=None, version=None, schema=None):
+        """Копирует модель и список признаков в новый каталог версии; возвращает имя версии.
+
+        Каталог собирается рядом под временным именем и переименовывается целиком,
+        поэтому бот никогда не видит версию без части файлов.
+        """
+        import joblib
+
+        feature_names = read_json(feature_names_path)
+        validate_features(feature_names, schema or read_json(config.FEATURE_NAMES_PATH))
+        model = joblib.load(model_path)
+        kind = MODEL_KINDS.get(type(model).__name__, 'sklearn')
+        version = version or f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{kind}"
+        if os.path.exists(self.path(version)):
+            raise FileExistsError(f"Версия {version} уже есть")
+
+        staging = self.path('.' + version + '.tmp')
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        shutil.copy2(model_path, os.path.join(staging, 'model.pkl'))
+        if kind == 'lightgbm':
+            # Экспорт в родной формат - при публикации, чтобы загрузка в боте только читала
+            model.booster_.save_model(os.path.join(staging, 'model.txt'))
+        with open(os.path.join(staging, 'feature_names.json'), 'w', encoding='utf-8') as f:
+            json.dump(feature_names, f, ensure_ascii=False, indent=2)
+        if metrics:
+            with open(os.path.join(staging, 'metrics.json'), 'w', encoding='utf-8') as f:
+                json.dump(metrics, f, ensure_ascii=False, indent=2)
+        with open(os.path.join(staging, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'kind': kind, 'created': datetime.now().isoformat(timespec='seconds'),
+                       'source': os.path.abspath(model_path), 'hash': file_version(model_path),
+                       'n_features': len(feature_names)}, f, ensure_ascii=False, indent=2)
+        os.rename(staging, self.path(version))
+        return version
+
+    def load(self, version, schema=None):
+        """Загружает версию с проверкой схемы признаков; возвращает движок прогноза"""
+        manifest = self.manifest(version)
+        model_path = self.path(version, 'model.pkl')
+        features_path = self.path(version, 'feature_names.json')
+        validate_features(read_json(features_path), schema or read_json(config.FEATURE_NAMES_PATH))
+        if manifest['kind'] == 'lightgbm':
+            return InferenceEngine.load(model_path, features_path)
+        return EstimatorEngine.load(model_path, features_path)
+
+
+def score_side_by_side(engines, columns, actual=None):
+    """Прогноз нескольких моделей на одном и том же наборе строк.
+
+    columns - {признак: массив}; каждая модель берет свои признаки в своем порядке.
+    Возвращает {версия: {'mean', 'latency_us', ['MAE', 'RMSE']}} и прогнозы.
+    """
+    from features import feature_matrix
+
+    report = {}
+    predictions = {}
+    for version, engine in engines.items():
+        matrix = feature_matrix(columns, engine.feature_names)
+        engine.reset_latency()
+        predicted = np.asarray(engine.predict(matrix), dtype=np.float64)
+        predictions[version] = predicted
+        row = {'mean': float(predicted.mean()), 'latency_us': engine.latency()['last_us']}
+        if actual is not None:
+            error = predicted - actual
+            row.update(MAE=float(np.abs(error).mean()), RMSE=float(np.sqrt((error ** 2).mean())))
+        report[version] = row
+    return report, predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Реестр версий моделей')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    publish = commands.add_parser('publish', help='Опубликовать модель как новую версию')
+    publish.add_argument('model_path')
+    publish.add_argument('--feature-names', default=config.FEATURE_NAMES_PATH)
+    publish.add_argument('--metrics', default=None, help='JSON с метриками обучения')
+    publish.add_argument('--version', default=None)
+    publish.add_argument('--activate', action='store_true', help='Сразу сделать активной')
+
+    commands.add_parser('list', help='Версии и метрики')
+
+    activate = commands.add_parser('activate', help='Сделать версию активной (бот подхватит сам)')
+    activate.add_argument('version')
+
+    compare = commands.add_parser('compare', help='Сравнить версии на одних и тех же строках истории')
+    compare.add_argument('versions', nargs='*', help='По умолчанию - все')
+    compare.add_argument('--features', default=os.path.join(config.BASE_DIR, 'df', 'features'))
+    compare.add_argument('--rows', type=int, default=5000, help='Последних строк истории')
+
+    parser.add_argument('--root', default=config.MODEL_REGISTRY_DIR)
+    args = parser.parse_args()
+    registry = ModelRegistry(args.root)
+
+    if args.command == 'publish':
+        version = registry.publish(args.model_path, args.feature_names, read_json(args.metrics) if args.metrics else None,
+                                   args.version)
+        print(f"✅ Опубликована версия {version}")
+        if args.activate:
+            registry.activate(version)
+            print(f"🔄 Версия {version} активна")
+
+    elif args.command == 'list':
+        current = registry.current()
+        for version in registry.versions():
+            manifest = registry.manifest(version)
+            metrics = registry.metrics(version)
+            scores = ', '.join(f"{key} {value:.4f}" for key, value in metrics.items() if isinstance(value, float))
+            marker = '▶' if version == current else ' '
+            print(f"{marker} {version:<32} {manifest['kind']:<13} {manifest['n_features']:3d} признаков  {scores}")
+
+    elif args.command == 'activate':
+        registry.activate(args.version)
+        print(f"🔄 Версия {args.version} активна")
+
+    elif args.command == 'compare':
+        from features import TARGET, open_feature_store
+
+        columns = open_feature_store(args.features)
+        rows = slice(max(0, len(columns[TARGET]) - args.rows), len(columns[TARGET]))
+        batch = {name: np.asarray(values[rows]) for name, values in columns.items() if name != 'datetime'}
+        engines = {version: registry.load(version) for version in (args.versions or registry.versions())}
+        names = sorted({name for engine in engines.values() for name in engine.feature_names})
+        valid = ~np.isnan(np.column_stack([batch[name] for name in names] + [batch[TARGET]])).any(axis=1)
+        batch = {name: values[valid] for name, values in batch.items()}
+        report, _ = score_side_by_side(engines, batch, batch[TARGET].astype(np.float64))
+        print(f"{'Версия':<32} {'MAE':>8} {'RMSE':>8} {'среднее':>8} {'прогноз, мкс':>13}  ({int(valid.sum())} строк)")
+        for version, row in report.items():
+            print(f"{version:<32} {row['MAE']:8.4f} {row['RMSE']:8.4f} {row['mean']:8.3f} {row['latency_us']:13.0f}")
+
+
+if __name__ == "__main__":
+    main()
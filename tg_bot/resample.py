@@ -0,0 +1,81 @@
+# resample.py - АГРЕГАЦИЯ ПОМИНУТНОГО РЯДА ДО ЧАСОВОГО
+#
+# df/obr.csv - поминутные данные, а признаки называются в часах
+# (lag_same_day_24h, rolling_mean_168h). Перед расчетом признаков ряд
+# сводится к регулярной сетке с шагом interval (по умолчанию 1 час):
+# среднее по каждому интервалу, пропущенные интервалы - строки с NaN.
+# Тогда shift(24) - это ровно 24 часа назад, даже если в данных были дыры.
+COLUMNS = ['Global_active_power', 'Sub_metering_1', 'Sub_metering_2', 'Sub_metering_3']
+
+DEFAULT_INTERVAL = '1h'
+
+
+def read_obr_chunks(csv_path, chunksize=500_000):
+    """Читает CSV со схемой df/obr.csv кусками: только нужные колонки, фиксированный формат даты"""
+    import pandas as pd
+
+    for chunk in pd.read_csv(csv_path, usecols=['datetime'] + COLUMNS, chunksize=chunksize,
+                             dtype={col: 'float32' for col in COLUMNS}):
+        chunk.index = pd.to_datetime(chunk.pop('datetime'), format='%Y-%m-%d %H:%M:%S')
+        yield chunk
+
+
+def steps_per_hour(interval=DEFAULT_INTERVAL):
+    """Сколько шагов сетки в одном часе (для перевода лагов из часов в строки)"""
+    import pandas as pd
+
+    return pd.Timedelta('1h') / pd.Timedelta(interval)
+
+
+def hours_to_steps(hours, interval=DEFAULT_INTERVAL):
+    return max(1, int(round(hours * steps_per_hour(interval))))
+
+
+def resample_chunks(frames, interval=DEFAULT_INTERVAL, columns=COLUMNS):
+    """Сводит упорядоченный по времени ряд к регулярной сетке, кусок за куском.
+
+    Последний интервал куска может продолжиться в следующем куске, поэтому
+    его суммы переносятся дальше и выдаются только когда интервал закрыт.
+    """
+    import pandas as pd
+
+    step = pd.Timedelta(interval)
+    carry_sums = None
+    carry_counts = None
+    next_bucket = None
+
+    def emit(sums, counts):
+        nonlocal next_bucket
+        means = (sums / counts.where(counts > 0)).astype('float32')
+        start = means.index[0] if next_bucket is None else next_bucket
+        grid = pd.date_range(start, means.index[-1], freq=step, name='datetime')
+        next_bucket = grid[-1] + step
+        return means.reindex(grid)
+
+    for frame in frames:
+        if frame.empty:
+            continue
+        grouped = frame[columns].astype('float64').groupby(frame.index.floor(step))
+        sums = grouped.sum()
+        counts = grouped.count()
+        if carry_sums is not None:
+            sums = pd.concat([carry_sums, sums]).groupby(level=0).sum()
+            counts = pd.concat([carry_counts, counts]).groupby(level=0).sum()
+        if next_bucket is not None:
+            # Опоздавшие строки за уже выданные интервалы отбрасываются
+            sums, counts = sums[sums.index >= next_bucket], counts[counts.index >= next_bucket]
+
+        carry_sums, carry_counts = sums.iloc[-1:], counts.iloc[-1:]
+        if len(sums) > 1:
+            yield emit(sums.iloc[:-1], counts.iloc[:-1])
+
+    if carry_sums is not None and len(carry_sums):
+        yield emit(carry_sums, carry_counts)
+
+
+def resample_frame(frame, interval=DEFAULT_INTERVAL, columns=COLUMNS):
+    """Агрегация целого DataFrame (для небольших данных и ноутбуков)"""
+    import pandas as pd
+
+    parts = list(resample_chunks([frame.sort_index()], interval, columns))
+    return pd.concat(parts) if parts else frame.iloc[:0][columns]
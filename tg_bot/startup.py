@@ -0,0 +1,26 @@
+# startup.py - ОТЧЕТ О ВРЕМЕНИ ЗАПУСКА БОТА
+import time
+
+
+class StartupTimer:
+    """Замеряет этапы запуска: mark(name) закрывает этап, начатый предыдущей отметкой"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last))
+        self._last = now
+
+    @property
+    def total(self):
+        return self._last - self.started
+
+    def report(self):
+        lines = ["⏱️ Время запуска:"]
+        lines += [f"  {name}: {seconds * 1000:.0f} мс" for name, seconds in self.phases]
+        lines.append(f"  Итого до готовности: {self.total:.2f} с")
+        return '\n'.join(lines)
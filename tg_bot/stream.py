@@ -0,0 +1,280 @@
+# stream.py - ПОТОКОВЫЙ ПРИЕМ ПОКАЗАНИЙ СЧЕТЧИКА
+#
+# Поминутные показания копятся в текущем часе. Когда час закрывается, его
+# среднее попадает в кольцевой буфер, а скользящие окна обновляются за O(1):
+# одно значение входит в окно, одно выходит. После каждого часа вектор
+# признаков для следующего часа пересчитывается и сразу готов для model.predict.
+#
+# Источники показаний:
+#   tail_file(path, state)         - дописываемый CSV (как tail -f)
+#   serve_socket(state, port=8765) - строки CSV по TCP на localhost
+import argparse
+import math
+import socketserver
+import threading
+import time
+
+import numpy as np
+
+from features import calendar_features, lag_interactions, submetering_features
+from history import LAG_HOURS, ROLLING_END_LAG, ROLLING_SCALE, ROLLING_WINDOWS
+
+# Колонки в порядке df/obr.csv
+OBR_COLUMNS = ['datetime', 'Global_active_power', 'Global_reactive_power', 'Voltage',
+               'Global_intensity', 'Sub_metering_1', 'Sub_metering_2', 'Sub_metering_3']
+
+# Хватает на самый длинный лаг (168ч) и окно недели, которое заканчивается на t-2
+BUFFER_HOURS = 24 * 8
+# Метка пустого слота буфера
+EMPTY_HOUR = np.iinfo(np.int64).min
+
+
+def epoch_hour(timestamp):
+    """Номер часа от эпохи для datetime / строки ISO / datetime64"""
+    return int(np.datetime64(timestamp, 'h').astype(np.int64))
+
+
+class RollingWindow:
+    """Сумма, сумма квадратов и количество значений в окне; пропуски (NaN) не считаются"""
+
+    def __init__(self, size):
+        self.size = size
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.count = 0
+
+    def add(self, value):
+        if not math.isnan(value):
+            self.total += value
+            self.total_sq += value * value
+            self.count += 1
+
+    def remove(self, value):
+        if not math.isnan(value):
+            self.total -= value
+            self.total_sq -= value * value
+            self.count -= 1
+
+    def mean(self):
+        return self.total / self.count if self.count else math.nan
+
+    def std(self):
+        """Выборочное стандартное отклонение (ddof=1, как в pandas)"""
+        if self.count < 2:
+            return math.nan
+        variance = (self.total_sq - self.total * self.total / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0.0))
+
+
+class StreamingFeatureState:
+    """Состояние потоковых признаков одного домохозяйства"""
+
+    def __init__(self, feature_names, buffer_hours=BUFFER_HOURS):
+        self.feature_names = list(feature_names)
+        self.buffer_hours = buffer_hours
+        self.power = np.full(buffer_hours, np.nan)
+        self.submetering = np.full((buffer_hours, 3), np.nan)
+        # Час, записанный в каждый слот: слот от часа, вышедшего из буфера, не читается
+        self.slot_hours = np.full(buffer_hours, EMPTY_HOUR, dtype=np.int64)
+        self.last_hour = None
+
+        # Открытый (текущий) час: суммы и число известных показаний по каждой величине
+        self.open_hour = None
+        self.open_sums = [0.0, 0.0, 0.0, 0.0]
+        self.open_counts = [0, 0, 0, 0]
+
+        self._reset_windows()
+        self.dropped = 0
+        self.vector = None
+        self.features = {}
+        self._lock = threading.Lock()
+
+    def _reset_windows(self):
+        self.windows = {name: RollingWindow(size) for name, size in ROLLING_WINDOWS.items()}
+        self.std_window = RollingWindow(24)
+
+    def _reset_buffer(self, last_hour):
+        """Пропуск длиннее буфера: ни одно значение из буфера и окон больше не понадобится"""
+        self.power[:] = np.nan
+        self.submetering[:] = np.nan
+        self.slot_hours[:] = EMPTY_HOUR
+        self._reset_windows()
+        # Как после заполнения пропуска NaN-часами: вектор - для часа last_hour + 1
+        self.last_hour = last_hour
+        self._update_features()
+
+    def value_at(self, hour):
+        """Среднее потребление за закрытый час (NaN, если часа нет в буфере)"""
+        slot = hour % self.buffer_hours
+        if self.slot_hours[slot] != hour:
+            return math.nan
+        return float(self.power[slot])
+
+    def add_reading(self, timestamp, power, sub_1=math.nan, sub_2=math.nan, sub_3=math.nan):
+        """Добавляет одно показание за O(1); возвращает True, если закрылся час.
+
+        Неизвестные значения (NaN, как у push_hourly) в среднее за час не входят -
+        так же, как пропуски при агрегации в resample.py.
+        """
+        hour = epoch_hour(timestamp)
+        with self._lock:
+            if self.open_hour is not None and hour < self.open_hour:
+                # Опоздавшее показание за уже закрытый час
+                self.dropped += 1
+                return False
+
+            closed = False
+            if self.open_hour is not None and hour > self.open_hour:
+                self._close_open_hour()
+                # Часы без показаний - пропуски
+                self._fill_gap(hour)
+                closed = True
+            if self.open_hour != hour:
+                self.open_hour = hour
+                self.open_sums = [0.0, 0.0, 0.0, 0.0]
+                self.open_counts = [0, 0, 0, 0]
+
+            for i, value in enumerate((power, sub_1, sub_2, sub_3)):
+                if not math.isnan(value):
+                    self.open_sums[i] += value
+                    self.open_counts[i] += 1
+            return closed
+
+    def drop(self):
+        """Учитывает отброшенное показание (например, неразобранную строку)"""
+        with self._lock:
+            self.dropped += 1
+
+    def push_hourly(self, timestamp, power, submetering=(math.nan, math.nan, math.nan)):
+        """Добавляет готовое часовое значение (например, при прогреве из HistoryStore)"""
+        with self._lock:
+            hour = epoch_hour(timestamp)
+            if self.last_hour is not None and hour <= self.last_hour:
+                self.dropped += 1
+                return
+            if self.last_hour is not None:
+                self._fill_gap(hour)
+            self._push_hour(hour, power, submetering)
+
+    def _fill_gap(self, hour):
+        """Пропуски между last_hour и hour: по одному NaN-часу или сброс, если пропуск длиннее буфера"""
+        if hour - self.last_hour > self.buffer_hours:
+            self._reset_buffer(hour - 1)
+            return
+        for missing in range(self.last_hour + 1, hour):
+            self._push_hour(missing, math.nan, (math.nan, math.nan, math.nan))
+
+    def _close_open_hour(self):
+        means = [total / count if count else math.nan for total, count in zip(self.open_sums, self.open_counts)]
+        self._push_hour(self.open_hour, means[0], means[1:])
+
+    def _push_hour(self, hour, power, submetering):
+        slot = hour % self.buffer_hours
+        self.slot_hours[slot] = hour
+        self.power[slot] = power
+        self.submetering[slot] = submetering
+        self.last_hour = hour
+
+        # Окна для прогноза часа hour+1 заканчиваются на (hour+1)-2 = hour-1
+        entering_hour = hour + 1 - ROLLING_END_LAG
+        entering = self.value_at(entering_hour)
+        for window in (*self.windows.values(), self.std_window):
+            window.add(entering)
+            window.remove(self.value_at(entering_hour - window.size))
+
+        self._update_features()
+
+    def _update_features(self):
+        """Пересчитывает вектор признаков для следующего часа (O(число признаков))"""
+        target_hour = self.last_hour + 1
+        target = np.datetime64(target_hour, 'h').astype(object)
+
+        features = calendar_features(target.hour, target.weekday(), target.month)
+        for name, lag in LAG_HOURS.items():
+            features[name] = self.value_at(target_hour - lag)
+        features.update(lag_interactions(features['lag_same_day_24h'], features['lag_48h_ago'],
+                                         features['lag_week_ago_168h'], target.hour, target.weekday()))
+        for name, window in self.windows.items():
+            features[name] = window.mean() * ROLLING_SCALE.get(name, 1.0)
+        features['rolling_std_24h_past'] = self.std_window.std()
+        features.update(submetering_features(*self.submetering[self.last_hour % self.buffer_hours]))
+
+        self.features = features
+        self.vector = np.array([[float(features[name]) for name in self.feature_names]])
+
+    def current_vector(self):
+        """Матрица 1 × признаков для следующего часа (None, пока не закрыт ни один час)"""
+        with self._lock:
+            return self.vector
+
+
+def parse_reading(line, columns=OBR_COLUMNS):
+    """Разбирает строку CSV со схемой df/obr.csv в аргументы add_reading"""
+    values = dict(zip(columns, line.strip().split(',')))
+    return (values['datetime'], float(values['Global_active_power']),
+            *(float(values.get(name, math.nan)) for name in ('Sub_metering_1', 'Sub_metering_2', 'Sub_metering_3')))
+
+
+def ingest_lines(lines, state, columns=OBR_COLUMNS):
+    """Передает строки CSV в состояние; строка с заголовком меняет порядок колонок"""
+    for line in lines:
+        if not line.strip():
+            continue
+        if line.startswith('datetime'):
+            columns = line.strip().split(',')
+            continue
+        try:
+            state.add_reading(*parse_reading(line, columns))
+        except (KeyError, ValueError):
+            state.drop()
+    return columns
+
+
+def tail_file(path, state, poll_interval=1.0, stop_event=None, from_start=True):
+    """Следит за дописываемым CSV и передает новые строки в состояние"""
+    columns = OBR_COLUMNS
+    with open(path, 'r', encoding='utf-8') as f:
+        if not from_start:
+            f.seek(0, 2)
+        pending = ''
+        while stop_event is None or not stop_event.is_set():
+            chunk = f.read()
+            if not chunk:
+                time.sleep(poll_interval)
+                continue
+            pending += chunk
+            *lines, pending = pending.split('\n')
+            columns = ingest_lines(lines, state, columns)
+
+
+def serve_socket(state, host='127.0.0.1', port=8765):
+    """TCP-сервер: каждое подключение присылает строки CSV со схемой df/obr.csv"""
+
+    class ReadingHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            lines = (raw.decode('utf-8') for raw in self.rfile)
+            ingest_lines(lines, state)
+
+    server = socketserver.ThreadingTCPServer((host, port), ReadingHandler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    import json
+
+    parser = argparse.ArgumentParser(description='Потоковый прием показаний счетчика')
+    parser.add_argument('--file', help='CSV, за которым следить (как tail -f)')
+    parser.add_argument('--port', type=int, default=8765, help='Порт TCP-сервера на localhost')
+    parser.add_argument('--features', default='models/feature_names.json')
+    args = parser.parse_args()
+
+    with open(args.features, 'r', encoding='utf-8') as f:
+        state = StreamingFeatureState(json.load(f))
+
+    if args.file:
+        print(f"📡 Следим за файлом {args.file}")
+        tail_file(args.file, state)
+    else:
+        print(f"📡 Принимаем показания на 127.0.0.1:{args.port}")
+        serve_socket(state, port=args.port).serve_forever()
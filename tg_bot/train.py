@@ -0,0 +1,279 @@
+# train.py - ОБУЧЕНИЕ МОДЕЛЕЙ С КРОСС-ВАЛИДАЦИЕЙ ПО ВРЕМЕНИ
+#
+# То же, что model.ipynb (RandomForest, XGBoost, LightGBM с параметрами из
+# ноутбука), но из командной строки и параллельно:
+# - признаки берутся из колоночного хранилища (features.py) и один раз
+#   собираются в float32-матрицу на диске; процессы пула открывают ее через
+#   memory-map, а не получают копию через pickle;
+# - вместо одного разбиения 80/20 - rolling-origin фолды: обучение на всем
+#   до точки отсчета, проверка на следующем отрезке, точка сдвигается вперед;
+# - каждая пара (модель, фолд) - отдельная задача пула процессов, у каждой
+#   задачи не больше --cores-per-job потоков.
+# Лучшая по среднему MAE модель переобучается на всех данных и сохраняется
+# так же, как в ноутбуке: models/<модель>_best_model.pkl, model_metrics.csv,
+# feature_names.json. Параметры моделей можно взять из подбора (tune.py):
+#   python tg_bot/train.py --features df/features --folds 4 --cores-per-job 2
+#   python tg_bot/train.py --params models/best_params.json --publish --activate
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import config
+from columnar import read_meta
+from features import TARGET, feature_matrix, open_feature_store
+
+# Модели и параметры из model.ipynb; n_jobs задается лимитом ядер на задачу
+MODEL_SPECS = {
+    'RandomForest': ('sklearn.ensemble', 'RandomForestRegressor',
+                     {'n_estimators': 100, 'max_depth': 20, 'random_state': 42}),
+    'XGBoost': ('xgboost', 'XGBRegressor',
+                {'n_estimators': 100, 'max_depth': 10, 'learning_rate': 0.1, 'random_state': 42}),
+    'LightGBM': ('lightgbm', 'LGBMRegressor',
+                 {'n_estimators': 100, 'max_depth': 10, 'learning_rate': 0.1, 'random_state': 42,
+                  'verbose': -1}),
+}
+
+TRAIN_CACHE_DIR = os.path.join(config.BASE_DIR, 'df', 'train_cache')
+
+# Матрица признаков, открытая в процессе пула (initializer)
+_shared = {}
+
+
+def make_model(name, n_jobs=1, **params):
+    """Новый экземпляр модели из MODEL_SPECS (params переопределяют параметры ноутбука)"""
+    import importlib
+
+    module_name, class_name, defaults = MODEL_SPECS[name]
+    estimator = getattr(importlib.import_module(module_name), class_name)
+    return estimator(**{**defaults, **params, 'n_jobs': n_jobs})
+
+
+def fit_model(model, name, X, y, feature_names=None, **fit_params):
+    """LightGBM получает имена признаков: иначе в модели будут Column_0... и бот ее не примет"""
+    if name == 'LightGBM' and feature_names is not None:
+        fit_params['feature_name'] = list(feature_names)
+    model.fit(X, y, **fit_params)
+    return model
+
+
+def prepare_matrix(features_dir, feature_names, work_dir=TRAIN_CACHE_DIR, chunksize=200_000):
+    """Собирает X (float32, порядок feature_names) и y из хранилища признаков в .npy на диске.
+
+    Строки с пропусками в признаках или цели отбрасываются, как dropna() в ноутбуке.
+    Повторный вызов с тем же хранилищем и списком признаков берет готовые файлы.
+    """
+    columns = open_feature_store(features_dir)
+    missing = [name for name in feature_names if name not in columns]
+    if missing:
+        raise ValueError(f"В хранилище {features_dir} нет признаков: {missing}")
+
+    x_path, y_path, meta_path = (os.path.join(work_dir, name) for name in ('X.npy', 'y.npy', 'meta.json'))
+    signature = {'features_dir': os.path.abspath(features_dir), 'store': read_meta(features_dir),
+                 'feature_names': list(feature_names)}
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            if json.load(f).get('signature') == signature:
+                return x_path, y_path
+
+    n_rows = len(columns[TARGET])
+    keep = np.ones(n_rows, dtype=bool)
+    for start in range(0, n_rows, chunksize):
+        stop = min(start + chunksize, n_rows)
+        part = keep[start:stop]
+        for name in [*feature_names, TARGET]:
+            part &= ~np.isnan(np.asarray(columns[name][start:stop], dtype=np.float32))
+    rows = np.flatnonzero(keep)
+
+    os.makedirs(work_dir, exist_ok=True)
+    X = np.lib.format.open_memmap(x_path, mode='w+', dtype=np.float32, shape=(len(rows), len(feature_names)))
+    y = np.lib.format.open_memmap(y_path, mode='w+', dtype=np.float32, shape=(len(rows),))
+    for start in range(0, len(rows), chunksize):
+        part = rows[start:start + chunksize]
+        X[start:start + len(part)] = feature_matrix({name: columns[name][part] for name in feature_names},
+                                                    feature_names)
+        y[start:start + len(part)] = columns[TARGET][part]
+    X.flush()
+    y.flush()
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump({'signature': signature, 'n_rows': len(rows),
+                   'start': str(columns['datetime'][rows[0]]) if len(rows) else None,
+                   'end': str(columns['datetime'][rows[-1]]) if len(rows) else None},
+                  f, ensure_ascii=False, indent=2)
+    return x_path, y_path
+
+
+def rolling_origin_folds(n_rows, n_folds=4, test_size=None, min_train=None, gap=0):
+    """Фолды (train, test) как срезы: train = [0, origin - gap), test = [origin, origin + test_size).
+
+    По умолчанию первая точка отсчета - половина ряда, остаток делится на n_folds отрезков.
+    gap - число строк между обучением и проверкой (защита от утечки через лаги).
+    """
+    min_train = min_train or n_rows // 2
+    test_size = test_size or (n_rows - min_train) // n_folds
+    if test_size <= 0 or min_train + test_size > n_rows:
+        raise ValueError(f"Слишком мало строк ({n_rows}) для {n_folds} фолдов")
+    folds = []
+    for k in range(n_folds):
+        origin = min_train + k * test_size
+        if origin + test_size > n_rows:
+            break
+        folds.append((slice(0, max(0, origin - gap)), slice(origin, origin + test_size)))
+    return folds
+
+
+def regression_metrics(y_true, y_pred):
+    """MAE, RMSE и R² (как в ноутбуке), без sklearn"""
+    errors = np.asarray(y_pred, dtype=np.float64) - y_true
+    mae = float(np.mean(np.abs(errors)))
+    rmse = float(np.sqrt(np.mean(errors ** 2)))
+    variance = float(np.sum((y_true - np.mean(y_true)) ** 2))
+    r2 = 1 - float(np.sum(errors ** 2)) / variance if variance > 0 else float('nan')
+    return {'MAE': mae, 'RMSE': rmse, 'R2': r2}
+
+
+def init_worker(x_path, y_path, cores_per_job):
+    """Запускается в каждом процессе пула: ограничение потоков и общая матрица через memory-map"""
+    for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[variable] = str(cores_per_job)
+    _shared['X'] = np.load(x_path, mmap_mode='r')
+    _shared['y'] = np.load(y_path, mmap_mode='r')
+    _shared['cores'] = cores_per_job
+    with open(os.path.join(os.path.dirname(x_path), 'meta.json'), 'r', encoding='utf-8') as f:
+        _shared['feature_names'] = json.load(f)['signature']['feature_names']
+
+
+def fit_and_score(name, fold, train, test, params=None):
+    """Задача пула: обучение модели на срезе train и оценка на test"""
+    X, y = _shared['X'], _shared['y']
+    model = make_model(name, n_jobs=_shared['cores'], **(params or {}))
+    start = time.perf_counter()
+    fit_model(model, name, X[train], y[train], _shared['feature_names'])
+    fit_seconds = time.perf_counter() - start
+    scores = regression_metrics(y[test].astype(np.float64), model.predict(X[test]))
+    return {'model': name, 'fold': fold, 'train_rows': train.stop - train.start,
+            'test_rows': test.stop - test.start, 'fit_seconds': fit_seconds, **scores}
+
+
+def fit_full(name, params=None):
+    """Задача пула: обучение на всех строках (итоговая модель)"""
+    model = make_model(name, n_jobs=_shared['cores'], **(params or {}))
+    return fit_model(model, name, _shared['X'], _shared['y'], _shared['feature_names'])
+
+
+def make_pool(x_path, y_path, workers, cores_per_job):
+    """Пул процессов (spawn: без копии OpenMP-состояния родителя) с общей матрицей признаков"""
+    import multiprocessing
+
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=init_worker, initargs=(x_path, y_path, cores_per_job))
+
+
+def default_workers(cores_per_job):
+    return max(1, (os.cpu_count() or 1) // cores_per_job)
+
+
+def cross_validate(pool, models, folds, params=None):
+    """Все пары (модель, фолд) параллельно; результаты в порядке (модель, фолд)"""
+    params = params or {}
+    futures = [pool.submit(fit_and_score, name, k, train, test, params.get(name))
+               for name in models for k, (train, test) in enumerate(folds)]
+    return [future.result() for future in futures]
+
+
+def summarize_folds(fold_results):
+    """Среднее и разброс метрик по фолдам для каждой модели"""
+    summary = {}
+    for name in dict.fromkeys(result['model'] for result in fold_results):
+        rows = [result for result in fold_results if result['model'] == name]
+        summary[name] = {
+            'MAE': float(np.mean([r['MAE'] for r in rows])),
+            'RMSE': float(np.mean([r['RMSE'] for r in rows])),
+            'R2': float(np.mean([r['R2'] for r in rows])),
+            'MAE_std': float(np.std([r['MAE'] for r in rows])),
+            'folds': len(rows),
+            'fit_seconds': float(np.sum([r['fit_seconds'] for r in rows])),
+        }
+    return summary
+
+
+def save_artifacts(output_dir, best_name, model, summary, feature_names):
+    """Файлы в формате ноутбука: модель, таблица метрик и список признаков"""
+    import joblib
+    import pandas as pd
+
+    os.makedirs(output_dir, exist_ok=True)
+    model_path = os.path.join(output_dir, f'{best_name.lower()}_best_model.pkl')
+    joblib.dump(model, model_path)
+    pd.DataFrame(summary).T.to_csv(os.path.join(output_dir, 'model_metrics.csv'))
+    with open(os.path.join(output_dir, 'feature_names.json'), 'w', encoding='utf-8') as f:
+        json.dump(list(feature_names), f, ensure_ascii=False, indent=2)
+    return model_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Обучение моделей с rolling-origin кросс-валидацией')
+    parser.add_argument('--features', default=os.path.join(config.BASE_DIR, 'df', 'features'),
+                        help='Колоночное хранилище признаков (python tg_bot/features.py ...)')
+    parser.add_argument('--feature-names', default=config.FEATURE_NAMES_PATH)
+    parser.add_argument('--models', nargs='+', default=list(MODEL_SPECS), choices=list(MODEL_SPECS))
+    parser.add_argument('--folds', type=int, default=4)
+    parser.add_argument('--test-size', type=int, default=None, help='Строк в проверочном отрезке фолда')
+    parser.add_argument('--gap', type=int, default=0, help='Строк между обучением и проверкой')
+    parser.add_argument('--cores-per-job', type=int, default=1, help='Потоков у одной задачи обучения')
+    parser.add_argument('--workers', type=int, default=None, help='Процессов (по умолчанию ядра / cores-per-job)')
+    parser.add_argument('--work-dir', default=TRAIN_CACHE_DIR, help='Куда собрать общую матрицу признаков')
+    parser.add_argument('--params', default=None, help='JSON {модель: параметры}, например из tune.py')
+    parser.add_argument('--output', default=os.path.join(config.BASE_DIR, 'models'))
+    parser.add_argument('--no-save', action='store_true', help='Только кросс-валидация')
+    parser.add_argument('--publish', action='store_true', help='Опубликовать лучшую модель в реестре (registry.py)')
+    parser.add_argument('--activate', action='store_true', help='С --publish: сразу сделать версию активной')
+    args = parser.parse_args()
+
+    with open(args.feature_names, 'r', encoding='utf-8') as f:
+        feature_names = json.load(f)
+    params = {}
+    if args.params:
+        with open(args.params, 'r', encoding='utf-8') as f:
+            params = json.load(f)
+    start = time.perf_counter()
+    x_path, y_path = prepare_matrix(args.features, feature_names, args.work_dir)
+    n_rows = len(np.load(y_path, mmap_mode='r'))
+    folds = rolling_origin_folds(n_rows, args.folds, args.test_size, gap=args.gap)
+    workers = args.workers or default_workers(args.cores_per_job)
+    print(f"📦 Матрица {n_rows} × {len(feature_names)}: {time.perf_counter() - start:.1f} с")
+    print(f"🔁 {len(args.models)} моделей × {len(folds)} фолдов, {workers} процессов "
+          f"по {args.cores_per_job} потоков")
+
+    with make_pool(x_path, y_path, workers, args.cores_per_job) as pool:
+        fold_results = cross_validate(pool, args.models, folds, params)
+        summary = summarize_folds(fold_results)
+        best_name = min(summary, key=lambda name: summary[name]['MAE'])
+
+        print(f"\n{'Модель':<15} {'MAE':>8} {'±':>7} {'RMSE':>8} {'R²':>8} {'обучение, с':>12}")
+        for name, row in summary.items():
+            marker = ' ⭐' if name == best_name else ''
+            print(f"{name:<15} {row['MAE']:8.4f} {row['MAE_std']:7.4f} {row['RMSE']:8.4f} "
+                  f"{row['R2']:8.4f} {row['fit_seconds']:12.1f}{marker}")
+
+        if not args.no_save:
+            model = pool.submit(fit_full, best_name, params.get(best_name)).result()
+            model_path = save_artifacts(args.output, best_name, model, summary, feature_names)
+            print(f"\n💾 Лучшая модель ({best_name}) сохранена: {model_path}")
+            if args.publish:
+                from registry import ModelRegistry
+
+                registry = ModelRegistry()
+                version = registry.publish(model_path, os.path.join(args.output, 'feature_names.json'),
+                                           summary[best_name])
+                if args.activate:
+                    registry.activate(version)
+                print(f"📦 Версия в реестре: {version}" + (" (активна)" if args.activate else ""))
+    print(f"⏱️ Всего: {time.perf_counter() - start:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
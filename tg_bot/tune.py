@@ -0,0 +1,309 @@
+# tune.py - ПОДБОР ГИПЕРПАРАМЕТРОВ LIGHTGBM / XGBOOST В ПРЕДЕЛАХ БЮДЖЕТА
+#
+# Successive halving: много случайных конфигураций обучаются с малым числом
+# деревьев, в следующий круг проходит лучшая 1/eta, и число деревьев растет
+# в eta раз. На каждом круге - ранняя остановка по проверочному отрезку,
+# который идет строго после обучающих данных (последний rolling-origin фолд).
+# Задачи идут через тот же пул процессов с общей матрицей, что и train.py.
+# По истечении --budget секунд новые задачи не запускаются, уже начатые
+# дорабатывают, и итог считается по всем оцененным конфигурациям.
+#
+# Каждая оценка дописывается в benchmarks/tuning.jsonl (качество, число
+# деревьев, задержка прогноза 24 часов); уже оцененные конфигурации при
+# повторном запуске берутся из файла, если совпадают данные: матрица
+# признаков (подпись prepare_matrix) и отрезки обучения и проверки. Лучшие параметры - в
+# models/best_params.json (python tg_bot/train.py --params models/best_params.json).
+#   python tg_bot/tune.py --models LightGBM XGBoost --candidates 27 --budget 600
+import argparse
+import hashlib
+import json
+import os
+import time
+import warnings
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime
+
+import numpy as np
+
+import config
+import train
+
+RESULTS_PATH = os.path.join(config.BASE_DIR, 'benchmarks', 'tuning.jsonl')
+BEST_PARAMS_PATH = os.path.join(config.BASE_DIR, 'models', 'best_params.json')
+
+# Пространства поиска: (тип, нижняя, верхняя граница)
+SEARCH_SPACES = {
+    'LightGBM': {
+        'learning_rate': ('log', 0.01, 0.3),
+        'num_leaves': ('int', 15, 255),
+        'max_depth': ('int', 4, 16),
+        'min_child_samples': ('int', 5, 200),
+        'subsample': ('float', 0.5, 1.0),
+        'subsample_freq': ('int', 1, 1),
+        'colsample_bytree': ('float', 0.4, 1.0),
+        'reg_lambda': ('log', 1e-3, 10.0),
+    },
+    'XGBoost': {
+        'learning_rate': ('log', 0.01, 0.3),
+        'max_depth': ('int', 3, 12),
+        'min_child_weight': ('log', 0.5, 50.0),
+        'subsample': ('float', 0.5, 1.0),
+        'colsample_bytree': ('float', 0.4, 1.0),
+        'reg_lambda': ('log', 1e-3, 10.0),
+    },
+}
+
+# Строк в одном запросе бота: прогноз на сутки
+LATENCY_ROWS = 24
+EARLY_STOPPING_ROUNDS = 20
+
+
+def sample_params(space, rng):
+    """Случайная конфигурация из пространства поиска"""
+    params = {}
+    for name, (kind, low, high) in space.items():
+        if kind == 'int':
+            params[name] = int(rng.integers(low, high + 1))
+        elif kind == 'log':
+            params[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+        else:
+            params[name] = float(rng.uniform(low, high))
+    return params
+
+
+def params_key(name, params):
+    """Короткий устойчивый идентификатор конфигурации"""
+    payload = json.dumps([name, params], sort_keys=True)
+    return hashlib.md5(payload.encode()).hexdigest()[:10]
+
+
+def data_key(x_path, train_rows, valid_rows):
+    """Идентификатор данных оценки: подпись матрицы из prepare_matrix (хранилище и
+    список признаков), число строк и отрезки обучения и проверки"""
+    with open(os.path.join(os.path.dirname(x_path), 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    payload = json.dumps([meta['signature'], meta['n_rows'], [train_rows.start, train_rows.stop],
+                          [valid_rows.start, valid_rows.stop]], sort_keys=True)
+    return hashlib.md5(payload.encode()).hexdigest()[:10]
+
+
+def fit_early_stopping(name, params, n_estimators, train_rows, valid_rows):
+    """Обучение с ранней остановкой по проверочному отрезку; возвращает модель и число деревьев"""
+    X, y = train._shared['X'], train._shared['y']
+    X_train, y_train = X[train_rows], y[train_rows]
+    X_valid, y_valid = X[valid_rows], y[valid_rows]
+
+    if name == 'LightGBM':
+        import lightgbm
+
+        model = train.make_model(name, n_jobs=train._shared['cores'], n_estimators=n_estimators, **params)
+        with warnings.catch_warnings():
+            # В новых версиях eval_set переименован в eval_X/eval_y, но старый вариант работает везде
+            warnings.filterwarnings('ignore', message='.*eval_set.*')
+            model.fit(X_train, y_train, eval_set=[(X_valid, y_valid)], eval_metric='l1',
+                      callbacks=[lightgbm.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)])
+        return model, int(model.best_iteration_ or n_estimators)
+
+    model = train.make_model(name, n_jobs=train._shared['cores'], n_estimators=n_estimators,
+                             early_stopping_rounds=EARLY_STOPPING_ROUNDS, eval_metric='mae', **params)
+    model.fit(X_train, y_train, eval_set=[(X_valid, y_valid)], verbose=False)
+    return model, int(model.best_iteration) + 1
+
+
+def predict_latency_us(model, rows, repeat=50):
+    """Медианное время прогноза на rows строк (мкс) - так бот вызывает модель на сутки"""
+    booster = getattr(model, 'booster_', None)
+    predict = booster.predict if booster is not None else model.predict
+    rows = np.ascontiguousarray(rows)
+    predict(rows)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predict(rows)
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples) * 1e6)
+
+
+def evaluate_candidate(name, params, n_estimators, train_rows, valid_rows):
+    """Задача пула: одна конфигурация на одном круге successive halving"""
+    start = time.perf_counter()
+    model, best_iteration = fit_early_stopping(name, params, n_estimators, train_rows, valid_rows)
+    fit_seconds = time.perf_counter() - start
+    X, y = train._shared['X'], train._shared['y']
+    scores = train.regression_metrics(y[valid_rows].astype(np.float64), model.predict(X[valid_rows]))
+    return {'model': name, 'params': params, 'n_estimators': n_estimators,
+            'best_iteration': best_iteration, 'fit_seconds': fit_seconds,
+            'latency_us': predict_latency_us(model, X[valid_rows][:LATENCY_ROWS]), **scores}
+
+
+def load_results(path, data=None):
+    """Уже оцененные конфигурации на тех же данных: {(ключ, число деревьев): запись}"""
+    if not os.path.exists(path):
+        return {}
+    results = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                # Оценки на другой матрице или другом разбиении не переиспользуются
+                if record.get('data') == data:
+                    results[(record['key'], record['n_estimators'])] = record
+    return results
+
+
+def append_result(path, record):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def rung_sizes(min_rounds, max_rounds, eta):
+    """Число деревьев на каждом круге: min_rounds, min_rounds * eta, ... до max_rounds"""
+    sizes = [min_rounds]
+    while sizes[-1] < max_rounds:
+        sizes.append(min(max_rounds, sizes[-1] * eta))
+    return sizes
+
+
+def successive_halving(pool, candidates, rungs, eta, train_rows, valid_rows, deadline,
+                       results_path=RESULTS_PATH, run_id=None, data=None):
+    """Круги successive halving по кандидатам [(модель, параметры)]; возвращает все оценки.
+
+    Оценка, уже записанная в results_path для тех же данных (data_key), повторно
+    не считается. После deadline новые задачи не отправляются, задачи из очереди
+    отменяются, а уже начатые дорабатывают и учитываются; незавершенный круг
+    сокращает отбор до посчитанных кандидатов.
+    """
+    known = load_results(results_path, data)
+    evaluated = []
+    last = {}
+    survivors = list(candidates)
+    for rung, n_estimators in enumerate(rungs):
+        scored = []
+        pending = {}
+        for name, params in survivors:
+            key = params_key(name, params)
+            previous = last.get(key)
+            if (key, n_estimators) in known:
+                scored.append(known[(key, n_estimators)])
+            elif previous is not None and previous['best_iteration'] < previous['n_estimators']:
+                # Ранняя остановка уже сработала: с большим лимитом деревьев результат тот же
+                scored.append({**previous, 'rung': rung, 'n_estimators': n_estimators})
+            elif time.time() < deadline:
+                future = pool.submit(evaluate_candidate, name, params, n_estimators, train_rows, valid_rows)
+                pending[future] = key
+        while pending:
+            done, _ = wait(pending, timeout=max(0.0, deadline - time.time()), return_when=FIRST_COMPLETED)
+            if not done:
+                # Бюджет вышел: очередь отменяется, начатые обучения дожидаются и записываются
+                for future in [future for future in pending if future.cancel()]:
+                    del pending[future]
+                done, _ = wait(pending)
+            for future in done:
+                record = {'time': datetime.now().isoformat(timespec='seconds'), 'run': run_id, 'data': data,
+                          'key': pending.pop(future), 'rung': rung, **future.result()}
+                append_result(results_path, record)
+                scored.append(record)
+        evaluated.extend(scored)
+        last.update((record['key'], record) for record in scored)
+        if not scored or time.time() >= deadline:
+            break
+        # В следующий круг - лучшая 1/eta (но хотя бы одна конфигурация)
+        scored.sort(key=lambda record: record['MAE'])
+        survivors = [(record['model'], record['params']) for record in scored[:max(1, len(scored) // eta)]]
+    return evaluated
+
+
+def pareto_front(records):
+    """Конфигурации, которые нельзя улучшить по MAE без роста задержки"""
+    front = []
+    for record in sorted(records, key=lambda r: (r['latency_us'], r['MAE'])):
+        if not front or record['MAE'] < front[-1]['MAE']:
+            front.append(record)
+    return front
+
+
+def format_report(records, top=15):
+    """Таблица: качество и задержка прогноза на сутки у лучших оценок последнего круга"""
+    final = {}
+    for record in records:
+        previous = final.get(record['key'])
+        if previous is None or record['n_estimators'] > previous['n_estimators']:
+            final[record['key']] = record
+    ranked = sorted(final.values(), key=lambda r: r['MAE'])
+    front = {id(record) for record in pareto_front(ranked)}
+    lines = [f"{'Модель':<10} {'ключ':<11} {'деревьев':>8} {'MAE':>8} {'RMSE':>8} {'24 ч, мкс':>10}  параметры"]
+    for record in ranked[:top]:
+        params = ', '.join(f"{k}={v:.3g}" if isinstance(v, float) else f"{k}={v}"
+                           for k, v in record['params'].items())
+        marker = ' ⭐' if id(record) in front else '  '
+        lines.append(f"{record['model']:<10} {record['key']:<11} {record['best_iteration']:8d} "
+                     f"{record['MAE']:8.4f} {record['RMSE']:8.4f} {record['latency_us']:10.0f}{marker} {params}")
+    lines.append("⭐ - лучший MAE при такой или меньшей задержке")
+    return '\n'.join(lines), ranked
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Подбор гиперпараметров successive halving с бюджетом времени')
+    parser.add_argument('--features', default=os.path.join(config.BASE_DIR, 'df', 'features'))
+    parser.add_argument('--feature-names', default=config.FEATURE_NAMES_PATH)
+    parser.add_argument('--models', nargs='+', default=list(SEARCH_SPACES), choices=list(SEARCH_SPACES))
+    parser.add_argument('--candidates', type=int, default=27, help='Случайных конфигураций на модель')
+    parser.add_argument('--eta', type=int, default=3, help='Во сколько раз сокращается отбор на круге')
+    parser.add_argument('--min-rounds', type=int, default=50, help='Деревьев на первом круге')
+    parser.add_argument('--max-rounds', type=int, default=1350, help='Деревьев на последнем круге')
+    parser.add_argument('--budget', type=float, default=600, help='Бюджет времени, секунд')
+    parser.add_argument('--valid-size', type=int, default=None, help='Строк в проверочном отрезке')
+    parser.add_argument('--cores-per-job', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--work-dir', default=train.TRAIN_CACHE_DIR)
+    parser.add_argument('--results', default=RESULTS_PATH)
+    parser.add_argument('--best-params', default=BEST_PARAMS_PATH)
+    args = parser.parse_args()
+
+    started = time.time()
+    deadline = started + args.budget
+    with open(args.feature_names, 'r', encoding='utf-8') as f:
+        feature_names = json.load(f)
+    x_path, y_path = train.prepare_matrix(args.features, feature_names, args.work_dir)
+    n_rows = len(np.load(y_path, mmap_mode='r'))
+    # Проверка - последний отрезок ряда, обучение - все, что было до него
+    train_rows, valid_rows = train.rolling_origin_folds(n_rows, 1, args.valid_size,
+                                                        min_train=n_rows - (args.valid_size or n_rows // 5))[-1]
+
+    rng = np.random.default_rng(args.seed)
+    candidates = [(name, sample_params(SEARCH_SPACES[name], rng))
+                  for name in args.models for _ in range(args.candidates)]
+    rungs = rung_sizes(args.min_rounds, args.max_rounds, args.eta)
+    workers = args.workers or train.default_workers(args.cores_per_job)
+    run_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+    print(f"🔍 {len(candidates)} конфигураций, круги по деревьям {rungs}, {workers} процессов, "
+          f"бюджет {args.budget:.0f} с")
+
+    with train.make_pool(x_path, y_path, workers, args.cores_per_job) as pool:
+        records = successive_halving(pool, candidates, rungs, args.eta, train_rows, valid_rows,
+                                     deadline, args.results, run_id,
+                                     data_key(x_path, train_rows, valid_rows))
+
+    if not records:
+        print("❌ Бюджета не хватило ни на одну оценку")
+        return
+    report, ranked = format_report(records)
+    print(report)
+
+    # Лучшая конфигурация каждой модели с числом деревьев после ранней остановки
+    best = {}
+    for record in ranked:
+        if record['model'] not in best:
+            best[record['model']] = {**record['params'], 'n_estimators': record['best_iteration']}
+    os.makedirs(os.path.dirname(os.path.abspath(args.best_params)), exist_ok=True)
+    with open(args.best_params, 'w', encoding='utf-8') as f:
+        json.dump(best, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Лучшие параметры: {args.best_params}")
+    print(f"📝 Все оценки: {args.results}")
+    print(f"⏱️ {time.time() - started:.0f} с из {args.budget:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# webhook.py - ПРИЕМ ОБНОВЛЕНИЙ ЧЕРЕЗ WEBHOOK И ОБЩИЙ ПУЛ СОЕДИНЕНИЙ С BOT API
+#
+# Вместо long polling (bot.infinity_polling) Telegram сам присылает
+# обновления POST-запросами на локальный HTTP-сервер (снаружи - reverse
+# proxy с TLS). Сервер проверяет секрет из заголовка, передает обновление
+# обработчикам telebot (они только ставят задачу в очередь чата) и сразу
+# отвечает 200, поэтому Telegram не ждет, пока считается прогноз.
+#
+# Исходящие вызовы (sendPhoto, sendMessage, ...) идут через одну
+# requests.Session с ограниченным пулом keep-alive соединений на все потоки,
+# а не через сессию на поток, которую telebot пересоздает раз в 10 минут.
+#   install_session(pool_size=8)
+#   server = WebhookServer(bot, port=8443, path='/telegram', secret='...').start()
+#   bot.set_webhook('https://example.com/telegram', secret_token='...')
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+# Обновление Telegram - единицы КБ; больше - не от Telegram
+MAX_BODY_BYTES = 1 << 20
+
+
+def make_session(pool_size):
+    """requests.Session с пулом до pool_size keep-alive соединений на хост"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    # pool_block: потоков больше, чем соединений - поток ждет свободное, лишние не открываются
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def install_session(pool_size):
+    """Все вызовы telebot из всех потоков - через одну сессию с пулом соединений"""
+    from telebot import apihelper
+
+    session = make_session(pool_size)
+    # Свою сессию telebot запоминает в каждом потоке при первом вызове, поэтому
+    # подменяется сама отправка запроса: сигнатура совпадает с Session.request
+    apihelper.CUSTOM_REQUEST_SENDER = session.request
+    return session
+
+
+class WebhookServer:
+    """HTTP-сервер для webhook Telegram: POST path с JSON обновления -> bot.process_new_updates"""
+
+    def __init__(self, bot, host='127.0.0.1', port=8443, path='/', secret=None):
+        self.bot = bot
+        self.path = path or '/'
+        self.secret = secret
+        self.received = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self.path}"
+
+    def _count(self, accepted):
+        with self._lock:
+            if accepted:
+                self.received += 1
+            else:
+                self.rejected += 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Telegram держит соединения открытыми и шлет по ним следующие обновления
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                # Длина тела проверяется до всего остального: без нее нельзя ни читать тело, ни пропустить его
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    return self._reject(400)
+                if length > MAX_BODY_BYTES:
+                    return self._reject(413)
+                if self.path != server.path:
+                    return self._reject(404)
+                if server.secret and self.headers.get(SECRET_HEADER) != server.secret:
+                    return self._reject(403)
+                try:
+                    update = json.loads(self.rfile.read(length))
+                except ValueError:
+                    return self._finish(400)
+                # Обновление Telegram - JSON-объект; список, число или строка - не обновление
+                if not isinstance(update, dict):
+                    return self._finish(400)
+                self._finish(200)
+                server.handle(update)
+
+            def do_GET(self):
+                self._finish(200 if self.path == '/health' else 404)
+
+            def _reject(self, status):
+                """Ответ без чтения тела: непрочитанное тело нельзя оставить в соединении - оно закрывается"""
+                self._finish(status, close=True)
+
+            def _finish(self, status, close=False):
+                if status != 200:
+                    server._count(False)
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                if close:
+                    # Заодно выставляет close_connection
+                    self.send_header('Connection', 'close')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def handle(self, update):
+        """Передает обновление обработчикам бота (в потоке соединения)"""
+        from telebot.types import Update
+
+        self._count(True)
+        try:
+            self.bot.process_new_updates([Update.de_json(update)])
+        except Exception as e:
+            update_id = update.get('update_id') if isinstance(update, dict) else None
+            print(f"❌ Ошибка обработки обновления {update_id}: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='webhook', daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()